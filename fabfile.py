@@ -10,6 +10,13 @@ def test(verbosity="1", case=""):
     local(f"pytest {case}")
 
 
+def benchmark(sizes="small", save=""):
+    local(
+        f"pytest sp_app/benchmarks --bench-sizes={sizes}"
+        + (" --bench-save" if save else "")
+    )
+
+
 def makemigrations():
     local(
         "python ./manage.py makemigrations sp_app "
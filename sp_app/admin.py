@@ -17,6 +17,7 @@ from .models import (
     CalculatedHoliday,
     Region,
     DifferentDay,
+    WardsFeed,
 )
 from .forms import WardAdminForm
 
@@ -220,3 +221,11 @@ class CalculatedHolidayAdmin(admin.ModelAdmin):
 @admin.register(Region)
 class RegionAdmin(admin.ModelAdmin):
     filter_horizontal = ("calc_holidays",)
+
+
+@admin.register(WardsFeed)
+class WardsFeedAdmin(admin.ModelAdmin):
+    list_display = ("name", "company", "department", "active")
+    list_filter = ("company",)
+    filter_horizontal = ("wards",)
+    readonly_fields = ("uid",)
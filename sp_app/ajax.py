@@ -6,14 +6,30 @@ from django.core.exceptions import PermissionDenied
 from django.core.mail import send_mail
 from django.db.models import Q
 from django.http import JsonResponse, HttpResponse
-from django.shortcuts import get_object_or_404, render
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.utils.cache import (
+    add_never_cache_headers,
+    get_conditional_response,
+    patch_cache_control,
+)
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition, require_POST
 from django.views.generic import TemplateView
 
 import json
 
-from .logic import apply_changes, set_approved, get_last_change_response
+from .caching import bump_master_data_version
+from .logic import (
+    apply_change_batch,
+    apply_changes,
+    set_approved,
+    get_cached_last_change_pk,
+    get_last_change_response,
+    get_plannings_chunk,
+    get_master_data,
+)
 from .models import (
     ChangeLogging,
     Company,
@@ -25,7 +41,13 @@ from .models import (
     Ward,
     FeedId,
 )
-from .utils import post_with_company
+from .utils import (
+    get_first_of_month,
+    post_with_company,
+    query_budget,
+    session_etag,
+)
+from .views import setup_etag, setup_last_modified
 from sp_app import forms
 
 
@@ -43,6 +65,7 @@ def ajax_login_required(function=None):
     return _wrapped_view
 
 
+@query_budget(17)
 @ajax_login_required
 @require_POST
 @permission_required("sp_app.is_editor", raise_exception=True)
@@ -76,9 +99,40 @@ def changes(request):
         data["continued"],
         data["persons"],
     )
-    return get_last_change_response(company_id, int(data["last_pk"]))
+    return get_last_change_response(
+        company_id, int(data["last_pk"]), is_editor=True
+    )
+
+
+@query_budget(25)
+@ajax_login_required
+@require_POST
+@permission_required("sp_app.is_editor", raise_exception=True)
+def change_batch(request):
+    """Several changes for different days and wards in one transaction
+    The data come in this form:
+    {'changes': [{
+           'day': <YYYYMMDD>,
+           'ward_id': <ward.id>,
+           'continued': True|False|<YYYYMMDD>,
+           'persons': [...],
+         },
+         ...
+     ],
+     'last_pk': <ChangeLogging.pk>}
+
+    Returned are the new changes since 'last_pk',
+    including the just transmitted changes, if they succeeded.
+    """
+    data = json.loads(request.body)
+    company_id = request.session["company_id"]
+    apply_change_batch(request.user, company_id, data["changes"])
+    return get_last_change_response(
+        company_id, int(data["last_pk"]), is_editor=True
+    )
 
 
+@query_budget(8)
 @ajax_login_required
 @require_POST
 @permission_required("sp_app.is_editor", raise_exception=True)
@@ -106,13 +160,101 @@ def change_approved(request):
     return JsonResponse(res, safe=False)
 
 
+def updates_etag(request, last_change=0):
+    last_change_pk = get_cached_last_change_pk(request.session["company_id"])
+    if last_change_pk is None:
+        return None
+    return session_etag(request, "updates", last_change_pk)
+
+
+@query_budget(4)
 @ajax_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=updates_etag)
 def updates(request, last_change=0):
     return get_last_change_response(
-        request.session["company_id"], int(last_change)
+        request.session["company_id"],
+        int(last_change),
+        is_editor=request.session.get("is_editor", False),
+    )
+
+
+# Responses with a versioned url may be cached by the browser for a year
+VERSIONED_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def _plannings_chunk_for_request(request, month):
+    return get_plannings_chunk(
+        request.session["company_id"],
+        request.session["department_ids"],
+        month,
+        is_editor=request.session.get("is_editor", False),
+    )
+
+
+@query_budget(4)
+@ajax_login_required
+def plannings(request, month):
+    """Redirect to the current version of the plannings of this month"""
+    _, version = _plannings_chunk_for_request(request, month)
+    response = redirect("plannings-chunk", month=month, version=version)
+    add_never_cache_headers(response)
+    return response
+
+
+@query_budget(3)
+@ajax_login_required
+def plannings_chunk(request, month, version):
+    """Return the plannings that start in this month.
+
+    month: "YYYYMM"
+    The url contains the version of the content, so the response never
+    changes and can be cached forever.
+    Outdated versions are redirected to the current one.
+    """
+    data, current_version = _plannings_chunk_for_request(request, month)
+    if version != current_version:
+        return plannings(request, month)
+    response = HttpResponse(data, content_type="application/json")
+    patch_cache_control(
+        response, private=True, max_age=VERSIONED_MAX_AGE, immutable=True
+    )
+    return response
+
+
+@query_budget(3)
+@ajax_login_required
+def master_data(request, month, version):
+    """Return persons, wards, holidays and departments.
+
+    month: "YYYYMM", the first month of the plan data
+    The url contains the version of the content, so the response never
+    changes and can be cached forever.
+    Outdated versions are redirected to the current one.
+    """
+    data, current_version = get_master_data(
+        request.session["company_id"],
+        request.session["department_ids"],
+        get_first_of_month(month),
+    )
+    if version != current_version:
+        response = redirect(
+            "master-data", month=month, version=current_version
+        )
+        add_never_cache_headers(response)
+        return response
+    etag = quote_etag(current_version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(data, content_type="application/json")
+    response["ETag"] = etag
+    patch_cache_control(
+        response, private=True, max_age=VERSIONED_MAX_AGE, immutable=True
     )
+    return response
 
 
+@query_budget(9)
 @ajax_login_required
 @require_POST
 @permission_required("sp_app.is_dep_lead", raise_exception=True)
@@ -147,6 +289,7 @@ def change_function(request):
     return JsonResponse(res, safe=False)
 
 
+@query_budget(4)
 @ajax_login_required
 def get_change_history(request, date, ward_id):
     """Get all changes to a staffing on one day and ward
@@ -170,6 +313,8 @@ def _get_change_history(company_id, date, ward_id):
             | Q(continued=True, day__lte=day, until__isnull=True),
             company__id=company_id,
             ward__id=int(ward_id),
+            # lets the database search the index on ward and day
+            day__lte=day,
         )
         .select_related("user", "person", "ward")
         .order_by("-change_time")
@@ -177,6 +322,7 @@ def _get_change_history(company_id, date, ward_id):
     return [c.get_json_for_history() for c in cls]
 
 
+@query_budget(9)
 @ajax_login_required
 @require_POST
 @permission_required("sp_app.is_dep_lead", raise_exception=True)
@@ -239,7 +385,10 @@ def wards_for_request(request):
     )
 
 
+@query_budget(5)
 @ajax_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=setup_etag, last_modified_func=setup_last_modified)
 def setup_departments(request):
     company = (
         Company.objects.select_related("region")
@@ -253,7 +402,10 @@ def setup_departments(request):
     )
 
 
+@query_budget(4)
 @ajax_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=setup_etag, last_modified_func=setup_last_modified)
 def setup_employees(request):
     employees = Employee.objects.select_related("user").filter(
         company__id=request.session["company_id"]
@@ -267,7 +419,10 @@ def setup_employees(request):
     )
 
 
+@query_budget(4)
 @ajax_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=setup_etag, last_modified_func=setup_last_modified)
 def setup_persons(request):
     persons = persons_for_request(request)
     return render(
@@ -282,7 +437,10 @@ def setup_persons(request):
     )
 
 
+@query_budget(4)
 @ajax_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=setup_etag, last_modified_func=setup_last_modified)
 def setup_wards(request):
     wards = wards_for_request(request)
     return render(
@@ -296,7 +454,10 @@ def setup_wards(request):
     )
 
 
+@query_budget(6)
 @ajax_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=setup_etag, last_modified_func=setup_last_modified)
 def setup_zuordnung(request):
     persons = persons_for_request(request).prefetch_related("functions")
     wards = wards_for_request(request).filter(active=True)
@@ -312,6 +473,7 @@ def setup_zuordnung(request):
     )
 
 
+@query_budget(10)
 @ajax_login_required
 @permission_required("sp_app.is_company_admin", raise_exception=True)
 def edit_department(request, department_id=None):
@@ -344,6 +506,7 @@ def edit_department(request, department_id=None):
     )
 
 
+@query_budget(9)
 @ajax_login_required
 @permission_required("sp_app.is_dep_lead", raise_exception=True)
 def edit_employee(request, employee_id=None):
@@ -399,6 +562,7 @@ def edit_employee(request, employee_id=None):
     )
 
 
+@query_budget(7)
 @ajax_login_required
 @permission_required("sp_app.is_company_admin", raise_exception=True)
 def delete_employee(request, employee_id):
@@ -414,6 +578,7 @@ def delete_employee(request, employee_id):
     if not error:
         employee.user.is_active = False
         employee.user.save()
+        bump_master_data_version(employee.company_id)
         message = f"{employee.get_name()} kann sich nicht mehr als Bearbeiter/in anmelden"
 
     return render(
@@ -423,6 +588,7 @@ def delete_employee(request, employee_id):
     )
 
 
+@query_budget(8)
 @ajax_login_required
 @permission_required("sp_app.is_dep_lead", raise_exception=True)
 def edit_person(request, pk=None):
@@ -455,6 +621,7 @@ def edit_person(request, pk=None):
     )
 
 
+@query_budget(12)
 @ajax_login_required
 @permission_required("sp_app.is_dep_lead", raise_exception=True)
 def edit_ward(request, pk=None):
@@ -487,6 +654,7 @@ def edit_ward(request, pk=None):
     )
 
 
+@query_budget(8)
 @ajax_login_required
 @require_POST
 @permission_required("sp_app.is_dep_lead", raise_exception=True)
@@ -531,6 +699,7 @@ Mit freundlichen Grüßen, Stationsplan.de
 """
 
 
+@query_budget(7)
 @ajax_login_required
 @permission_required("sp_app.is_dep_lead")
 def send_ical_feed(request, pk):
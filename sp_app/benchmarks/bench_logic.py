@@ -0,0 +1,138 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from sp_app.ajax import _get_change_history
+from sp_app.ical_views import DienstFeed
+from sp_app.logic import apply_changes, get_last_change_response, get_plan_data
+from sp_app.benchmarks.conftest import START
+from sp_app.models import ChangeLogging, Employee, FeedId, Person, FAR_FUTURE
+
+
+def department_ids(hospital):
+    return list(hospital.departments.values_list("id", flat=True))
+
+
+def editor(hospital):
+    return Employee.objects.get(user__username=f"{hospital.shortname}-edit")
+
+
+def assistant(hospital):
+    """An assistant who stays for the whole period"""
+    return (
+        Person.objects.filter(
+            company=hospital,
+            position=Person.POSITION_ASSISTENTEN,
+            start_date=START,
+            end_date=FAR_FUTURE,
+        )
+        .order_by("id")
+        .first()
+    )
+
+
+@pytest.mark.parametrize("warm", [False, True], ids=["cold", "warm"])
+def test_get_plan_data(benchmark, hospital, warm):
+    ids = department_ids(hospital)
+
+    def plan_data():
+        return get_plan_data(hospital.id, ids, month="202206", is_editor=True)
+
+    def setup(i):
+        if warm:
+            plan_data()
+        else:
+            cache.clear()
+        return ()
+
+    benchmark(plan_data, setup)
+
+
+# action, continued
+BRANCHES = {
+    "add-day": ("add", False),
+    "add-continued": ("add", True),
+    "add-until": ("add", "until"),
+    "remove-day": ("remove", False),
+    "remove-continued": ("remove", True),
+    "remove-until": ("remove", "until"),
+}
+
+
+@pytest.mark.parametrize("branch", list(BRANCHES))
+def test_apply_changes(benchmark, hospital, branch):
+    action, continued = BRANCHES[branch]
+    user = editor(hospital).user
+    person = assistant(hospital)
+    ward = hospital.wards.filter(shortname__endswith="-S1").first()
+
+    def change(day, action, continued):
+        if continued == "until":
+            continued = (day + timedelta(days=10)).strftime("%Y%m%d")
+        return (
+            user,
+            hospital.id,
+            day.strftime("%Y%m%d"),
+            ward.id,
+            continued,
+            [{"id": person.id, "action": action}],
+        )
+
+    def setup(i):
+        # Every round on another day of a planned period
+        day = date(2022, 3, 1) + timedelta(days=14 * i)
+        if action == "remove":
+            apply_changes(*change(day, "add", "until"))
+        return change(day, action, continued)
+
+    benchmark(apply_changes, setup)
+
+
+@pytest.mark.parametrize("warm", [False, True], ids=["cold", "warm"])
+def test_get_last_change_response(benchmark, hospital, warm):
+    pks = list(
+        ChangeLogging.objects.filter(company=hospital)
+        .order_by("-pk")
+        .values_list("pk", flat=True)[:20]
+    )
+
+    def setup(i):
+        cache.clear()
+        if warm:
+            # Fills the buffer of recent changes
+            get_last_change_response(hospital.id, pks[-1])
+        return (hospital.id, pks[-1])
+
+    benchmark(get_last_change_response, setup)
+
+
+def test_get_change_history(benchmark, hospital):
+    ward = hospital.wards.filter(shortname__endswith="-N").first()
+    benchmark(lambda: _get_change_history(hospital.id, "20220615", ward.id))
+
+
+@pytest.mark.parametrize("warm", [False, True], ids=["cold", "warm"])
+def test_dienst_feed(benchmark, hospital, warm):
+    feed_id = FeedId.new(assistant(hospital)).uid
+    feed = DienstFeed()
+    request = RequestFactory().get(f"/feed/{feed_id}")
+
+    def setup(i):
+        if not warm:
+            cache.clear()
+        return ()
+
+    with patch(
+        "sp_app.ical_views.get_first_of_month", lambda: date(2022, 6, 1)
+    ):
+        feed(request, feed_id)
+        benchmark(lambda: feed(request, feed_id), setup)
+
+
+def test_set_level(benchmark, hospital):
+    employee = editor(hospital)
+    levels = ["is_company_admin", "is_dep_lead", "is_editor", None]
+    benchmark(employee.set_level, lambda i: (levels[i % len(levels)],))
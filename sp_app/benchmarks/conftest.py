@@ -0,0 +1,167 @@
+"""Micro-benchmarks of the hot paths
+
+The benchmarks are only collected, if this directory is given
+on the command line:
+
+    pytest sp_app/benchmarks [--bench-sizes=small,medium] [--bench-save]
+
+They run against hospitals of several sizes made by generate_hospital
+and report the median of their rounds compared to the baselines
+in baselines.json. --bench-save stores the results as the new baselines.
+The times depend on the machine, so compare only baselines
+of the same machine.
+"""
+
+import json
+import statistics
+import time
+from datetime import date
+from pathlib import Path
+
+import pytest
+from django.core.cache import cache
+
+from sp_app.hospital_data import generate_hospital
+
+HERE = Path(__file__).parent
+BASELINES = HERE / "baselines.json"
+START = date(2022, 1, 1)
+# departments, persons per department, years
+SIZES = {
+    "small": (1, 15, 1),
+    "medium": (4, 60, 2),
+    "large": (8, 100, 3),
+}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption(
+        "--bench-sizes",
+        default="small",
+        help=f"comma separated sizes of the data, of {', '.join(SIZES)}",
+    )
+    group.addoption("--bench-rounds", type=int, default=20)
+    group.addoption(
+        "--bench-save",
+        action="store_true",
+        help="store the results as baselines",
+    )
+    group.addoption(
+        "--bench-threshold",
+        type=float,
+        default=1.3,
+        help="report results slower than the baseline by this factor",
+    )
+
+
+def _requested(config):
+    for arg in config.args:
+        path = Path(arg.split("::")[0]).resolve()
+        if path == HERE or HERE in path.parents:
+            return True
+    return False
+
+
+def pytest_collect_file(file_path, parent):
+    if (
+        file_path.name.startswith("bench_")
+        and file_path.suffix == ".py"
+        and _requested(parent.config)
+    ):
+        return pytest.Module.from_parent(parent, path=file_path)
+
+
+def pytest_configure(config):
+    config.bench_results = {}
+
+
+def pytest_generate_tests(metafunc):
+    if "hospital" in metafunc.fixturenames:
+        sizes = metafunc.config.getoption("bench_sizes").split(",")
+        for size in sizes:
+            if size not in SIZES:
+                raise pytest.UsageError(f"Unknown size {size}")
+        metafunc.parametrize("hospital", sizes, indirect=True, scope="session")
+
+
+@pytest.fixture(scope="session")
+def hospital(request, django_db_setup, django_db_blocker):
+    """The company of a generated hospital of the size request.param"""
+    departments, persons, years = SIZES[request.param]
+    with django_db_blocker.unblock():
+        return generate_hospital(
+            f"Benchmark {request.param}",
+            f"b-{request.param}",
+            START,
+            years=years,
+            departments=departments,
+            persons=persons,
+        )
+
+
+class Benchmark:
+    """Times the rounds of a function
+
+    'setup' is called untimed before each round with the number
+    of the round and returns the arguments of the function.
+    """
+
+    def __init__(self, name, rounds):
+        self.name = name
+        self.rounds = rounds
+        self.times = []
+
+    def __call__(self, func, setup=None):
+        for i in range(self.rounds):
+            args = setup(i) if setup else ()
+            start = time.perf_counter()
+            func(*args)
+            self.times.append(time.perf_counter() - start)
+
+
+@pytest.fixture
+def benchmark(request, db):
+    cache.clear()
+    bench = Benchmark(
+        f"{request.node.path.stem}::{request.node.name}",
+        request.config.getoption("bench_rounds"),
+    )
+    yield bench
+    if bench.times:
+        request.config.bench_results[bench.name] = {
+            "median": statistics.median(bench.times),
+            "min": min(bench.times),
+        }
+
+
+def _load_baselines():
+    if BASELINES.exists():
+        return json.loads(BASELINES.read_text())
+    return {}
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = getattr(config, "bench_results", {})
+    if not results:
+        return
+    baselines = _load_baselines()
+    threshold = config.getoption("bench_threshold")
+    write = terminalreporter.write_line
+    terminalreporter.section("benchmarks")
+    write(f"{'':60} {'median':>10} {'baseline':>10} {'ratio':>7}")
+    for name, result in sorted(results.items()):
+        line = f"{name:60} {result['median'] * 1000:8.2f}ms"
+        baseline = baselines.get(name)
+        if baseline:
+            ratio = result["median"] / baseline["median"]
+            line += f" {baseline['median'] * 1000:8.2f}ms {ratio:7.2f}"
+            if ratio > threshold:
+                line += "  SLOWER"
+        write(line)
+    if config.getoption("bench_save"):
+        baselines.update(results)
+        BASELINES.write_text(
+            json.dumps(baselines, indent=2, sort_keys=True) + "\n"
+        )
+        write(f"Baselines saved in {BASELINES}")
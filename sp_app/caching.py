@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Versions of the cached data of a company
+
+Cached data are stored under keys that contain the current version
+of the company's data. Every write that changes the data bumps the version
+(see signals.py), so outdated entries are never found again
+and expire on their own.
+
+There are two versions per company:
+- the data version changes with every change of the plan,
+- the master data version only with changes of persons, wards,
+  departments, employees and holidays.
+The dates of the holidays of all regions have a version of their own.
+
+The rendered iCal feed of a person depends on the version of the person's
+plannings and on the version of the iCal relevant fields of the wards
+of the company. The feed of a WardsFeed has a version of its own
+for the changes of the WardsFeed and its wards.
+
+The time of the last bump is kept as well and serves as Last-Modified
+for conditional requests.
+
+A bump inside a transaction is repeated after the commit: until then,
+concurrent requests still read the old rows and may cache them
+under the new version.
+"""
+
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Start with a version that has not been used before,
+        # even if the old version was evicted from the cache
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump_version(key):
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _set_new_version(key))
+    return _set_new_version(key)
+
+
+def _set_new_version(key):
+    cache.set(f"{key}-modified", timezone.now(), None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The version was not set or has been evicted
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
+
+
+def get_data_version(company_id):
+    """Return the current version of the data of this company"""
+    return _get_version(f"data_version-{company_id}")
+
+
+def bump_data_version(company_id):
+    """Invalidate all cached data of this company"""
+    return _bump_version(f"data_version-{company_id}")
+
+
+def get_data_last_modified(company_id):
+    """Return the time of the last change of the data of this company
+
+    Returns None if it is not known
+    """
+    return cache.get(f"data_version-{company_id}-modified")
+
+
+def get_master_data_version(company_id):
+    """Return the current version of the master data of this company"""
+    return _get_version(f"master_data_version-{company_id}")
+
+
+def bump_master_data_version(company_id):
+    """Invalidate the cached master data of this company
+
+    The master data are part of the data, so all cached data are invalidated.
+    """
+    bump_data_version(company_id)
+    return _bump_version(f"master_data_version-{company_id}")
+
+
+def get_master_data_last_modified(company_id):
+    """Return the time of the last change of the master data of this company
+
+    Returns None if it is not known
+    """
+    return cache.get(f"master_data_version-{company_id}-modified")
+
+
+def get_holidays_version():
+    """Return the current version of the holidays of all regions"""
+    return _get_version("holidays_version")
+
+
+def bump_holidays_version():
+    """Invalidate the cached dates of the holidays"""
+    return _bump_version("holidays_version")
+
+
+def get_ical_version(person_id):
+    """Return the current version of the plannings of this person"""
+    return _get_version(f"ical_version-{person_id}")
+
+
+def bump_ical_version(person_id):
+    """Invalidate the cached iCal feed of this person"""
+    return _bump_version(f"ical_version-{person_id}")
+
+
+def get_ical_wards_version(company_id):
+    """Return the current version of the name, approval and in_ical_feed
+    of the wards of this company
+    """
+    return _get_version(f"ical_wards_version-{company_id}")
+
+
+def bump_ical_wards_version(company_id):
+    """Invalidate the cached iCal feeds of all persons of this company"""
+    return _bump_version(f"ical_wards_version-{company_id}")
+
+
+def get_wards_feed_version(wards_feed_id):
+    """Return the current version of this WardsFeed and its wards"""
+    return _get_version(f"wards_feed_version-{wards_feed_id}")
+
+
+def bump_wards_feed_version(wards_feed_id):
+    """Invalidate the cached iCal feed of this WardsFeed"""
+    return _bump_version(f"wards_feed_version-{wards_feed_id}")
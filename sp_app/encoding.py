@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Encoding of JSON responses
+
+ChangeLoggings and Plannings store their own json. These fragments are
+spliced into the responses as they are, instead of decoding and encoding
+them again. Everything else is encoded with the function named in
+settings.JSON_DUMPS, or with orjson if it is installed,
+else with the json module.
+
+With settings.COMPACT_PLAN_DATA the plannings and the functions
+of the persons are sent in a compact form, which is decoded by the client
+(see models.decode_plannings and models.decode_functions in models.js).
+"""
+
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+
+class Raw(str):
+    """A string that is already JSON"""
+
+
+class RawList(list):
+    """A list of strings that are already JSON"""
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+@lru_cache(maxsize=None)
+def get_dumps():
+    """Return the function that encodes objects to JSON as bytes"""
+    path = getattr(settings, "JSON_DUMPS", "")
+    if path:
+        return import_string(path)
+    try:
+        import orjson
+    except ImportError:
+        return _json_dumps
+
+    def orjson_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    return orjson_dumps
+
+
+def encode(data):
+    """Return the JSON of data as bytes.
+
+    The values of a dict may be Raw or RawList, which are not encoded again.
+    """
+    dumps = get_dumps()
+    if isinstance(data, Raw):
+        return data.encode()
+    if isinstance(data, RawList):
+        return b"[" + ",".join(data).encode() + b"]"
+    if not isinstance(data, dict):
+        return dumps(data)
+    return (
+        b"{"
+        + b",".join(
+            dumps(str(key)) + b":" + encode(value)
+            for key, value in data.items()
+        )
+        + b"}"
+    )
+
+
+def compact_plannings(plannings, base):
+    """Return the plannings as parallel arrays.
+
+    'start' and 'end' are the days after 'base' ('YYYYMMDD' in the result).
+    """
+    plannings = list(plannings)
+    return {
+        "base": base.strftime("%Y%m%d"),
+        "person": [p.person_id for p in plannings],
+        "ward": [p.ward_id for p in plannings],
+        "start": [(p.start - base).days for p in plannings],
+        "end": [(p.end - base).days for p in plannings],
+    }
+
+
+def compact_functions(persons, wards):
+    """Replace the functions of the persons by a bitmask as hex string
+
+    Bit i is set, if the person can work on wards[i].
+    'persons' and 'wards' are lists of dicts as of toJson.
+    """
+    bits = {ward["shortname"]: 1 << i for i, ward in enumerate(wards)}
+    for person in persons:
+        functions = person["functions"]
+        mask = sum(bits.get(shortname, 0) for shortname in functions)
+        person["functions"] = format(mask, "x")
+    return persons
+
+
+def json_response(data, **kwargs):
+    """Like JsonResponse, but with encode"""
+    kwargs.setdefault("content_type", "application/json")
+    return HttpResponse(encode(data), **kwargs)
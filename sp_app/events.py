@@ -0,0 +1,181 @@
+"""Server-Sent Events stream of the changes of a company
+
+The stream is an ASGI application that is mounted in stationsplan/asgi.py
+at settings.CHANGE_STREAM_URL.
+It pushes the same data as the 'updates' view, as soon as a change
+has been applied. Between changes only the cached pk of the last change
+is looked up, so an open stream does not hit the database.
+
+The lookup in the cache runs in the thread pool of the event loop
+(thread_sensitive=False), so the open streams do not queue up on
+the one thread that runs the synchronous views. Only the rare queries
+of the database run in that thread, like the ORM expects.
+
+The pk of the last sent change is sent as the id of the event, so clients
+that reconnect resume with the 'Last-Event-ID' header. On the first
+connection, the cursor is taken from the query string ('?last_change=<pk>').
+"""
+
+import asyncio
+import json
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.http.cookie import parse_cookie
+
+from .logic import get_cached_last_change_pk, get_last_change_response
+
+# Seconds between two lookups of the last change in the cache
+CHECK_INTERVAL = 1
+# Seconds after which a comment is sent to keep the connection open
+KEEPALIVE_INTERVAL = 30
+# Seconds after which the stream is closed, so that the client reconnects
+# and its session is checked again
+MAX_DURATION = 30 * 60
+# Milliseconds the client waits before it reconnects
+RETRY = 10000
+
+
+def _get_header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin1")
+    return ""
+
+
+def _get_session(session_key):
+    """Return the session data of a logged in user, else None"""
+    try:
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore(session_key)
+        user = get_user(SimpleNamespace(session=session))
+        if not user.is_authenticated:
+            return None
+        return dict(session)
+    finally:
+        close_old_connections()
+
+
+def _get_cursor(scope):
+    cursor = _get_header(scope, b"last-event-id")
+    if not cursor:
+        query = parse_qs(scope.get("query_string", b"").decode("latin1"))
+        cursor = query.get("last_change", ["0"])[0]
+    try:
+        return int(cursor)
+    except ValueError:
+        return 0
+
+
+def _fetch_changes(company_id, cursor, is_editor):
+    """Return the pk of the last change, the json of the changes
+    since cursor and if there are more changes, or None if nothing changed
+    """
+    try:
+        response = get_last_change_response(company_id, cursor, is_editor)
+    finally:
+        close_old_connections()
+    if response.status_code != 200:
+        return None
+    data = json.loads(response.content)
+    return data["last_change"]["pk"], response.content, data["more"]
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def change_stream(scope, receive, send):
+    """ASGI application that sends the changes of the user's company"""
+    session_key = parse_cookie(_get_header(scope, b"cookie")).get(
+        settings.SESSION_COOKIE_NAME
+    )
+    session = None
+    if session_key:
+        session = await sync_to_async(_get_session)(session_key)
+    if session is None or session.get("company_id") is None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 403,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"Forbidden"})
+        return
+
+    company_id = session["company_id"]
+    is_editor = session.get("is_editor", False)
+    cursor = _get_cursor(scope)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    await send(
+        {
+            "type": "http.response.body",
+            "body": f"retry: {RETRY}\n\n".encode(),
+            "more_body": True,
+        }
+    )
+    loop = asyncio.get_running_loop()
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        # Check the database once on connecting, afterwards only
+        # if the cached pk of the last change has changed
+        # or not all changes have been sent
+        known_pk = object()
+        last_sent = started = loop.time()
+        while loop.time() - started < MAX_DURATION:
+            cached_pk = await sync_to_async(
+                get_cached_last_change_pk, thread_sensitive=False
+            )(company_id)
+            if cached_pk != known_pk:
+                known_pk = cached_pk
+                changes = await sync_to_async(_fetch_changes)(
+                    company_id, cursor, is_editor
+                )
+                if changes is not None:
+                    cursor, content, more = changes
+                    if more:
+                        # Fetch the next changes in the next round
+                        known_pk = object()
+                    body = f"id: {cursor}\ndata: ".encode() + content + b"\n\n"
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": body,
+                            "more_body": True,
+                        }
+                    )
+                    last_sent = loop.time()
+            if loop.time() - last_sent >= KEEPALIVE_INTERVAL:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": b":\n\n",
+                        "more_body": True,
+                    }
+                )
+                last_sent = loop.time()
+            await asyncio.wait([disconnected], timeout=CHECK_INTERVAL)
+            if disconnected.done():
+                return
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
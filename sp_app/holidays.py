@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Dates of the legal holidays
+
+The holidays of a region are CalculatedHolidays, either on a fixed date
+or relative to Easter. Their dates are computed per region and year
+and cached with the holidays version (see caching.py).
+"""
+
+from datetime import date, timedelta
+
+from django.core.cache import cache
+
+from .caching import get_holidays_version
+from .models import CalculatedHoliday, Company
+
+HOLIDAYS_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def easter(year):
+    """Return the date of Easter Sunday in the Gregorian calendar"""
+    # Anonymous Gregorian algorithm (Meeus/Jones/Butcher)
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    ll = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * ll) // 451
+    month, day = divmod(h + ll - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def holiday_date(holiday, year):
+    """Return the date of the CalculatedHoliday in this year,
+    or None if there is none
+    """
+    if holiday.mode == "rel":
+        return easter(year) + timedelta(holiday.day)
+    if holiday.year and holiday.year != year:
+        return None
+    try:
+        return date(year, holiday.month, holiday.day)
+    except (TypeError, ValueError):
+        return None
+
+
+def calc_holidays(holidays, year):
+    """Return the dates of the CalculatedHolidays in this year
+    as dict {date: name}
+    """
+    dates = {}
+    for holiday in holidays:
+        day = holiday_date(holiday, year)
+        if day is not None:
+            dates[day] = holiday.name
+    return dates
+
+
+def get_region_holidays(region_id, year):
+    """Return the holidays of the region in this year as dict {date: name}"""
+    key = f"holidays-{region_id}-{year}-{get_holidays_version()}"
+    holidays = cache.get(key)
+    if holidays is None:
+        holidays = calc_holidays(
+            CalculatedHoliday.objects.filter(regions__id=region_id), year
+        )
+        cache.set(key, holidays, HOLIDAYS_TIMEOUT)
+    return holidays
+
+
+def get_company_holidays(company_id, start, end):
+    """Return the holidays of the company's region from start to end
+    (inclusive) as dict {date: name}, ordered by date
+    """
+    region_id = (
+        Company.objects.filter(id=company_id)
+        .values_list("region_id", flat=True)
+        .first()
+    )
+    if region_id is None:
+        return {}
+    holidays = {}
+    for year in range(start.year, end.year + 1):
+        holidays.update(get_region_holidays(region_id, year))
+    return {
+        day: name
+        for day, name in sorted(holidays.items())
+        if start <= day <= end
+    }
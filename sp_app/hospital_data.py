@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""Synthetic data of hospitals for measurements
+
+generate_hospital creates a company with departments, persons, wards
+with the usual rules and years of plannings. The plannings are produced
+by ChangeLoggings through process_change, like the changes of the users.
+The data only depends on the seed and the arguments.
+"""
+
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .holidays import calc_holidays
+from .models import (
+    CalculatedHoliday,
+    ChangeLogging,
+    Company,
+    Department,
+    Employee,
+    Person,
+    Region,
+    Ward,
+    process_change,
+)
+from .utils import add_months
+
+ONE_DAY = timedelta(days=1)
+
+DEPARTMENTS = [
+    ("Innere Medizin", "Inn"),
+    ("Chirurgie", "Chi"),
+    ("Anästhesie", "Anä"),
+    ("Neurologie", "Neu"),
+    ("Pädiatrie", "Päd"),
+    ("Gynäkologie", "Gyn"),
+    ("Orthopädie", "Ort"),
+    ("Kardiologie", "Kar"),
+    ("Urologie", "Uro"),
+    ("Radiologie", "Rad"),
+]
+FIRST_NAMES = [
+    "Anna",
+    "Ben",
+    "Clara",
+    "David",
+    "Emma",
+    "Felix",
+    "Greta",
+    "Hannes",
+    "Ida",
+    "Jonas",
+    "Klara",
+    "Lukas",
+    "Mia",
+    "Noah",
+    "Olga",
+    "Paul",
+    "Rosa",
+    "Simon",
+    "Tara",
+    "Viktor",
+]
+LAST_NAMES = [
+    "Bauer",
+    "Becker",
+    "Fischer",
+    "Hoffmann",
+    "Koch",
+    "Krüger",
+    "Lange",
+    "Meyer",
+    "Müller",
+    "Neumann",
+    "Richter",
+    "Schäfer",
+    "Schmidt",
+    "Schneider",
+    "Schulz",
+    "Wagner",
+    "Weber",
+    "Wolf",
+    "Zimmermann",
+    "Braun",
+]
+# name, mode, day, month
+NATIONAL_HOLIDAYS = [
+    ("Neujahr", "abs", 1, 1),
+    ("Karfreitag", "rel", -2, None),
+    ("Ostermontag", "rel", 1, None),
+    ("Tag der Arbeit", "abs", 1, 5),
+    ("Christi Himmelfahrt", "rel", 39, None),
+    ("Pfingstmontag", "rel", 50, None),
+    ("Tag der Deutschen Einheit", "abs", 3, 10),
+    ("1. Weihnachtstag", "abs", 25, 12),
+    ("2. Weihnachtstag", "abs", 26, 12),
+]
+REGIONAL_HOLIDAYS = [
+    ("Heilige Drei Könige", "abs", 6, 1),
+    ("Fronleichnam", "rel", 60, None),
+    ("Reformationstag", "abs", 31, 10),
+    ("Allerheiligen", "abs", 1, 11),
+]
+
+
+def generate_hospital(
+    name,
+    shortname,
+    start,
+    years=2,
+    departments=4,
+    persons=60,
+    seed=0,
+    password=None,
+):
+    """Create a company with this name and return it.
+
+    'persons' is the number of persons per department,
+    the plannings start with the date 'start'.
+    """
+    rng = random.Random(f"{seed}-{shortname}")
+    end = add_months(start, 12 * years) - ONE_DAY
+    with transaction.atomic():
+        region = _create_region(rng, shortname)
+        company = Company.objects.create(
+            name=name, shortname=shortname, region=region
+        )
+        free_days = _free_days(region, start, end)
+        employees = _create_employees(company, password)
+        for dep_name, dep_shortname in DEPARTMENTS[:departments]:
+            department = Department.objects.create(
+                name=dep_name, shortname=dep_shortname, company=company
+            )
+            for employee in employees:
+                employee.departments.add(department)
+            wards = _create_wards(department)
+            staff = _create_persons(
+                rng, department, wards, persons, start, end
+            )
+            _plan(rng, employees[0].user, wards, staff, start, end, free_days)
+    return company
+
+
+def _create_region(rng, shortname):
+    region = Region.objects.create(
+        name=f"Region {shortname}", shortname=shortname
+    )
+    regional = rng.sample(REGIONAL_HOLIDAYS, rng.randint(0, 3))
+    for name, mode, day, month in NATIONAL_HOLIDAYS + regional:
+        holiday, _ = CalculatedHoliday.objects.get_or_create(
+            name=name, mode=mode, day=day, month=month, year=None
+        )
+        region.calc_holidays.add(holiday)
+    return region
+
+
+def _free_days(region, start, end):
+    holidays = region.calc_holidays.all()
+    free_days = set()
+    for year in range(start.year, end.year + 1):
+        free_days.update(calc_holidays(holidays, year))
+    day = start
+    while day <= end:
+        if day.weekday() >= 5:
+            free_days.add(day)
+        day += ONE_DAY
+    return free_days
+
+
+def _create_employees(company, password):
+    """Create an editor '<shortname>-edit', who makes the changes,
+    and a reader '<shortname>-read'
+    """
+    employees = []
+    for suffix, level in (("edit", "is_editor"), ("read", None)):
+        user = User(username=f"{company.shortname}-{suffix}")
+        if password:
+            user.set_password(password)
+        else:
+            user.set_unusable_password()
+        user.save()
+        employee = Employee.objects.create(user=user, company=company)
+        employee.set_level(level)
+        employees.append(employee)
+    return employees
+
+
+def _create_wards(department):
+    """Return the wards of the department as dict by their role"""
+    company = department.company
+    prefix = department.shortname
+
+    def ward(role, name, position, **kwargs):
+        kwargs.setdefault("min", 1)
+        kwargs.setdefault("max", 1)
+        return role, Ward.objects.create(
+            name=f"{name} {prefix}",
+            shortname=f"{prefix}-{role}",
+            company=company,
+            position=position,
+            **kwargs,
+        )
+
+    wards = dict(
+        [
+            ward("S1", "Station 1", 1, min=2, max=4),
+            ward("S2", "Station 2", 2, min=2, max=4),
+            ward("Amb", "Ambulanz", 3, min=1, max=2),
+            ward("Spät", "Spätdienst", 10, weekdays="12345"),
+            ward(
+                "N",
+                "Nachtdienst",
+                11,
+                everyday=True,
+                callshift=True,
+                weight=2,
+                ward_type="Dienst",
+                in_ical_feed=True,
+            ),
+            ward(
+                "HG",
+                "Hintergrund",
+                12,
+                everyday=True,
+                callshift=True,
+                weight=1,
+                ward_type="Hintergrund",
+                in_ical_feed=True,
+            ),
+            ward("Frei", "Frei nach Dienst", 20, on_different_days=True),
+            ward("U", "Urlaub", 21, min=0, max=10, on_leave=True),
+        ]
+    )
+    for w in wards.values():
+        w.departments.add(department)
+    wards["N"].after_this.add(wards["Frei"], wards["U"])
+    wards["N"].not_with_this.add(wards["Spät"])
+    return wards
+
+
+def _create_persons(rng, department, wards, number, start, end):
+    """Return the persons of the department as dict by their position"""
+    staff = {Person.POSITION_ASSISTENTEN: [], Person.POSITION_OBERAERZTE: []}
+    period = (end - start).days
+    for i in range(number):
+        if i == 0:
+            position = Person.POSITION_CHEFAERZTE
+        elif i <= number // 4:
+            position = Person.POSITION_OBERAERZTE
+        else:
+            position = Person.POSITION_ASSISTENTEN
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        person = Person(
+            name=f"{first_name} {last_name} ({department.shortname}{i})",
+            shortname=f"{department.shortname}{i}",
+            company=department.company,
+            position=position,
+            start_date=start,
+        )
+        # Some persons come or leave during the period
+        if rng.random() < 0.2:
+            person.start_date = start + timedelta(rng.randrange(period))
+        if rng.random() < 0.15:
+            person.end_date = person.start_date + timedelta(
+                rng.randrange(90, 2 * period)
+            )
+        person.save()
+        person.departments.add(department)
+        functions = ["U", "Frei", "Amb"]
+        if position == Person.POSITION_ASSISTENTEN:
+            functions += ["S1", "S2", "Spät", "N"]
+        elif position == Person.POSITION_OBERAERZTE:
+            functions += ["S1", "S2", "HG"]
+        person.functions.add(*(wards[role] for role in functions))
+        staff.setdefault(position, []).append(person)
+    return staff
+
+
+def _plan(rng, user, wards, staff, start, end, free_days):
+    """Plan the persons of a department with ChangeLoggings"""
+
+    def change(person, role, day, added=True, continued=False, until=None):
+        cl = ChangeLogging.objects.create(
+            company=person.company,
+            user=user,
+            person=person,
+            ward=wards[role],
+            day=day,
+            added=added,
+            continued=continued,
+            until=until,
+        )
+        process_change(cl)
+
+    def active(person, day):
+        return person.start_date <= day <= person.end_date
+
+    on_leave = {}
+    for person in sum(staff.values(), []):
+        on_leave[person.id] = set()
+        # Rotations between the stations and the outpatient clinic
+        if person.position in (
+            Person.POSITION_ASSISTENTEN,
+            Person.POSITION_OBERAERZTE,
+        ):
+            day = max(start, person.start_date)
+            while day <= min(end, person.end_date):
+                until = day + timedelta(rng.randrange(60, 180))
+                role = rng.choice(["S1", "S2", "Amb"])
+                change(person, role, day, continued=True, until=until)
+                day = until + ONE_DAY
+        # Three leaves per year
+        for year in range(start.year, end.year + 1):
+            for _ in range(3):
+                day = date(year, 1, 1) + timedelta(rng.randrange(350))
+                until = day + timedelta(rng.randrange(4, 14))
+                if start <= day and until <= end and active(person, day):
+                    change(person, "U", day, continued=True, until=until)
+                    on_leave[person.id].update(
+                        day + timedelta(i)
+                        for i in range((until - day).days + 1)
+                    )
+
+    def available(persons, day, excluded=()):
+        return [
+            p
+            for p in persons
+            if active(p, day)
+            and day not in on_leave[p.id]
+            and p not in excluded
+        ]
+
+    assistants = staff[Person.POSITION_ASSISTENTEN]
+    senior_physicians = staff[Person.POSITION_OBERAERZTE]
+    day = start
+    last_night = None
+    while day <= end:
+        candidates = available(assistants, day, excluded=[last_night])
+        last_night = None
+        if candidates:
+            last_night = rng.choice(candidates)
+            change(last_night, "N", day)
+            if rng.random() < 0.05:
+                # The shift is swapped with someone else
+                others = [p for p in candidates if p != last_night]
+                if others:
+                    change(last_night, "N", day, added=False)
+                    last_night = rng.choice(others)
+                    change(last_night, "N", day)
+            if day < end:
+                change(last_night, "Frei", day + ONE_DAY)
+        candidates = available(senior_physicians, day)
+        if candidates:
+            change(rng.choice(candidates), "HG", day)
+        if day not in free_days:
+            candidates = available(assistants, day, excluded=[last_night])
+            if candidates:
+                change(rng.choice(candidates), "Spät", day)
+        day += ONE_DAY
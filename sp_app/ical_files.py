@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Static files of the iCal feeds
+
+If settings.ICAL_FEED_ROOT is set, the feed of a person is written to
+ICAL_FEED_ROOT/<feed id>, so the web server delivers it without Django.
+DienstFeed in ical_views remains the fallback for feeds without a file.
+
+Files are only written for persons with one active feed id. Otherwise
+the first use of the newest feed id has to reach DienstFeed,
+which inactivates the older ones. The files of feed ids, that must
+not be served anymore, are removed when the feed ids are saved
+or deleted (see signals.py).
+
+After changes of plannings, the files are written when the transaction
+is committed, and only for a limited number of persons per request.
+The files of the other persons are removed, so DienstFeed delivers
+their feeds until the next run of the command write_ical_files.
+"""
+
+import os
+import re
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpRequest
+
+from .ical_views import DienstFeed
+from .models import FeedId
+
+# The names of the files are feed ids made by models.new_feed_uid
+FEED_FILE_NAME = re.compile(r"[A-Za-z0-9]{12}")
+# Maximal number of persons, whose feed files are written after changes
+FEED_FILES_PER_REQUEST = 10
+
+
+def feed_path(uid):
+    return Path(settings.ICAL_FEED_ROOT) / uid
+
+
+def write_file(path, content):
+    """Replace the file at path atomically with content"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _feed_request():
+    """Return a request to render feeds outside of requests"""
+    url = urlsplit(settings.DOMAIN)
+    request = HttpRequest()
+    request.META["SERVER_NAME"] = url.hostname
+    request.META["SERVER_PORT"] = str(
+        url.port or (443 if url.scheme == "https" else 80)
+    )
+    return request
+
+
+def write_feed_files(person_ids=None):
+    """Write the feed files of these persons, or of all persons if None,
+    and remove the files of their other feed ids.
+
+    Return the feed ids, whose files are written.
+    """
+    os.makedirs(settings.ICAL_FEED_ROOT, exist_ok=True)
+    feed_ids = FeedId.objects.select_related("person")
+    if person_ids is not None:
+        feed_ids = feed_ids.filter(person_id__in=person_ids)
+    feed_ids_of_person = defaultdict(list)
+    for feed_id in feed_ids:
+        feed_ids_of_person[feed_id.person_id].append(feed_id)
+    feed = DienstFeed()
+    request = _feed_request()
+    written = set()
+    for person_feed_ids in feed_ids_of_person.values():
+        active = [feed_id for feed_id in person_feed_ids if feed_id.active]
+        if len(active) == 1:
+            response = feed.get_response(request, active[0].person)
+            write_file(feed_path(active[0].uid), response.content)
+            written.add(active[0].uid)
+        for feed_id in person_feed_ids:
+            if feed_id.uid not in written:
+                remove_file(feed_path(feed_id.uid))
+    return written
+
+
+def remove_other_files(uids):
+    """Remove the feed files in ICAL_FEED_ROOT except those of these
+    feed ids. Other files are kept.
+    """
+    for path in Path(settings.ICAL_FEED_ROOT).iterdir():
+        if (
+            path.is_file()
+            and FEED_FILE_NAME.fullmatch(path.name)
+            and path.name not in uids
+        ):
+            remove_file(path)
+
+
+def remove_unserved_files(feed_id):
+    """Remove the files, that must not be served after feed_id
+    was saved or deleted: its own file, unless it is active,
+    and all files of the person, if the person has several active feed ids.
+    """
+    if not settings.ICAL_FEED_ROOT:
+        return
+    active = set(
+        FeedId.objects.filter(
+            person_id=feed_id.person_id, active=True
+        ).values_list("uid", flat=True)
+    )
+    if feed_id.uid not in active:
+        remove_file(feed_path(feed_id.uid))
+    if len(active) > 1:
+        for uid in active:
+            remove_file(feed_path(uid))
+
+
+def _update_feed_files(person_ids):
+    person_ids = sorted(person_ids)
+    write_feed_files(person_ids[:FEED_FILES_PER_REQUEST])
+    if len(person_ids) > FEED_FILES_PER_REQUEST:
+        for uid in FeedId.objects.filter(
+            person_id__in=person_ids[FEED_FILES_PER_REQUEST:]
+        ).values_list("uid", flat=True):
+            remove_file(feed_path(uid))
+
+
+def write_feed_files_after_changes(person_ids):
+    """Update the feed files of these persons after the commit,
+    if feed files are used
+    """
+    if settings.ICAL_FEED_ROOT and person_ids:
+        person_ids = set(person_ids)
+        transaction.on_commit(lambda: _update_feed_files(person_ids))
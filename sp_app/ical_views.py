@@ -1,18 +1,129 @@
+import hashlib
+from collections import defaultdict
 from django.conf import settings
-from django_ical.views import ICalFeed
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import F
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django_ical.views import ICalFeed
+
+from sp_app.caching import (
+    get_data_version,
+    get_ical_version,
+    get_ical_wards_version,
+    get_wards_feed_version,
+)
+from sp_app.intervals import ONE_DAY, Interval, coalesce
+from sp_app.models import Person, Planning, WardsFeed
+from sp_app.utils import add_months, get_first_of_month
 
-from sp_app.models import Person, Planning
+# The feeds are invalidated by the versions, so they can be kept long
+ICAL_FEED_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def feed_key(person):
+    # The feed contains the months around the current one
+    return "ical_feed-{}-{:%Y%m}-{}-{}-{}".format(
+        person.id,
+        get_first_of_month(),
+        get_ical_version(person.id),
+        get_ical_wards_version(person.company_id),
+        settings.VERSION,
+    )
+
+
+def feed_period():
+    """Return the first and the last day of the months around
+    the current one, that are in the feeds
+    """
+    this_month = get_first_of_month()
+    first_day = add_months(this_month, -settings.ICAL_FEED_MONTHS_BACK)
+    last_day = (
+        add_months(this_month, settings.ICAL_FEED_MONTHS_AHEAD + 1) - ONE_DAY
+    )
+    return first_day, last_day
+
+
+def get_feed_plannings(**filters):
+    """Return the plannings in the months around the current one,
+    that are approved and in wards with in_ical_feed.
+
+    Adjacent and overlapping plannings of a person for the same ward
+    are merged.
+    """
+    first_day, last_day = feed_period()
+    plannings = (
+        Planning.objects.filter(
+            start__lte=last_day,
+            end__gte=first_day,
+            ward__in_ical_feed=True,
+            **filters,
+        )
+        .visible(is_editor=False)
+        .select_related("ward", "person")
+    )
+    timelines = defaultdict(list)
+    for planning in plannings:
+        timelines[(planning.person_id, planning.ward_id)].append(
+            Interval(planning.start, planning.end, planning)
+        )
+    items = []
+    for timeline in timelines.values():
+        for interval in coalesce(timeline):
+            planning = interval.key
+            planning.start, planning.end = interval.start, interval.end
+            items.append(planning)
+    return sorted(items, key=lambda planning: planning.start, reverse=True)
 
 
 class DienstFeed(ICalFeed):
     """
     A simple event calender
+
+    The rendered feed of a person is cached until their plannings
+    or the approval or in_ical_feed of a ward change.
     """
 
     product_id = "-//stationsplan.de//DE"
     timezone = "UTC"
 
+    def __call__(self, request, feed_id):
+        try:
+            obj = self.get_object(request, feed_id)
+        except ObjectDoesNotExist:
+            raise Http404("Feed object does not exist.")
+        response = self.get_response(request, obj)
+        return get_conditional_response(
+            request, etag=response["ETag"], response=response
+        )
+
+    def cache_key(self, person):
+        return feed_key(person)
+
+    def get_response(self, request, obj):
+        """Return the response with the feed, if possible from the cache"""
+        key = self.cache_key(obj)
+        response = cache.get(key)
+        if response is None:
+            response = self.render(request, obj)
+            cache.set(key, response, ICAL_FEED_TIMEOUT)
+        return response
+
+    def render(self, request, obj):
+        """Return the response with the feed and its ETag"""
+        feedgen = self.get_feed(obj, request)
+        response = HttpResponse(content_type=feedgen.mime_type)
+        feedgen.write(response, "utf-8")
+        response["Content-Disposition"] = (
+            f'attachment; filename="{self.file_name(obj)}"'
+        )
+        response["ETag"] = quote_etag(
+            hashlib.sha1(response.content).hexdigest()
+        )
+        return response
+
     def title(self, obj):
         return f"Dienste für {obj.name}"
 
@@ -20,24 +131,20 @@ class DienstFeed(ICalFeed):
         return f"dienste_{obj.name}.ics"
 
     def get_object(self, request, feed_id):
+        """Return the person of an active feed id with one indexed lookup
+
+        The older feed ids of the person are inactivated only when a feed id
+        is used for the first time.
+        """
         person = Person.objects.get(
             feed_ids__uid=feed_id, feed_ids__active=True
         )
-        person.inactivate_older_feeds(feed_id)
-        person.current_feedid = feed_id
+        if cache.add(f"feed_id_used-{feed_id}", True, None):
+            person.inactivate_older_feeds(feed_id)
         return person
 
     def items(self, person):
-        return (
-            Planning.objects.filter(
-                person=person,
-                start__lt=person.end_date,
-                ward__in_ical_feed=True,
-            )
-            .filter(start__lt=F("ward__approved"))
-            .order_by("-start")
-            .select_related("ward")
-        )
+        return get_feed_plannings(person=person, start__lt=person.end_date)
 
     def item_title(self, planning):
         return planning.ward.name
@@ -53,3 +160,48 @@ class DienstFeed(ICalFeed):
 
     def item_link(self, planning):
         return settings.DOMAIN + "/plan"
+
+    def item_guid(self, planning):
+        # The link is the same for all events
+        return "{}-{}-{:%Y%m%d}@stationsplan.de".format(
+            planning.person_id, planning.ward_id, planning.start
+        )
+
+
+class WardsDienstFeed(DienstFeed):
+    """The plannings of all persons for the wards of a WardsFeed
+
+    The feed is cached as a whole until the data of the company
+    or the WardsFeed change.
+    """
+
+    def cache_key(self, wards_feed):
+        return "wards_feed-{}-{:%Y%m}-{}-{}-{}-{}".format(
+            wards_feed.uid,
+            get_first_of_month(),
+            get_data_version(wards_feed.company_id),
+            get_ical_wards_version(wards_feed.company_id),
+            get_wards_feed_version(wards_feed.id),
+            settings.VERSION,
+        )
+
+    def get_object(self, request, feed_id):
+        return WardsFeed.objects.get(uid=feed_id, active=True)
+
+    def title(self, wards_feed):
+        return f"Dienste {wards_feed.name}"
+
+    def file_name(self, wards_feed):
+        return f"dienste_{wards_feed.name}.ics"
+
+    def items(self, wards_feed):
+        return get_feed_plannings(
+            ward__in=wards_feed.get_wards(),
+            start__lt=F("person__end_date"),
+        )
+
+    def item_title(self, planning):
+        return f"{planning.ward.name}: {planning.person.name}"
+
+    def item_description(self, planning):
+        return self.item_title(planning)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Weaving of changes into the timeline of a person and a ward
+
+The timeline consists of closed intervals of dates, i.e. 'start' and 'end'
+are both included. This module does not use the database, the results
+are applied to the Plannings in models.py.
+"""
+
+from collections import namedtuple
+from datetime import date, timedelta
+
+FAR_FUTURE = date(2099, 12, 31)
+ONE_DAY = timedelta(days=1)
+
+# 'key' identifies the interval, e.g. it is the Planning
+Interval = namedtuple("Interval", ["start", "end", "key"])
+Change = namedtuple("Change", ["day", "added", "continued", "until"])
+# 'until' is the effective end of the change, 'inserts' and 'updates'
+# are Intervals, 'deletes' and 'superseded' are keys. The 'superseded'
+# Intervals are superseded by the first inserted one.
+# 'timeline' is the resulting timeline.
+Weaving = namedtuple(
+    "Weaving",
+    ["until", "inserts", "updates", "deletes", "superseded", "timeline"],
+)
+
+
+def is_effective(weaving):
+    return bool(weaving.inserts or weaving.updates or weaving.deletes)
+
+
+def coalesce(intervals):
+    """Merge overlapping and adjacent intervals.
+
+    Return the merged Intervals ordered by start. They have the key
+    of the first of their intervals.
+    """
+    merged = []
+    for interval in sorted(intervals, key=lambda interval: interval.start):
+        if merged and interval.start <= merged[-1].end + ONE_DAY:
+            if interval.end > merged[-1].end:
+                merged[-1] = merged[-1]._replace(end=interval.end)
+        else:
+            merged.append(interval)
+    return merged
+
+
+def weave(timeline, change, last_day=FAR_FUTURE):
+    """Weave the change into the timeline.
+
+    'timeline' is a sequence of Intervals, 'change' is a Change.
+    No interval ends after 'last_day'.
+    Inserted Intervals get new keys.
+    """
+    timeline = sorted(timeline, key=lambda interval: interval.start)
+    day, until = change.day, change.until
+    inserts, updates, deletes, superseded = [], [], [], []
+
+    def insert(start, end):
+        inserts.append(Interval(start, min(end, last_day), object()))
+
+    def update(interval, **bounds):
+        interval = interval._replace(**bounds)
+        updates.append(interval._replace(end=min(interval.end, last_day)))
+
+    def no_effect():
+        return Weaving(until, [], [], [], [], timeline)
+
+    current = [interval for interval in timeline if interval.end >= day]
+    if change.added:
+        if change.continued:
+            end = until or FAR_FUTURE
+            overlapping = [iv for iv in current if iv.start <= end]
+            if len(overlapping):
+                # if until is given and is before the end of the last
+                #   overlapping interval
+                # else it ends with the first interval in this period
+                if until:
+                    last_interval = overlapping[-1]
+                    if until < last_interval.end:
+                        end = until = last_interval.start - ONE_DAY
+                        overlapping.pop()
+                else:
+                    end = overlapping[0].start - ONE_DAY
+                if day > end:  # This can happen if until is None and
+                    return no_effect()  # change is in an existing interval
+            insert(day, end)
+            if until:
+                superseded = [iv.key for iv in overlapping]
+        else:  # not continued, one day
+            if any(iv.start <= day for iv in current):
+                return no_effect()  # change is contained in an interval
+            insert(day, day)
+
+    else:  # removed
+        affected = [iv for iv in current if iv.start <= (until or day)]
+        if len(affected) == 0:
+            return no_effect()
+        if change.continued:
+            if until:
+                for iv in affected:
+                    if iv.start < day:
+                        if iv.end > until:
+                            insert(until + ONE_DAY, iv.end)
+                        update(iv, end=day - ONE_DAY)
+                    elif iv.end > until:
+                        update(iv, start=until + ONE_DAY)
+                    else:
+                        deletes.append(iv.key)
+            else:
+                for iv in affected:  # should be only one interval
+                    if iv.start == day:
+                        deletes.append(iv.key)
+                    else:
+                        update(iv, end=day - ONE_DAY)
+        else:  # not continued, one day
+            for iv in affected:
+                if iv.start == iv.end:  # iv is one day
+                    deletes.append(iv.key)
+                elif iv.start == day:  # cut off first day
+                    update(iv, start=day + ONE_DAY)
+                else:
+                    if not iv.end == day:
+                        insert(day + ONE_DAY, iv.end)
+                    update(iv, end=day - ONE_DAY)
+
+    updated = {iv.key: iv for iv in updates}
+    timeline = sorted(
+        [updated.get(iv.key, iv) for iv in timeline if iv.key not in deletes]
+        + inserts,
+        key=lambda interval: interval.start,
+    )
+    return Weaving(until, inserts, updates, deletes, superseded, timeline)
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""Load tests against a running server
+
+Simulated sessions replay the traffic of the clients:
+- readers open /plan/<month> with its master data and poll
+  /updates/<pk> with the backoff of models.js
+- editors poll as well and post changes to /changes
+- calendar clients fetch iCal feeds
+
+Every session is a thread with its own cookies. The intervals of the
+clients can be shortened with 'time_scale'. The number of SQL queries
+is taken from the header X-Query-Count (see middleware.py), if the
+server sends it.
+"""
+
+import json
+import random
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+# as in models.js
+MIN_UPDATE_INTERVAL = 10
+MAX_UPDATE_INTERVAL = 120
+
+PLAN_DATA_RE = re.compile(r"initialize_site\((\{.*?\})\);", re.S)
+
+
+def next_update_delay(last_change):
+    """Return the seconds until the next poll like
+    schedule_next_update in models.js
+
+    'last_change' is the dict with 'pk' and 'time' of a response,
+    or None after a response without changes or a failure.
+    """
+    if not last_change:
+        return MAX_UPDATE_INTERVAL
+    return min(
+        max(last_change["time"], MIN_UPDATE_INTERVAL), MAX_UPDATE_INTERVAL
+    )
+
+
+def percentile(values, p):
+    """Return the p-th percentile of values (nearest rank)"""
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class Stats:
+    """Response times, statuses and query counts per endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.times = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.queries = defaultdict(list)
+
+    def add(self, endpoint, seconds, status, queries):
+        with self.lock:
+            self.times[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if queries is not None:
+                self.queries[endpoint].append(queries)
+
+    def report(self, duration):
+        """Return the report as list of lines"""
+        lines = [
+            f"{'endpoint':12} {'requests':>8} {'req/s':>7} {'p50':>8} "
+            f"{'p90':>8} {'p99':>8} {'queries':>9} statuses"
+        ]
+        for endpoint, times in sorted(self.times.items()):
+            ms = [t * 1000 for t in times]
+            queries = self.queries[endpoint]
+            query_column = (
+                f"{statistics.mean(queries):5.1f}/{max(queries):<3}"
+                if queries
+                else ""
+            )
+            statuses = ", ".join(
+                f"{status}: {n}"
+                for status, n in sorted(self.statuses[endpoint].items())
+            )
+            lines.append(
+                f"{endpoint:12} {len(times):8} {len(times) / duration:7.1f} "
+                f"{percentile(ms, 50):6.1f}ms {percentile(ms, 90):6.1f}ms "
+                f"{percentile(ms, 99):6.1f}ms {query_column:>9} {statuses}"
+            )
+        return lines
+
+
+class Session:
+    """A client with its own cookies"""
+
+    def __init__(self, base_url, stats):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def cookie(self, name):
+        for cookie in self.cookies:
+            if cookie.name == name:
+                return cookie.value
+        return ""
+
+    def request(self, endpoint, path, data=None, headers=None):
+        """Return status and body of the response"""
+        request = Request(self.base_url + path, data=data)
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
+        if data is not None:
+            request.add_header("X-CSRFToken", self.cookie("csrftoken"))
+            request.add_header("Referer", self.base_url + "/")
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                status, body = response.status, response.read()
+                queries = response.headers.get("X-Query-Count")
+        except HTTPError as e:
+            status, body = e.code, b""
+            queries = e.headers.get("X-Query-Count")
+        except OSError:
+            status, body, queries = "error", b"", None
+        self.stats.add(
+            endpoint,
+            time.perf_counter() - start,
+            status,
+            None if queries is None else int(queries),
+        )
+        return status, body
+
+    def login(self, username, password):
+        """Return if the login succeeded"""
+        self.request("login", "/login/")
+        data = urlencode(
+            {
+                "username": username,
+                "password": password,
+                "csrfmiddlewaretoken": self.cookie("csrftoken"),
+            }
+        ).encode()
+        self.request(
+            "login",
+            "/login/",
+            data,
+            {"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        return bool(self.cookie("sessionid"))
+
+
+class Client(threading.Thread):
+    """A session of a reader or an editor until 'deadline'"""
+
+    def __init__(self, harness, username, editor=False):
+        super().__init__(daemon=True)
+        self.harness = harness
+        self.session = Session(harness.base_url, harness.stats)
+        self.username = username
+        self.editor = editor
+        self.rng = random.Random(f"{harness.seed}-{username}-{id(self)}")
+        self.last_change_pk = 0
+
+    def sleep(self, seconds):
+        time.sleep(seconds * self.harness.time_scale)
+
+    def open_plan(self):
+        status, body = self.session.request(
+            "plan", f"/plan/{self.harness.month}"
+        )
+        match = PLAN_DATA_RE.search(body.decode())
+        if not match:
+            return None
+        data = json.loads(match.group(1))
+        self.session.request("master_data", data["master_data_url"])
+        self.last_change_pk = data.get("last_change_pk") or 0
+        return {
+            "pk": self.last_change_pk,
+            "time": data.get("last_change_time") or 0,
+        }
+
+    def poll(self):
+        """Return the last change like the response of /updates"""
+        while True:
+            status, body = self.session.request(
+                "updates", f"/updates/{self.last_change_pk}"
+            )
+            if status != 200:
+                return None
+            data = json.loads(body)
+            self.last_change_pk = data["last_change"]["pk"]
+            if not data["more"]:
+                return data["last_change"]
+            # The client is far behind and asks again at once
+
+    def change(self):
+        ward_id, person_ids = self.rng.choice(self.harness.functions)
+        data = {
+            "day": self.harness.random_day(self.rng),
+            "ward_id": ward_id,
+            "continued": False,
+            "persons": [
+                {
+                    "id": self.rng.choice(person_ids),
+                    "action": self.rng.choice(["add", "remove"]),
+                }
+            ],
+            "last_pk": self.last_change_pk,
+        }
+        self.session.request(
+            "changes",
+            "/changes",
+            json.dumps(data).encode(),
+            {"Content-Type": "application/json"},
+        )
+
+    def run(self):
+        harness = self.harness
+        # Spread the starts of the sessions
+        self.sleep(self.rng.uniform(0, MIN_UPDATE_INTERVAL))
+        if not self.session.login(self.username, harness.password):
+            return
+        last_change = self.open_plan()
+        next_poll = time.monotonic()
+        next_change = time.monotonic()
+        while True:
+            next_poll += next_update_delay(last_change) * harness.time_scale
+            if self.editor:
+                while next_change < next_poll:
+                    self.wait_until(next_change)
+                    if time.monotonic() >= harness.deadline:
+                        return
+                    self.change()
+                    next_change += (
+                        self.rng.expovariate(1 / harness.edit_interval)
+                        * harness.time_scale
+                    )
+            self.wait_until(next_poll)
+            if time.monotonic() >= harness.deadline:
+                return
+            if self.rng.random() < harness.reload_probability:
+                last_change = self.open_plan()
+            else:
+                last_change = self.poll()
+
+    def wait_until(self, moment):
+        time.sleep(
+            max(0, min(moment, self.harness.deadline) - time.monotonic())
+        )
+
+
+class FeedClient(threading.Thread):
+    """A calendar that fetches an iCal feed regularly"""
+
+    def __init__(self, harness, feed_id):
+        super().__init__(daemon=True)
+        self.harness = harness
+        self.session = Session(harness.base_url, harness.stats)
+        self.feed_id = feed_id
+        self.rng = random.Random(f"{harness.seed}-{feed_id}")
+
+    def run(self):
+        harness = self.harness
+        interval = harness.feed_interval * harness.time_scale
+        next_fetch = time.monotonic() + self.rng.uniform(0, interval)
+        while True:
+            time.sleep(
+                max(0, min(next_fetch, harness.deadline) - time.monotonic())
+            )
+            if time.monotonic() >= harness.deadline:
+                return
+            self.session.request("feed", f"/feed/{self.feed_id}")
+            next_fetch += interval
+
+
+class Harness:
+    """Runs the clients and collects their Stats
+
+    'functions' is a list of (ward_id, [person_id, ...]) for the changes
+    of the editors, 'days' the range of days (as dates) of the changes.
+    The intervals are in seconds before scaling with 'time_scale'.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        password,
+        month,
+        functions,
+        days,
+        time_scale=1.0,
+        edit_interval=30,
+        feed_interval=600,
+        reload_probability=0.02,
+        seed=0,
+    ):
+        self.base_url = base_url
+        self.password = password
+        self.month = month
+        self.functions = functions
+        self.days = days
+        self.time_scale = time_scale
+        self.edit_interval = edit_interval
+        self.feed_interval = feed_interval
+        self.reload_probability = reload_probability
+        self.seed = seed
+        self.stats = Stats()
+        self.deadline = None
+
+    def random_day(self, rng):
+        first, last = self.days
+        return (first + (last - first) * rng.random()).strftime("%Y%m%d")
+
+    def run(self, readers, editors, feed_ids, duration):
+        """Run the clients for 'duration' seconds and return the report"""
+        self.deadline = time.monotonic() + duration
+        threads = [Client(self, username) for username in readers]
+        threads += [
+            Client(self, username, editor=True) for username in editors
+        ]
+        threads += [FeedClient(self, feed_id) for feed_id in feed_ids]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.stats.report(time.monotonic() - start)
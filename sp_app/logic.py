@@ -1,21 +1,25 @@
 # -*- coding: utf-8 -*-
 """The business logic"""
+import hashlib
 import json
 import logging
+import time
+from collections import defaultdict
 from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
 from django.core.cache import cache
 from django.core.mail import send_mail
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponseNotModified
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
-from http import HTTPStatus
+from django.urls import reverse
 from numbers import Number
-from datetime import timedelta, datetime
+from datetime import date, timedelta, datetime
 
 from .models import (
     FAR_FUTURE,
-    CalculatedHoliday,
     Company,
     Employee,
     Person,
@@ -24,9 +28,32 @@ from .models import (
     Planning,
     ChangeLogging,
     Department,
-    process_change,
+    create_changeloggings,
+    save_planning_changes,
+    weave_change,
 )
-from .utils import get_first_of_month, time_since
+from .caching import (
+    get_data_version,
+    get_master_data_version,
+    bump_ical_wards_version,
+    bump_master_data_version,
+)
+from .encoding import (
+    RawList,
+    compact_functions,
+    compact_plannings,
+    encode,
+    json_response,
+)
+from .holidays import get_company_holidays
+from .ical_files import write_feed_files_after_changes
+from .ical_views import feed_period
+from .utils import get_first_of_month, last_day_of_month, time_since
+
+PLAN_DATA_TIMEOUT = 60 * 60 * 24
+# The master data contain the holidays until the end of the year
+# HOLIDAY_YEARS years after the start of the data
+HOLIDAY_YEARS = 5
 
 
 def get_plan_data(
@@ -42,49 +69,101 @@ def get_plan_data(
 
     month is '' or 'YYYYMM'
     day is '' or 'YYYYMMDD' or None (for path "/tag")
+
+    The data are cached per company, departments, month, role
+    and the version of the company's data.
     """
     if month == "" and day:
         month = day[:6]
-    # Get all Persons who work here currently
     first_of_month = get_first_of_month(month)
     # start_of_data should be one month earlier
     start_of_data = (first_of_month - timedelta(28)).replace(day=1)
-    persons_qs = (
-        Person.objects.filter(company_id=company_id)
-        .order_by("position", "name")
-        .prefetch_related("functions", "departments")
+    key = "plan_data-{}-{}-{:%Y%m}-{:d}{:d}{:d}-{}".format(
+        company_id,
+        ",".join(str(d_id) for d_id in sorted(department_ids)),
+        start_of_data,
+        is_editor,
+        is_dep_lead,
+        is_company_admin,
+        get_data_version(company_id),
+    )
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = _get_plan_snapshot(
+            company_id,
+            department_ids,
+            first_of_month,
+            start_of_data,
+            is_editor,
+            is_dep_lead,
+            is_company_admin,
+        )
+        if snapshot is None:
+            return None
+        cache.set(key, snapshot, PLAN_DATA_TIMEOUT)
+
+    data = snapshot["data"]
+    if snapshot["last_change"] is not None:
+        # The elapsed time has to be current, so it is not cached
+        last_change_pk, last_change_time = snapshot["last_change"]
+        data = (
+            data[:-1]
+            + ", "
+            + json.dumps(
+                {
+                    "last_change_pk": last_change_pk,
+                    "last_change_time": int(
+                        time_since(last_change_time).total_seconds()
+                    ),
+                }
+            )[1:]
+        )
+    return {
+        "data": data,
+        # not evaluated unless it is used
+        "former_persons": department_persons(
+            company_id, department_ids
+        ).filter(end_date__lt=start_of_data),
+        "inactive_wards": snapshot["inactive_wards"],
+    }
+
+
+def _get_plan_snapshot(
+    company_id,
+    department_ids,
+    first_of_month,
+    start_of_data,
+    is_editor,
+    is_dep_lead,
+    is_company_admin,
+):
+    """Collect the data for get_plan_data from the database"""
+    persons_qs = Person.objects.filter(company_id=company_id).order_by(
+        "position", "name"
     )
-    wards = Ward.objects.filter(
-        departments__id__in=department_ids
-    ).prefetch_related("after_this", "not_with_this")
-    if len(persons_qs) == 0 or len(wards) == 0:
+    wards = list(Ward.objects.filter(departments__id__in=department_ids))
+    if not persons_qs.exists() or len(wards) == 0:
         return None
     different_days = DifferentDay.objects.filter(
         ward__departments__id__in=department_ids, day__gte=start_of_data
     ).select_related("ward")
-    plannings = Planning.objects.filter(
-        ward__in=wards,
-        ward__active=True,
+    # Later plannings are loaded by the client with get_plannings_chunk
+    plannings = get_plannings(
+        department_ids,
+        is_editor,
         end__gte=start_of_data,
-        superseded_by=None,
-    ).select_related("ward")
-
-    if not is_editor:
-        plannings = [
-            p
-            for p in plannings
-            if not p.ward.approved or p.start <= p.ward.approved
-        ]
-    holidays = get_holidays_for_company(company_id)
-    departments = dict(
-        (d.id, d.name)
-        for d in Department.objects.filter(id__in=department_ids)
+        start__lte=last_day_of_month(first_of_month),
+    )
+    # Persons, wards, holidays and departments are loaded by the client
+    # with get_master_data
+    _, master_data_version = get_master_data(
+        company_id, department_ids, start_of_data
     )
     data = {
-        "persons": [
-            p.toJson() for p in persons_qs if p.end_date >= start_of_data
-        ],
-        "wards": [w.toJson() for w in wards if w.active],
+        "master_data_url": reverse(
+            "master-data",
+            args=[start_of_data.strftime("%Y%m"), master_data_version],
+        ),
         "different_days": [
             (
                 dd.ward.shortname,
@@ -93,14 +172,20 @@ def get_plan_data(
             )
             for dd in different_days
         ],
-        "plannings": [p.toJson() for p in plannings],
+        "plannings": (
+            compact_plannings(plannings, start_of_data)
+            if settings.COMPACT_PLAN_DATA
+            else RawList(p.get_json() for p in plannings)
+        ),
+        "change_stream_url": (
+            settings.CHANGE_STREAM_URL if settings.CHANGE_STREAM else ""
+        ),
         "is_editor": is_editor,
         "is_dep_lead": is_dep_lead,
         "is_company_admin": is_company_admin,
         "data_year": start_of_data.year,
         "data_month": start_of_data.month - 1,
-        "holidays": [h.toJson() for h in holidays],
-        "departments": departments,
+        "plannings_month": first_of_month.strftime("%Y%m"),
     }
     last_change = (
         ChangeLogging.objects.filter(
@@ -110,21 +195,147 @@ def get_plan_data(
         .order_by("pk")
         .last()
     )
-    if last_change is not None:
-        data["last_change_pk"] = last_change["pk"]
-        data["last_change_time"] = int(
-            time_since(last_change["change_time"]).total_seconds()
-        )
-
     return {
-        "data": json.dumps(data),
-        "former_persons": [
-            p for p in persons_qs if p.end_date < start_of_data
-        ],
+        "data": encode(data).decode(),
+        "last_change": (
+            None
+            if last_change is None
+            else (last_change["pk"], last_change["change_time"])
+        ),
         "inactive_wards": [w for w in wards if not w.active],
     }
 
 
+def department_persons(company_id, department_ids, start_of_data=None):
+    """Return the persons of these departments.
+
+    With start_of_data, persons of other departments are included,
+    if they are planned for the wards of these departments after it.
+    """
+    persons = Q(departments__id__in=department_ids)
+    if start_of_data is not None:
+        persons |= Q(
+            id__in=Planning.objects.filter(
+                ward__departments__id__in=department_ids,
+                end__gte=start_of_data,
+            ).values("person_id")
+        )
+    return (
+        Person.objects.filter(persons, company_id=company_id)
+        .distinct()
+        .order_by("position", "name")
+    )
+
+
+def get_master_data(company_id, department_ids, start_of_data):
+    """Return the persons, wards, holidays and departments as json
+    and the version of this content.
+
+    Persons who left before start_of_data are omitted, as well as persons
+    of other departments, unless they are planned for these wards.
+    The data are cached with the master data version of the company.
+    """
+    key = "master_data-{}-{}-{:%Y%m}-{}".format(
+        company_id,
+        ",".join(str(d_id) for d_id in sorted(department_ids)),
+        start_of_data,
+        get_master_data_version(company_id),
+    )
+    master_data = cache.get(key)
+    if master_data is None:
+        persons = (
+            department_persons(company_id, department_ids, start_of_data)
+            .filter(end_date__gte=start_of_data)
+            .prefetch_related("functions", "departments")
+        )
+        wards = Ward.objects.filter(
+            departments__id__in=department_ids, active=True
+        ).prefetch_related("after_this", "not_with_this")
+        holidays = get_company_holidays(
+            company_id,
+            start_of_data,
+            date(start_of_data.year + HOLIDAY_YEARS, 12, 31),
+        )
+        departments = dict(
+            (d.id, d.name)
+            for d in Department.objects.filter(id__in=department_ids)
+        )
+        persons = [p.toJson() for p in persons]
+        wards = [w.toJson() for w in wards]
+        if settings.COMPACT_PLAN_DATA:
+            compact_functions(persons, wards)
+        data = encode(
+            {
+                "persons": persons,
+                "wards": wards,
+                "holidays": {
+                    day.strftime("%Y%m%d"): name
+                    for day, name in holidays.items()
+                },
+                "departments": departments,
+            }
+        ).decode()
+        master_data = (data, hashlib.sha1(data.encode()).hexdigest()[:16])
+        cache.set(key, master_data, PLAN_DATA_TIMEOUT)
+    return master_data
+
+
+def get_plannings(department_ids, is_editor, **filters):
+    """Return the current plannings for the wards of these departments
+
+    Plannings after the approval of their ward are only returned
+    for editors. They are ordered by pk, because the order of the rows
+    depends on the index used by the database.
+    """
+    return (
+        Planning.objects.filter(
+            ward__in=Ward.objects.filter(departments__id__in=department_ids),
+            ward__active=True,
+            superseded_by=None,
+            **filters,
+        )
+        .visible(is_editor)
+        .order_by("pk")
+    )
+
+
+def get_plannings_chunk(company_id, department_ids, month, is_editor=False):
+    """Return the plannings that start in this month as json
+    and the version of this content.
+
+    month is 'YYYYMM'
+    """
+    first_of_month = get_first_of_month(month)
+    key = "plannings_chunk-{}-{}-{:%Y%m}-{:d}-{}".format(
+        company_id,
+        ",".join(str(d_id) for d_id in sorted(department_ids)),
+        first_of_month,
+        is_editor,
+        get_data_version(company_id),
+    )
+    chunk = cache.get(key)
+    if chunk is None:
+        plannings = get_plannings(
+            department_ids,
+            is_editor,
+            start__gte=first_of_month,
+            start__lte=last_day_of_month(first_of_month),
+        )
+        data = encode(
+            {
+                "month": first_of_month.strftime("%Y%m"),
+                "plannings": (
+                    compact_plannings(plannings, first_of_month)
+                    if settings.COMPACT_PLAN_DATA
+                    else RawList(p.get_json() for p in plannings)
+                ),
+            }
+        ).decode()
+        chunk = (data, hashlib.sha1(data.encode()).hexdigest()[:16])
+        cache.set(key, chunk, PLAN_DATA_TIMEOUT)
+    return chunk
+
+
 def get_for_company(klass, request=None, company_id="", **kwargs):
     """Return a model for this company
 
@@ -137,10 +348,6 @@ def get_for_company(klass, request=None, company_id="", **kwargs):
     )
 
 
-def get_holidays_for_company(company_id):
-    return CalculatedHoliday.objects.filter(regions__companies__id=company_id)
-
-
 def apply_changes(user, company_id, day, ward_id, continued, persons):
     """Apply changes for this day and ward.
     Return a list of dicts of effective changes to be returned to the client
@@ -148,6 +355,42 @@ def apply_changes(user, company_id, day, ward_id, continued, persons):
     {'id': <id>,
      'action': ‘add'|'remove'}
     """
+    changes, cls = _apply_changes(
+        user, company_id, day, ward_id, continued, persons
+    )
+    _publish_changes(company_id, changes, cls)
+    return cls
+
+
+def apply_change_batch(user, company_id, operations):
+    """Apply the changes of several days and wards in one transaction.
+    Return a list of dicts of effective changes to be returned to the client
+    'operations' is a list of dicts with the arguments of apply_changes:
+    {'day': <YYYYMMDD>,
+     'ward_id': <ward.id>,
+     'continued': True|False|<YYYYMMDD>,
+     'persons': [...]}
+    The operations are applied in order, if one fails none is applied.
+    """
+    all_changes, all_cls = [], []
+    with transaction.atomic():
+        for operation in operations:
+            changes, cls = _apply_changes(
+                user,
+                company_id,
+                operation["day"],
+                operation["ward_id"],
+                operation["continued"],
+                operation["persons"],
+            )
+            all_changes.extend(changes)
+            all_cls.extend(cls)
+    _publish_changes(company_id, all_changes, all_cls)
+    return all_cls
+
+
+def _apply_changes(user, company_id, day, ward_id, continued, persons):
+    """Return the new ChangeLoggings and the dicts of the effective changes"""
     ward = get_for_company(Ward, company_id=company_id, id=ward_id)
     known_persons = {
         person.id: person
@@ -166,20 +409,54 @@ def apply_changes(user, company_id, day, ward_id, continued, persons):
     if isinstance(continued, str):
         data["until"] = datetime.strptime(continued, "%Y%m%d").date()
         data["continued"] = True
-    cls = []
+    changes = []
     for p in persons:
         p_id = int(p["id"])
         # TODO: log error
         assert p_id in known_persons, f"{p_id} is not in the persons database"
-        cl = ChangeLogging.objects.create(
-            person=known_persons[p_id], added=p["action"] == "add", **data
+        changes.append(
+            ChangeLogging(
+                person=known_persons[p_id], added=p["action"] == "add", **data
+            )
         )
-        cl_dict = process_change(cl)
-        if cl_dict:
-            cls.append(cl_dict)
+    with transaction.atomic():
+        # Load all Plannings, that can be affected by the changes
+        plannings = defaultdict(list)
+        for pl in Planning.objects.filter(
+            person_id__in=known_persons, ward=ward, end__gte=data["day"]
+        ).order_by("start"):
+            pl.person = known_persons[pl.person_id]
+            plannings[pl.person_id].append(pl)
+        results = [weave_change(cl, plannings[cl.person_id]) for cl in changes]
+        create_changeloggings(changes)
+        save_planning_changes([result for result in results if result])
+    added = [
+        cl.person_id
+        for cl, result in zip(changes, results)
+        if result and cl.added
+    ]
+    if (
+        added
+        and Person.objects.filter(id__in=added)
+        .exclude(departments__wards=ward)
+        .exists()
+    ):
+        # Persons of other departments are in the master data
+        # of the departments they are planned for
+        bump_master_data_version(company_id)
+    cls = [cl.toJson() for cl, result in zip(changes, results) if result]
+    return changes, cls
+
+
+def _publish_changes(company_id, changes, cls):
+    """Make the committed changes known to the clients"""
+    if len(changes):
+        add_to_change_buffer(company_id, changes)
     if len(cls):
         set_cached_last_change_pk(max(cl["pk"] for cl in cls), company_id)
-    return cls
+        write_feed_files_after_changes(
+            set(cl.person_id for cl in changes if cl.ward.in_ical_feed)
+        )
 
 
 def set_approved(wards, approved, department_ids):
@@ -199,6 +476,21 @@ def set_approved(wards, approved, department_ids):
         else FAR_FUTURE
     )
     to_approve.update(approved=approval)
+    to_approve = list(to_approve)
+    for company_id in set(w.company_id for w in to_approve):
+        bump_master_data_version(company_id)
+        bump_ical_wards_version(company_id)
+    first_day, last_day = feed_period()
+    write_feed_files_after_changes(
+        Planning.objects.filter(
+            ward__in=to_approve,
+            ward__in_ical_feed=True,
+            start__lte=last_day,
+            end__gte=first_day,
+        )
+        .values_list("person_id", flat=True)
+        .distinct()
+    )
     to_approve_sn = [w.shortname for w in to_approve]
     return {
         "wards": to_approve_sn,
@@ -219,48 +511,144 @@ def set_cached_last_change_pk(last_change_pk, company_id):
     return cache.set(f"last_change_pk-{company_id}", last_change_pk)
 
 
-def get_last_change_response(company_id, last_change_pk):
-    """Return a JsonResponse with the changes since last_change_pk
+# Number of recent changes per company, that are kept in the cache
+CHANGE_BUFFER_SIZE = 100
+CHANGE_BUFFER_TIMEOUT = 60 * 60 * 24
+# Maximal number of changes in one response
+CHANGE_PAGE_SIZE = 200
+
+
+def _change_entry(cl):
+    return (cl.pk, cl.change_time, cl.json or json.dumps(cl.toJson()))
+
+
+def get_change_buffer(company_id):
+    """Return the recent changes of the company as a list of
+    (pk, change_time, json) ordered by pk, or None.
+
+    The buffer has no gaps, i.e. it contains all changes of the company
+    since its first entry.
+    """
+    return cache.get(f"change_buffer-{company_id}")
+
+
+def add_to_change_buffer(company_id, cls):
+    """Add the ChangeLoggings 'cls' to the buffer of recent changes.
+
+    'cls' have to contain all changes of the company
+    from the first one in 'cls' on.
+    """
+    key = f"change_buffer-{company_id}"
+    lock_key = f"{key}-lock"
+    for _ in range(50):
+        if cache.add(lock_key, True, 5):
+            break
+        time.sleep(0.01)
+    else:
+        # Without the lock, the buffer could get gaps
+        cache.delete(key)
+        return
+    try:
+        entries = {entry[0]: entry for entry in cache.get(key) or []}
+        entries.update((cl.pk, _change_entry(cl)) for cl in cls)
+        buffer = [entries[pk] for pk in sorted(entries)][-CHANGE_BUFFER_SIZE:]
+        cache.set(key, buffer, CHANGE_BUFFER_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+
+def clear_change_buffer(company_id):
+    cache.delete(f"change_buffer-{company_id}")
+
+
+def _changes_since(company_id, last_change_pk, limit):
+    """Return the entries of at most 'limit' changes since and including
+    last_change_pk, preferably from the buffer of recent changes
+    """
+    buffer = get_change_buffer(company_id)
+    if buffer:
+        for i, (pk, _, _) in enumerate(buffer):
+            if pk == last_change_pk:
+                return buffer[i : i + limit]
+    cls = list(
+        ChangeLogging.objects.filter(
+            company_id=company_id, pk__gte=last_change_pk
+        ).order_by("pk")[:limit]
+    )
+    if 0 < len(cls) < limit and cls[0].pk == last_change_pk:
+        # These are all changes since last_change_pk
+        add_to_change_buffer(company_id, cls[-CHANGE_BUFFER_SIZE:])
+    return [_change_entry(cl) for cl in cls]
+
+
+def get_last_change_pk(company_id):
+    """Return the pk of the last change of the company or None"""
+    last_change_pk = get_cached_last_change_pk(company_id)
+    if last_change_pk is None:
+        last_change_pk = (
+            ChangeLogging.objects.filter(company_id=company_id)
+            .order_by("-pk")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if last_change_pk is not None:
+            set_cached_last_change_pk(last_change_pk, company_id)
+    return last_change_pk
+
+
+def get_last_change_response(company_id, last_change_pk, is_editor=False):
+    """Return a json response with the changes since last_change_pk
     and pk and elapsed time of the last change.
+
+    At most CHANGE_PAGE_SIZE changes are returned. If there are more,
+    'more' is true and the client asks again with the returned pk.
+    Readers get only the changes in approved periods, but the pk
+    of the last change nevertheless.
     """
     assert isinstance(last_change_pk, Number)
     _lc_pk = get_cached_last_change_pk(company_id)
     if _lc_pk and (_lc_pk == last_change_pk):
         # Nothing changed
-        return JsonResponse({}, status=HTTPStatus.NOT_MODIFIED)
+        return HttpResponseNotModified()
 
-    # get all ChangeLoggings since and including last_change_pk
-    cls = list(
-        ChangeLogging.objects.filter(
-            company_id=company_id, pk__gte=last_change_pk
-        ).order_by("pk")
-    )
-    if len(cls) == 0:
+    # get the changes since and including last_change_pk
+    # and one more to know if there are more
+    entries = _changes_since(company_id, last_change_pk, CHANGE_PAGE_SIZE + 2)
+    if len(entries) == 0:
         # Only older ChangeLoggings, so last_change_pk is wrong
-        cls = [ChangeLogging.objects.order_by("pk").last()]
-        if len(cls) == 0:
+        lc_pk = get_last_change_pk(company_id)
+        if lc_pk is None:
             # No ChangeLoggings
             logging.debug("No ChangeLoggings found")
-            return JsonResponse({}, status=HTTPStatus.NOT_MODIFIED)
-    if cls[0].pk == last_change_pk:
-        if len(cls) == 1:
+            return HttpResponseNotModified()
+        entries = _changes_since(company_id, lc_pk, 1)
+    if entries[0][0] == last_change_pk:
+        if len(entries) == 1:
             # No newer ChangeLoggings
-            return JsonResponse({}, status=HTTPStatus.NOT_MODIFIED)
-        cls = cls[1:]
-    last_cl = cls[-1]
-    time_diff = time_since(last_cl.change_time)
-    if _lc_pk is None:
+            return HttpResponseNotModified()
+        entries = entries[1:]
+    more = len(entries) > CHANGE_PAGE_SIZE
+    entries = entries[:CHANGE_PAGE_SIZE]
+    last_pk, last_change_time, _ = entries[-1]
+    time_diff = time_since(last_change_time)
+    if not is_editor:
+        visible = set(
+            ChangeLogging.objects.filter(pk__in=[pk for pk, _, _ in entries])
+            .visible(is_editor)
+            .values_list("pk", flat=True)
+        )
+        entries = [entry for entry in entries if entry[0] in visible]
+    if _lc_pk is None and not more:
         # Set cache
-        set_cached_last_change_pk(last_cl.pk, company_id)
-    return JsonResponse(
+        set_cached_last_change_pk(last_pk, company_id)
+    return json_response(
         {
-            "cls": [
-                json.loads(cl.json) if cl.json else cl.toJson() for cl in cls
-            ],
+            "cls": RawList(cl_json for _, _, cl_json in entries),
             "last_change": {
-                "pk": last_cl.pk,
+                "pk": last_pk,
                 "time": time_diff.days * 86400 + time_diff.seconds,
             },
+            "more": more,
         }
     )
 
@@ -0,0 +1,81 @@
+from datetime import date, datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from sp_app.hospital_data import DEPARTMENTS, generate_hospital
+from sp_app.models import Company
+
+
+class Command(BaseCommand):
+    help = (
+        "Create companies with synthetic departments, persons, wards "
+        "and plannings for measurements. The data is determined by the seed "
+        "and the other arguments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--companies", type=int, default=1)
+        parser.add_argument(
+            "--departments",
+            type=int,
+            default=4,
+            help=f"per company, at most {len(DEPARTMENTS)}",
+        )
+        parser.add_argument(
+            "--persons", type=int, default=60, help="per department"
+        )
+        parser.add_argument(
+            "--years", type=int, default=2, help="of plannings"
+        )
+        parser.add_argument(
+            "--start",
+            help="first month of the plannings as YYYYMM, "
+            "default is January of the first year",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--password",
+            help="of the users <shortname>-edit and <shortname>-read, "
+            "who can not log in without it",
+        )
+
+    def handle(self, *args, **options):
+        if not 1 <= options["departments"] <= len(DEPARTMENTS):
+            raise CommandError(
+                f"--departments must be between 1 and {len(DEPARTMENTS)}"
+            )
+        if options["start"]:
+            try:
+                start = datetime.strptime(options["start"], "%Y%m").date()
+            except ValueError:
+                raise CommandError("--start must be YYYYMM")
+        else:
+            start = date(date.today().year - options["years"] + 1, 1, 1)
+        seed = options["seed"]
+        for i in range(1, options["companies"] + 1):
+            shortname = f"gen{seed}-{i}"
+            if len(shortname) > 10:
+                raise CommandError(f"The shortname {shortname} is too long")
+            if (
+                Company.objects.filter(shortname=shortname).exists()
+                or User.objects.filter(
+                    username__startswith=f"{shortname}-"
+                ).exists()
+            ):
+                raise CommandError(f"{shortname} has already been generated")
+            company = generate_hospital(
+                f"Klinikum {shortname}",
+                shortname,
+                start,
+                years=options["years"],
+                departments=options["departments"],
+                persons=options["persons"],
+                seed=seed,
+                password=options["password"],
+            )
+            self.stdout.write(
+                f"{company.name}: "
+                f"{company.persons.count()} persons, "
+                f"{company.planning_set.count()} plannings"
+            )
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sp_app.load_harness import Harness
+from sp_app.models import Company, FeedId, Person
+from sp_app.utils import get_first_of_month, last_day_of_month
+
+
+class Command(BaseCommand):
+    help = (
+        "Run simulated sessions against a running server and report "
+        "throughput, latency and SQL queries per endpoint. "
+        "The company should be made by generate_hospital, whose users "
+        "<shortname>-read and <shortname>-edit log in. "
+        "The server reports the queries with query_count_header = true "
+        "in the [server] section of its configuration."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("company", help="shortname of the company")
+        parser.add_argument("--password", required=True)
+        parser.add_argument("--url", default="http://localhost:8000")
+        parser.add_argument("--sessions", type=int, default=200)
+        parser.add_argument(
+            "--editors", type=int, default=5, help="of the sessions"
+        )
+        parser.add_argument(
+            "--feeds", type=int, default=50, help="number of iCal clients"
+        )
+        parser.add_argument(
+            "--duration", type=float, default=60, help="in seconds"
+        )
+        parser.add_argument(
+            "--time-scale",
+            type=float,
+            default=1.0,
+            help="factor for the intervals of the clients",
+        )
+        parser.add_argument(
+            "--edit-interval",
+            type=float,
+            default=30,
+            help="mean seconds between the changes of an editor",
+        )
+        parser.add_argument(
+            "--feed-interval",
+            type=float,
+            default=600,
+            help="seconds between the fetches of an iCal client",
+        )
+        parser.add_argument("--month", help="YYYYMM, default is this month")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(shortname=options["company"])
+        except Company.DoesNotExist:
+            raise CommandError(f"There is no company {options['company']}")
+        if not 0 <= options["editors"] <= options["sessions"]:
+            raise CommandError("--editors must not exceed --sessions")
+        if options["month"]:
+            first_day = datetime.strptime(options["month"], "%Y%m").date()
+        else:
+            first_day = get_first_of_month()
+        functions = []
+        for ward in company.wards.filter(active=True):
+            person_ids = list(ward.staff.values_list("id", flat=True))
+            if person_ids:
+                functions.append((ward.id, person_ids))
+        persons = Person.objects.filter(company=company).order_by("id")
+        feed_ids = []
+        for person in persons[: options["feeds"]]:
+            feed = FeedId.objects.filter(person=person, active=True).first()
+            feed_ids.append((feed or FeedId.new(person)).uid)
+        harness = Harness(
+            options["url"],
+            options["password"],
+            first_day.strftime("%Y%m"),
+            functions,
+            (first_day, last_day_of_month(first_day)),
+            time_scale=options["time_scale"],
+            edit_interval=options["edit_interval"],
+            feed_interval=options["feed_interval"],
+            seed=options["seed"],
+        )
+        editors = options["editors"]
+        readers = options["sessions"] - editors
+        report = harness.run(
+            [f"{company.shortname}-read"] * readers,
+            [f"{company.shortname}-edit"] * editors,
+            feed_ids,
+            options["duration"],
+        )
+        for line in report:
+            self.stdout.write(line)
+        if not harness.stats.queries:
+            self.stdout.write(
+                "The server did not report its queries "
+                "(query_count_header = true)"
+            )
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sp_app.ical_files import remove_other_files, write_feed_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the iCal feeds of all persons to settings.ICAL_FEED_ROOT "
+        "and remove outdated files. Should run daily, because the feeds "
+        "contain the months around the current one."
+    )
+
+    def handle(self, *args, **options):
+        if not settings.ICAL_FEED_ROOT:
+            raise CommandError("ical_feed_root is not configured")
+        written = write_feed_files()
+        remove_other_files(written)
+        self.stdout.write(f"{len(written)} feeds written")
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from django.db import connection
+
+
+def query_count_middleware(get_response):
+    """Report the number of SQL queries of a request in the header
+    X-Query-Count, e.g. for the load tests of load_harness.py.
+
+    It is only installed with settings.QUERY_COUNT_HEADER.
+    """
+
+    def middleware(request):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = get_response(request)
+        response["X-Query-Count"] = str(queries)
+        return response
+
+    return middleware
@@ -0,0 +1,19 @@
+# Generated by Django 4.1 on 2026-10-18 08:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sp_app", "0067_alter_ward_not_with_this_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="changelogging",
+            index=models.Index(
+                fields=["company", "id"], name="changelogging_company_pk"
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+import json
+
+
+def update_planning_json(apps, schema_editor):
+    """The stored json of a Planning can be spliced into responses,
+    if it has the same end as the Planning
+    """
+    Planning = apps.get_model("sp_app", "Planning")
+    plannings = []
+    for pl in Planning.objects.exclude(version=2).iterator(chunk_size=2000):
+        pl.json = json.dumps(
+            {
+                "person": pl.person_id,
+                "ward": pl.ward_id,
+                "start": pl.start.strftime("%Y%m%d"),
+                "end": pl.end.strftime("%Y%m%d"),
+            }
+        )
+        pl.version = 2
+        plannings.append(pl)
+        if len(plannings) == 2000:
+            Planning.objects.bulk_update(plannings, ["json", "version"])
+            plannings = []
+    Planning.objects.bulk_update(plannings, ["json", "version"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sp_app", "0068_changelogging_company_pk"),
+    ]
+
+    operations = [
+        migrations.RunPython(update_planning_json, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sp_app", "0069_update_planning_json"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="planning",
+            index=models.Index(
+                fields=["ward", "start"], name="planning_ward_start"
+            ),
+        ),
+    ]
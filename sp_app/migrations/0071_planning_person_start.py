@@ -0,0 +1,19 @@
+# Generated by Django 4.1 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sp_app", "0070_planning_ward_start"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="planning",
+            index=models.Index(
+                fields=["person", "start"], name="planning_person_start"
+            ),
+        ),
+    ]
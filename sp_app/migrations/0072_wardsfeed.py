@@ -0,0 +1,71 @@
+# Generated by Django 4.1 on 2026-10-18 09:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+import sp_app.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sp_app", "0071_planning_person_start"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WardsFeed",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "uid",
+                    models.CharField(
+                        default=sp_app.models.new_feed_uid,
+                        max_length=20,
+                        unique=True,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, verbose_name="Name")),
+                ("active", models.BooleanField(default=True)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="wards_feeds",
+                        to="sp_app.company",
+                    ),
+                ),
+                (
+                    "department",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="wards_feeds",
+                        to="sp_app.department",
+                    ),
+                ),
+                (
+                    "wards",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="feeds",
+                        to="sp_app.ward",
+                        verbose_name="Wards",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Wards feed",
+                "verbose_name_plural": "Wards feeds",
+            },
+        ),
+    ]
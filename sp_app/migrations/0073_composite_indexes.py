@@ -0,0 +1,55 @@
+# Generated by Django 4.1 on 2026-10-18 09:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sp_app", "0072_wardsfeed"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="changelogging",
+            index=models.Index(
+                fields=["ward", "day"], name="changelogging_ward_day"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="differentday",
+            index=models.Index(
+                fields=["ward", "day"], name="differentday_ward_day"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="planning",
+            index=models.Index(
+                fields=["superseded_by", "ward", "end"],
+                name="planning_current_ward_end",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="planning",
+            index=models.Index(
+                fields=["person", "ward", "end"],
+                name="planning_person_ward_end",
+            ),
+        ),
+        # The new index starts with superseded_by
+        migrations.AlterField(
+            model_name="planning",
+            name="superseded_by",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                default=None,
+                help_text="Spätere Planung, die diese hier überdeckt",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="supersedes",
+                to="sp_app.planning",
+            ),
+        ),
+    ]
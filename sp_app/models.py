@@ -1,17 +1,17 @@
 # -*- coding: utf-8 -*-
 import json
 import string
-from datetime import date, timedelta
+from datetime import date
 from django.contrib.auth.models import User, Group
 from django.core.exceptions import ValidationError
-from django.db import models, IntegrityError
+from django.db import connections, models, IntegrityError
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
 from stationsplan.utils import random_string
-from sp_app import utils
-
-FAR_FUTURE = date(2099, 12, 31)
-ONE_DAY = timedelta(days=1)
+from sp_app import intervals, utils
+from sp_app.caching import bump_data_version, bump_ical_version
+from sp_app.intervals import FAR_FUTURE, Change, Interval
 
 
 def date_to_json(date):
@@ -255,6 +255,9 @@ class DifferentDay(models.Model):
     class Meta:
         verbose_name = _("Different Day")
         verbose_name_plural = _("Different Days")
+        indexes = [
+            models.Index(fields=["ward", "day"], name="differentday_ward_day"),
+        ]
 
 
 class Person(UniqueField, models.Model):
@@ -350,9 +353,11 @@ class Person(UniqueField, models.Model):
             Planning.objects.filter(
                 person=self, start__gt=self.end_date, end=FAR_FUTURE
             ).delete()
+            # The stored json of these Plannings is outdated
             Planning.objects.filter(person=self, end=FAR_FUTURE).update(
-                end=self.end_date
+                end=self.end_date, version=0
             )
+            bump_data_version(self.company_id)
         # every person can be on leave
         if created and not self.anonymous:
             self.functions.add(
@@ -367,17 +372,38 @@ class Person(UniqueField, models.Model):
         return self.end_date >= date.today()
 
     def inactivate_older_feeds(self, feed_id):
-        feedids = list(FeedId.objects.filter(person=self, active=True))
-        if len(feedids) < 2:
-            return
-        current_feed = next(f for f in feedids if f.uid == feed_id)
-        older = []
-        for f in feedids:
-            if f.pk < current_feed.pk:
-                f.active = False
-                older.append(f)
-        if older:
-            FeedId.objects.bulk_update(older, ["active"])
+        """Inactivate the feed ids of the person, that are older than
+        feed_id
+
+        They are saved one by one, so the signals remove their files.
+        """
+        older = FeedId.objects.filter(
+            person=self,
+            active=True,
+            pk__lt=models.Subquery(
+                FeedId.objects.filter(uid=feed_id).values("pk")
+            ),
+        )
+        for older_feed_id in older:
+            older_feed_id.active = False
+            older_feed_id.save(update_fields=["active"])
+
+
+def approved_by_ward(field):
+    """Return a Q for the rows whose date 'field' is in the approved period
+    of their ward. Wards without approval date are approved.
+    """
+    return models.Q(ward__approved__isnull=True) | models.Q(
+        **{f"{field}__lte": models.F("ward__approved")}
+    )
+
+
+class ChangeLoggingQuerySet(models.QuerySet):
+    def visible(self, is_editor):
+        """Editors see all changes, readers only approved ones"""
+        if is_editor:
+            return self
+        return self.filter(approved_by_ward("day"))
 
 
 class ChangeLogging(models.Model):
@@ -406,9 +432,21 @@ class ChangeLogging(models.Model):
     version = models.IntegerField(default=0)
     current_version = 1
 
+    objects = ChangeLoggingQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("ChangeLogging")
         verbose_name_plural = _("ChangeLoggings")
+        indexes = [
+            # for the changes of a company since a given pk
+            models.Index(
+                fields=["company", "id"], name="changelogging_company_pk"
+            ),
+            # for the history of a ward and day
+            models.Index(
+                fields=["ward", "day"], name="changelogging_ward_day"
+            ),
+        ]
 
     def toJson(self):
         data = {
@@ -465,96 +503,165 @@ class ChangeLogging(models.Model):
         return self.description
 
 
+def create_changeloggings(cls):
+    """Save new ChangeLoggings with a fixed number of queries
+
+    If the database does not return the ids of bulk inserted rows (MySQL),
+    they are selected by a marker in cl.json among the newer rows
+    of the company.
+    """
+    if not cls:
+        return
+    for cl in cls:
+        cl.make_description()
+        cl.version = cl.current_version
+    db = ChangeLogging.objects.db
+    if connections[db].features.can_return_rows_from_bulk_insert:
+        ChangeLogging.objects.bulk_create(cls)
+    else:
+        company_id = cls[0].company_id
+        last_pk = (
+            ChangeLogging.objects.filter(company_id=company_id).aggregate(
+                last_pk=models.Max("pk")
+            )["last_pk"]
+            or 0
+        )
+        marker = random_string(20, string.ascii_letters + string.digits)
+        for i, cl in enumerate(cls):
+            cl.json = f"{marker}-{i}"
+        ChangeLogging.objects.bulk_create(cls)
+        pks = dict(
+            ChangeLogging.objects.filter(
+                company_id=company_id, pk__gt=last_pk, json__startswith=marker
+            ).values_list("json", "pk")
+        )
+        for cl in cls:
+            cl.pk = pks[cl.json]
+    # cl.json contains the primary key
+    for cl in cls:
+        cl.json = json.dumps(cl.toJson())
+    ChangeLogging.objects.bulk_update(cls, ["json"])
+    # bulk operations do not send signals
+    bump_data_version(cls[0].company_id)
+
+
+def weave_change(cl, plannings):
+    """Weave the change into the Plannings of its person and ward in memory.
+
+    'plannings' is a list of the Plannings of cl.person and cl.ward,
+    that end on or after cl.day. It is updated in place,
+    and cl.until may be shortened.
+
+    Return a dict with the lists of 'created', 'changed' and 'deleted'
+    Plannings and of the Plannings 'superseded' by the created one,
+    or None, if the change has no effect.
+    """
+    weaving = intervals.weave(
+        [Interval(pl.start, pl.end, i) for i, pl in enumerate(plannings)],
+        Change(cl.day, cl.added, cl.continued, cl.until),
+        last_day=cl.person.end_date,
+    )
+    cl.until = weaving.until
+    if not intervals.is_effective(weaving):
+        return None
+    by_key = dict(enumerate(plannings))
+    for interval in weaving.inserts:
+        by_key[interval.key] = Planning(
+            person=cl.person,
+            ward_id=cl.ward_id,
+            start=interval.start,
+            end=interval.end,
+        )
+    for interval in weaving.updates:
+        pl = by_key[interval.key]
+        pl.start, pl.end = interval.start, interval.end
+    for interval in weaving.inserts + weaving.updates:
+        by_key[interval.key].prepare_save()
+    plannings[:] = [by_key[interval.key] for interval in weaving.timeline]
+    return {
+        "created": [by_key[interval.key] for interval in weaving.inserts],
+        "changed": [by_key[interval.key] for interval in weaving.updates],
+        "deleted": [by_key[key] for key in weaving.deletes],
+        "superseded": [by_key[key] for key in weaving.superseded],
+    }
+
+
+def save_planning_changes(results):
+    """Write the results of weave_change to the database.
+
+    The results are applied in order, so later results may change
+    or delete Plannings, that have been created by earlier ones.
+    """
+    created, changed, deleted = [], [], []
+    for result in results:
+        if result["superseded"]:
+            # The superseding Planning needs its id
+            superseding = result["created"][0]
+            superseding.save()
+            Planning.objects.filter(
+                id__in=[pl.id for pl in result["superseded"] if pl.id]
+            ).update(superseded_by=superseding)
+        created.extend(pl for pl in result["created"] if pl.pk is None)
+        changed.extend(result["changed"])
+        deleted.extend(result["deleted"])
+    if not (created or changed or deleted):
+        return
+    company_id = (created + changed + deleted)[0].company_id
+    person_ids = set(pl.person_id for pl in created + changed + deleted)
+    created = [pl for pl in created if pl not in deleted]
+    changed = [
+        pl
+        for i, pl in enumerate(changed)
+        if pl.pk and pl not in deleted and pl not in changed[:i]
+    ]
+    deleted = [pl.pk for pl in deleted if pl.pk]
+    if deleted:
+        Planning.objects.filter(id__in=deleted).delete()
+    if created:
+        Planning.objects.bulk_create(created)
+    if changed:
+        now = timezone.now()
+        for pl in changed:
+            pl.updateddate = now
+        Planning.objects.bulk_update(
+            changed, ["start", "end", "json", "version", "updateddate"]
+        )
+    # bulk operations do not send signals
+    bump_data_version(company_id)
+    for person_id in person_ids:
+        bump_ical_version(person_id)
+
+
 def process_change(cl):
     """Weave the change into the existing Plannings.
 
     Return the json dict of the effective change to be returned to the client.
     """
-    plannings = Planning.objects.filter(
-        person_id=cl.person_id, ward_id=cl.ward_id
-    )
-    pl_data = dict(person_id=cl.person_id, ward_id=cl.ward_id)
-    if cl.added:
-        if cl.continued:
-            end = cl.until or FAR_FUTURE
-            plannings = list(
-                plannings.filter(
-                    end__gte=cl.day,
-                    start__lte=end,
-                ).order_by("start")
-            )
-            if len(plannings):
-                # if cl.until is given and is before the end of the last
-                #   overlapping planning
-                # else it ends with the first planning in this period
-                if cl.until:
-                    last_planning = plannings[-1]
-                    if cl.until < last_planning.end:
-                        end = cl.until = last_planning.start - ONE_DAY
-                        cl.save()
-                        plannings.pop()
-                else:
-                    end = plannings[0].start - ONE_DAY
-                if cl.day > end:  # This can happen if cl.until==None and
-                    return {}  # change is in an existing planning
-            pl = Planning.objects.create(start=cl.day, end=end, **pl_data)
-            if cl.until and len(plannings) > 0:
-                Planning.objects.filter(
-                    id__in=[_pl.id for _pl in plannings]
-                ).update(superseded_by=pl)
-        else:  # not continued, one day
-            plannings = plannings.filter(start__lte=cl.day, end__gte=cl.day)
-            if len(plannings) == 0:
-                Planning.objects.create(start=cl.day, end=cl.day, **pl_data)
-            else:
-                return {}  # change is contained in a Planning
-
-    else:  # removed
-        plannings = plannings.filter(
-            start__lte=cl.until or cl.day, end__gte=cl.day
+    plannings = list(
+        Planning.objects.filter(
+            person_id=cl.person_id, ward_id=cl.ward_id, end__gte=cl.day
         ).order_by("start")
-        if len(plannings) == 0:
-            return {}
-        if cl.continued:
-            if cl.until:
-                for pl in plannings:
-                    if pl.start < cl.day:
-                        if pl.end > cl.until:
-                            Planning.objects.create(
-                                start=cl.until + ONE_DAY, end=pl.end, **pl_data
-                            )
-                        pl.end = cl.day - ONE_DAY
-                        pl.save()
-                    elif pl.end > cl.until:
-                        pl.start = cl.until + ONE_DAY
-                        pl.save()
-                    else:
-                        pl.delete()  # cave: no undo!!
-            else:
-                for pl in plannings:  # should be only one planning
-                    if pl.start == cl.day:
-                        pl.delete()
-                    else:
-                        pl.end = cl.day - ONE_DAY
-                        pl.save()
-        else:  # not continued, one day
-            for pl in plannings:
-                if pl.start == pl.end:  # pl is one day
-                    pl.delete()
-                elif pl.start == cl.day:  # cut off first day
-                    pl.start = cl.day + ONE_DAY
-                    pl.save()
-                else:
-                    if not pl.end == cl.day:
-                        Planning.objects.create(
-                            start=cl.day + ONE_DAY, end=pl.end, **pl_data
-                        )
-                    pl.end = cl.day - ONE_DAY
-                    pl.save()
-
+    )
+    until = cl.until
+    result = weave_change(cl, plannings)
+    if cl.until != until:
+        cl.save()
+    if result is None:
+        return {}
+    save_planning_changes([result])
     return json.loads(cl.json)
 
 
+class PlanningQuerySet(models.QuerySet):
+    def visible(self, is_editor):
+        """Editors see all plannings, readers only those that start
+        in the approved period of their ward
+        """
+        if is_editor:
+            return self
+        return self.filter(approved_by_ward("start"))
+
+
 class Planning(models.Model):
     """One time period, where one person is planned for one ward.
 
@@ -570,7 +677,8 @@ class Planning(models.Model):
     end = models.DateField(default=FAR_FUTURE)
     json = models.CharField(max_length=255)
     version = models.IntegerField(default=0)
-    current_version = 1
+    # version 2: json has the end after it is limited to the persons stay
+    current_version = 2
     superseded_by = models.ForeignKey(
         "self",
         on_delete=models.SET_NULL,
@@ -579,12 +687,34 @@ class Planning(models.Model):
         related_name="supersedes",
         default=None,
         help_text=_("Later planning that supersedes this one"),
+        # planning_current_ward_end starts with this field
+        db_index=False,
     )
     updateddate = models.DateTimeField(auto_now=True)
 
+    objects = PlanningQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Planning")
         verbose_name_plural = _("Plannings")
+        indexes = [
+            # for the plannings of the wards in a period
+            models.Index(fields=["ward", "start"], name="planning_ward_start"),
+            # for the current plannings of the wards, that end after a day
+            models.Index(
+                fields=["superseded_by", "ward", "end"],
+                name="planning_current_ward_end",
+            ),
+            # for the timeline of a person and a ward in process_change
+            models.Index(
+                fields=["person", "ward", "end"],
+                name="planning_person_ward_end",
+            ),
+            # for the iCal feed of a person
+            models.Index(
+                fields=["person", "start"], name="planning_person_start"
+            ),
+        ]
 
     def toJson(self):
         return {
@@ -594,13 +724,23 @@ class Planning(models.Model):
             "end": self.end.strftime("%Y%m%d"),
         }
 
-    def save(self, *args, **kwargs):
+    def get_json(self):
+        """Return the json of the planning, preferably the stored one"""
+        if self.version == self.current_version and self.json:
+            return self.json
+        return json.dumps(self.toJson())
+
+    def prepare_save(self):
+        """Set the fields that are derived from the others"""
         if not self.pk:
             self.company_id = self.person.company_id
-        self.json = json.dumps(self.toJson())
-        self.version = self.current_version
         # the planning should not exceed the persons stay
         self.end = min(self.end, self.person.end_date)
+        self.json = json.dumps(self.toJson())
+        self.version = self.current_version
+
+    def save(self, *args, **kwargs):
+        self.prepare_save()
         super(Planning, self).save(*args, **kwargs)
 
     def __str__(self):
@@ -823,9 +963,56 @@ class FeedId(models.Model):
         """
         while True:
             try:
-                uid = random_string(12, string.ascii_letters + string.digits)
-                feed = FeedId.objects.create(uid=uid, person=person)
+                feed = FeedId.objects.create(uid=new_feed_uid(), person=person)
                 return feed
             except IntegrityError:
                 # uid was already taken
                 pass
+
+
+def new_feed_uid():
+    return random_string(12, string.ascii_letters + string.digits)
+
+
+class WardsFeed(models.Model):
+    """An ical feed with the plannings of all persons for some wards,
+    e.g. all call shifts.
+
+    It contains the chosen wards and, if a department is given,
+    all wards of the department.
+    """
+
+    uid = models.CharField(
+        "ID", max_length=20, unique=True, default=new_feed_uid
+    )
+    name = models.CharField(_("Name"), max_length=50)
+    company = models.ForeignKey(
+        Company, related_name="wards_feeds", on_delete=models.CASCADE
+    )
+    department = models.ForeignKey(
+        Department,
+        null=True,
+        blank=True,
+        related_name="wards_feeds",
+        on_delete=models.CASCADE,
+    )
+    wards = models.ManyToManyField(
+        Ward, blank=True, related_name="feeds", verbose_name=_("Wards")
+    )
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = _("Wards feed")
+        verbose_name_plural = _("Wards feeds")
+
+    def __str__(self):
+        return self.name
+
+    def get_wards(self):
+        """Return the wards of the feed as a queryset"""
+        wards = models.Q(feeds=self)
+        if self.department_id:
+            wards |= models.Q(departments=self.department_id)
+        return Ward.objects.filter(
+            wards, company_id=self.company_id
+        ).distinct()
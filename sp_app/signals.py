@@ -1,7 +1,37 @@
 from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
 
-from .models import Employee
+from .caching import (
+    bump_data_version,
+    bump_holidays_version,
+    bump_ical_version,
+    bump_ical_wards_version,
+    bump_master_data_version,
+    bump_wards_feed_version,
+)
+from .ical_files import remove_unserved_files
+from .logic import clear_change_buffer
+from .models import (
+    CalculatedHoliday,
+    ChangeLogging,
+    Company,
+    Department,
+    DifferentDay,
+    Employee,
+    FeedId,
+    Person,
+    Planning,
+    Region,
+    Ward,
+    WardsFeed,
+)
 from .utils import is_mobile
 
 
@@ -30,3 +60,132 @@ def write_department_id_to_session(sender, **kwargs):
                 request.session.set_expiry(0)
             request.session["can_change_password"] = True
             break
+
+
+@receiver(post_save, sender=ChangeLogging)
+@receiver(post_save, sender=Planning)
+@receiver(post_delete, sender=ChangeLogging)
+@receiver(post_delete, sender=Planning)
+def invalidate_company_data(sender, instance, **kwargs):
+    bump_data_version(instance.company_id)
+
+
+@receiver(post_save, sender=Planning)
+@receiver(post_delete, sender=Planning)
+def invalidate_ical_feed(sender, instance, **kwargs):
+    bump_ical_version(instance.person_id)
+
+
+@receiver(post_save, sender=Person)
+def invalidate_ical_feed_of_person(sender, instance, **kwargs):
+    bump_ical_version(instance.id)
+
+
+@receiver(pre_save, sender=Ward)
+def invalidate_ical_feeds_of_ward(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    before = (
+        Ward.objects.filter(pk=instance.pk)
+        .values_list("name", "approved", "in_ical_feed")
+        .first()
+    )
+    if before != (instance.name, instance.approved, instance.in_ical_feed):
+        bump_ical_wards_version(instance.company_id)
+
+
+@receiver(post_save, sender=FeedId)
+@receiver(post_delete, sender=FeedId)
+def remove_feed_files(sender, instance, **kwargs):
+    remove_unserved_files(instance)
+
+
+@receiver(post_delete, sender=ChangeLogging)
+def invalidate_change_buffer(sender, instance, **kwargs):
+    clear_change_buffer(instance.company_id)
+
+
+@receiver(post_save, sender=DifferentDay)
+@receiver(post_delete, sender=DifferentDay)
+def invalidate_company_data_for_ward(sender, instance, **kwargs):
+    bump_data_version(instance.ward.company_id)
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_save, sender=Person)
+@receiver(post_save, sender=Ward)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Employee)
+@receiver(post_delete, sender=Person)
+@receiver(post_delete, sender=Ward)
+@receiver(post_delete, sender=Department)
+def invalidate_master_data(sender, instance, **kwargs):
+    bump_master_data_version(instance.company_id)
+
+
+@receiver(m2m_changed, sender=Employee.departments.through)
+@receiver(m2m_changed, sender=Person.functions.through)
+@receiver(m2m_changed, sender=Person.departments.through)
+@receiver(m2m_changed, sender=Ward.departments.through)
+@receiver(m2m_changed, sender=Ward.after_this.through)
+@receiver(m2m_changed, sender=Ward.not_with_this.through)
+def invalidate_master_data_for_relation(sender, instance, action, **kwargs):
+    # instance is an Employee, Person, Ward or Department, depending on the side
+    # of the relation that was changed
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_master_data_version(instance.company_id)
+
+
+@receiver(post_save, sender=WardsFeed)
+@receiver(post_delete, sender=WardsFeed)
+def invalidate_wards_feed(sender, instance, **kwargs):
+    bump_wards_feed_version(instance.id)
+
+
+@receiver(m2m_changed, sender=WardsFeed.wards.through)
+def invalidate_wards_feed_for_wards(
+    sender, instance, action, pk_set, **kwargs
+):
+    # When cleared from the side of the ward, the feeds are only
+    # known before
+    if action not in ("post_add", "post_remove", "pre_clear", "post_clear"):
+        return
+    if isinstance(instance, WardsFeed):
+        bump_wards_feed_version(instance.id)
+    elif action == "pre_clear":
+        for wards_feed_id in instance.feeds.values_list("id", flat=True):
+            bump_wards_feed_version(wards_feed_id)
+    elif pk_set:
+        for wards_feed_id in pk_set:
+            bump_wards_feed_version(wards_feed_id)
+
+
+@receiver(post_save, sender=Company)
+def invalidate_holidays_of_company(sender, instance, **kwargs):
+    bump_master_data_version(instance.id)
+
+
+@receiver(post_save, sender=CalculatedHoliday)
+@receiver(pre_delete, sender=CalculatedHoliday)
+def invalidate_holidays(sender, instance, **kwargs):
+    bump_holidays_version()
+    for company in Company.objects.filter(region__calc_holidays=instance):
+        bump_master_data_version(company.id)
+
+
+@receiver(m2m_changed, sender=Region.calc_holidays.through)
+def invalidate_holidays_of_region(sender, instance, action, pk_set, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_holidays_version()
+    # When cleared from the side of the holiday, the regions are only
+    # known before
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if isinstance(instance, Region):
+        companies = instance.companies.all()
+    elif pk_set is None:
+        companies = Company.objects.filter(region__calc_holidays=instance)
+    else:
+        companies = Company.objects.filter(region__id__in=pk_set)
+    for company in companies:
+        bump_master_data_version(company.id)
@@ -30,27 +30,66 @@ let main = (function ($, _, Backbone) {
     }
 
 
+    // Number of attempts to load the master data
+    const MASTER_DATA_ATTEMPTS = 5;
+
     function initialize_site(data) {
         setupCsrfProtection();
+        load_master_data(data, 1);
+    }
+
+    function load_master_data(data, attempt) {
+        // persons, wards, holidays and departments are loaded separately,
+        // so that the browser can cache them
+        $.ajax({
+            type: "GET",
+            url: data.master_data_url,
+            dataType: "json",
+        }).then(function (master_data) {
+            initialize_data(_.extend(master_data, data));
+        }, function (jqXHR, textStatus, errorThrown) {
+            if (jqXHR.status == 403) {
+                // The session has expired
+                window.location.reload();
+            } else if (attempt < MASTER_DATA_ATTEMPTS) {
+                // Try again after 2, 4, 8 and 16 seconds
+                setTimeout(function () {
+                    load_master_data(data, attempt + 1);
+                }, 1000 * Math.pow(2, attempt));
+            } else {
+                models.errors.add({
+                    textStatus: textStatus,
+                    errorThrown: errorThrown,
+                    responseText: jqXHR.responseText,
+                    url: data.master_data_url,
+                });
+            }
+        });
+    }
+
+    function initialize_data(data) {
         _.extend(
             models.user,
             _.pick(data, "is_editor", "is_dep_lead", "is_company_admin", "departments"));
         // just choose one department
         models.user.current_department = parseInt(_.keys(data.departments)[0]);
         models.initialize_wards(data.wards, data.different_days);
-        models.persons.reset(data.persons);
-        models.set_plannings(data.plannings);
+        models.persons.reset(
+            models.decode_functions(data.persons, data.wards));
+        models.set_plannings(data.plannings, data.plannings_month);
         utils.set_holidays(data.holidays);
         models.start_day_chain(data.data_year, data.data_month);
         models.schedule_next_update({
             pk: data.last_change_pk,
             time: data.last_change_time
         });
+        models.start_change_stream(data.change_stream_url);
         Backbone.history.start({ pushState: true });
     }
 
 
     return {
         initialize_site: initialize_site,
+        initialize_data: initialize_data,
     };
 })($, _, Backbone);
@@ -771,12 +771,91 @@ let models = (function ($, _, Backbone) {
         const url = '/changes';
         do_ajax_call(url, json_data, process_changes);
     }
+    let _pending_changes = [];  // changes waiting for the next batch
+    let _batch_in_flight = false;
+    const _batch_retry = 5000;  // 5 sec
+    function save_change_batch(changes) {
+        // Save several changes in one request.
+        // 'changes' is an Array of {
+        //   day: a models.Day
+        //   ward: a models.Ward
+        //   continued: a Boolean or a Date
+        //   persons: an Array of { id: a persons id, action: 'add' or 'remove' }
+        // }
+        // While a batch is on its way, further changes are queued
+        // and sent together after it.
+        _pending_changes = _pending_changes.concat(
+            _.map(changes, function (change) {
+                return {
+                    day: change.day.id,
+                    ward_id: change.ward.get('id'),
+                    continued: _.isDate(change.continued) ?
+                        utils.get_day_id(change.continued) :
+                        change.continued,
+                    persons: change.persons,
+                };
+            }));
+        send_change_batch();
+    }
+    function send_change_batch() {
+        if (_batch_in_flight || !_pending_changes.length) return;
+        const batch = _pending_changes;
+        const url = '/changes/batch';
+        _pending_changes = [];
+        _batch_in_flight = true;
+        function success(data, textStatus, jqXHR) {
+            _batch_in_flight = false;
+            process_changes(data, textStatus, jqXHR);
+            send_change_batch();
+        }
+        function error(jqXHR, textStatus, errorThrown) {
+            if (jqXHR.status == 403)
+                return;  // the page is reloaded
+            if (jqXHR.status === 0 || jqXHR.status >= 500) {
+                // The server was not reached or failed, so the batch
+                // is sent again before the newer changes.
+                _pending_changes = batch.concat(_pending_changes);
+                setTimeout(function () {
+                    _batch_in_flight = false;
+                    send_change_batch();
+                }, _batch_retry);
+                return;
+            }
+            _batch_in_flight = false;
+            errors.add({
+                textStatus: textStatus,
+                errorThrown: errorThrown,
+                responseText: jqXHR.responseText,
+                url: url,
+                data: batch,
+            });
+            send_change_batch();
+        }
+        $.ajax({
+            type: "POST",
+            url: url,
+            data: JSON.stringify({ changes: batch, last_pk: _last_change_pk }),
+            dataType: "json",
+            contentType: "application/json; charset=utf-8",
+            statusCode: { 403: redirect_to_login },
+            error: error,
+            success: success,
+        });
+    }
     function process_changes(data, textStatus, jqXHR) {
         if (jqXHR && jqXHR.status == 304) {
             models.schedule_next_update();
         } else {
-            _.each(data.cls, models.apply_change);
+            // The stream can bring changes again, that the response
+            // to a change of this user has already applied, or vice versa
+            _.each(data.cls, function (change) {
+                if (!(change.pk <= _last_change_pk))
+                    models.apply_change(change);
+            });
             models.schedule_next_update(data.last_change);
+            if (data.more)
+                // The client is far behind, get the next changes now
+                get_updates();
         }
     }
 
@@ -826,12 +905,100 @@ let models = (function ($, _, Backbone) {
         });
     }
 
-    function set_plannings(p) {
+    let _plannings_month;  // the last month whose plannings are loaded
+    let _plannings_loaded = $.when();  // resolved when all chunks are applied
+
+    function decode_plannings(p) {
+        // The compact form of sp_app.encoding.compact_plannings has
+        // parallel arrays, 'start' and 'end' are days after 'base'.
+        if (!p.base) return p;
+        const base = utils.get_date(p.base);
+        const year = base.getFullYear();
+        const month = base.getMonth();
+        const day = base.getDate();
+        return _.map(p.person, function (person, i) {
+            return {
+                person: person,
+                ward: p.ward[i],
+                start: utils.get_day_id(year, month, day + p.start[i]),
+                end: utils.get_day_id(year, month, day + p.end[i]),
+            };
+        });
+    }
+
+    function decode_functions(persons_data, wards_data) {
+        // The functions can be a bitmask as hex string,
+        // see sp_app.encoding.compact_functions
+        _.each(persons_data, function (person) {
+            const mask = person.functions;
+            if (!_.isString(mask)) return;
+            person.functions = [];
+            _.each(wards_data, function (ward, i) {
+                const digit = mask.length - 1 - Math.floor(i / 4);
+                if (digit >= 0 &&
+                    parseInt(mask[digit], 16) & (1 << (i % 4)))
+                    person.functions.push(ward.shortname);
+            });
+        });
+        return persons_data;
+    }
+
+    function set_plannings(p, plannings_month) {
+        p = decode_plannings(p);
         _.each(p, function (planning) {
             planning.person = persons.findWhere({ id: planning.person });
             planning.ward = wards.findWhere({ id: planning.ward });
         });
         plannings = p;
+        _plannings_month = plannings_month;
+    }
+
+    function add_plannings(chunk) {
+        // Add the plannings of a later month.
+        // 'chunk' is the output of sp_app.logic.get_plannings_chunk
+        // Days that exist already get the plannings at once.
+        const last_day_id = days.length ? days.last().id : void 0;
+        _.each(decode_plannings(chunk.plannings), function (planning) {
+            planning.person = persons.findWhere({ id: planning.person });
+            planning.ward = wards.findWhere({ id: planning.ward });
+            if (!planning.person || !planning.ward) return;
+            plannings.push(planning);
+            if (last_day_id === void 0 || planning.start > last_day_id)
+                return;
+            let day_id = planning.start;
+            while (day_id <= last_day_id && day_id <= planning.end) {
+                days.get(day_id).apply_planning(planning);
+                day_id = utils.get_next_day_id(day_id);
+            }
+            if (planning.end > last_day_id)
+                current_plannings.push(planning);
+        });
+    }
+
+    function load_plannings(month_id) {
+        // Load the plannings of all months until 'month_id' ("YYYYMM").
+        // Returns a promise that is resolved when they are applied.
+        function load_failed(jqXHR, textStatus, errorThrown) {
+            errors.add({
+                textStatus: textStatus,
+                errorThrown: errorThrown,
+                responseText: jqXHR.responseText,
+                url: '/plannings/' + month_id,
+            });
+        }
+        while (_plannings_month && _plannings_month < month_id) {
+            _plannings_month = utils.get_next_month_id(_plannings_month);
+            // the requests run in parallel, but are applied in order
+            const request = $.ajax({
+                type: "GET",
+                url: '/plannings/' + _plannings_month,
+                dataType: "json",
+            });
+            _plannings_loaded = _plannings_loaded.then(function () {
+                return request.then(add_plannings, load_failed);
+            });
+        }
+        return _plannings_loaded;
     }
 
 
@@ -859,7 +1026,8 @@ let models = (function ($, _, Backbone) {
             next_update_check = Math.min(
                 Math.max(last_change.time, _min_update_intervall),
                 _max_update_intervall);
-            _last_change_pk = last_change.pk;
+            // The cursor never moves back
+            _last_change_pk = Math.max(_last_change_pk || 0, last_change.pk);
         } else next_update_check = _max_update_intervall;
         window.clearTimeout(_next_check_id);
         _next_check_id = window.setTimeout(get_updates, next_update_check * 1000);
@@ -870,10 +1038,15 @@ let models = (function ($, _, Backbone) {
     }
 
     function get_updates() {
+        if (_change_stream && _change_stream.readyState == EventSource.OPEN) {
+            // Changes are pushed by the stream
+            current_date.update();
+            models.schedule_next_update();
+            return;
+        }
         $.ajax({
             type: "GET",
             url: '/updates/' + (_last_change_pk || 0),
-            cache: false,
             dataType: "json",
             contentType: "application/json; charset=utf-8",
             error: updates_failed,
@@ -882,6 +1055,26 @@ let models = (function ($, _, Backbone) {
         current_date.update();
     }
 
+    let _change_stream;
+    function start_change_stream(url) {
+        // Receive the changes as Server-Sent Events.
+        // Polling with get_updates stays as fallback.
+        if (!url || !window.EventSource)
+            return;
+        _change_stream = new EventSource(
+            url + '?last_change=' + (_last_change_pk || 0));
+        _change_stream.onmessage = function (event) {
+            process_changes(JSON.parse(event.data));
+        };
+        _change_stream.onerror = function () {
+            if (_change_stream.readyState == EventSource.CLOSED) {
+                // The stream is not available
+                _change_stream = undefined;
+                models.schedule_next_update();
+            }
+        };
+    }
+
     let errors = new Backbone.Collection();
 
     function reset_data() {
@@ -891,6 +1084,14 @@ let models = (function ($, _, Backbone) {
         nightshifts.reset(null);
         on_leave.reset(null);
         days.reset();
+        plannings = undefined;
+        current_plannings = [];
+        _plannings_month = undefined;
+        _plannings_loaded = $.when();
+        _last_change_pk = undefined;
+        _change_stream = undefined;
+        _pending_changes = [];
+        _batch_in_flight = false;
     }
 
     return {
@@ -917,14 +1118,20 @@ let models = (function ($, _, Backbone) {
         CallTally: CallTally,
         CallTallies: CallTallies,
         save_change: save_change,
+        save_change_batch: save_change_batch,
         process_changes: process_changes,
         save_approval: save_approval,
+        decode_plannings: decode_plannings,
+        decode_functions: decode_functions,
         set_plannings: set_plannings,
+        add_plannings: add_plannings,
+        load_plannings: load_plannings,
         apply_change: apply_change,
         redirect_to_login: redirect_to_login,
         errors: errors,
         reset_data: reset_data,
         user: user,
         schedule_next_update: schedule_next_update,
+        start_change_stream: start_change_stream,
     };
 })($, _, Backbone);
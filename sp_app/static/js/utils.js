@@ -2,27 +2,7 @@
 let utils = (function ($, _, Backbone) {
     "use strict";
 
-    let _holidays = [];
-    let _free_dates = {};
-    let _calculated_years = {};
-    const _easters = {
-        2014: new Date(2014, 3, 20),
-        2015: new Date(2015, 3, 5),
-        2016: new Date(2016, 2, 27),
-        2017: new Date(2017, 3, 16),
-        2018: new Date(2018, 3, 1),
-        2019: new Date(2019, 3, 21),
-        2020: new Date(2020, 3, 12),
-        2021: new Date(2021, 3, 4),
-        2022: new Date(2022, 3, 17),
-        2023: new Date(2023, 3, 9),
-        2024: new Date(2024, 2, 31),
-        2025: new Date(2025, 3, 20),
-        2026: new Date(2026, 3, 5),
-        2027: new Date(2027, 2, 28),
-        2028: new Date(2028, 3, 16),
-        2029: new Date(2029, 3, 1),
-    };
+    let _holidays = {};
 
     function is_free(date) {
         // date is a Javascript Date
@@ -31,33 +11,13 @@ let utils = (function ($, _, Backbone) {
         if (weekday === 6 || weekday === 0) {
             return true;
         }
-        if (!_calculated_years[date.getFullYear()])
-            calc_holidays(date.getFullYear());
-        return _free_dates[get_day_id(date)] || false;
-    }
-
-    function calc_holidays(year) {
-        _holidays.forEach(function (holiday) {
-            let day_id;
-            if (holiday.mode == 'abs') {
-                if (holiday.year && holiday.year != year)
-                    return;
-                day_id = get_day_id(year, holiday.month - 1, holiday.day);
-            } else {
-                let easter = _easters[year];
-                day_id = get_day_id(new Date(
-                    year, easter.getMonth(), easter.getDate() + holiday.day));
-            }
-            _free_dates[day_id] = holiday.name;
-        });
-        _calculated_years[year] = true;
+        return _holidays[get_day_id(date)] || false;
     }
 
     function set_holidays(holidays) {
-        // holidays is a list of models.CalculatedHoliday.toJson
+        // holidays is an Object {day_id: name} of the holidays,
+        // calculated by sp_app.holidays
         _holidays = holidays;
-        _free_dates = {};
-        _calculated_years = {};
     }
     const month_names = ["Januar", "Februar", "März", "April", "Mai", "Juni",
         "Juli", "August", "September", "Oktober", "November", "Dezember"];
@@ -576,11 +576,18 @@ let views = (function ($, _, Backbone) {
                 document.location = "/" + slug + "/" + period_id;
                 return;
             }
-            let view = views_coll.get_view({
-                start_id: period_id || utils.get_day_id(new Date()),
-                size: current_size,
+            const start_id = period_id || utils.get_day_id(new Date());
+            const month_id = start_id.slice(0, 6);
+            let that = this;
+            models.load_plannings(month_id).then(function () {
+                let view = views_coll.get_view({
+                    start_id: start_id,
+                    size: current_size,
+                });
+                that.make_current(view, nav_id);
+                // periods can reach into the next month
+                models.load_plannings(utils.get_next_month_id(month_id));
             });
-            this.make_current(view, nav_id);
         },
         make_current: function (view, nav_id) {
             // find current view and hide it
@@ -1,6 +1,6 @@
 // jshint esversion: 6
 describe("main", function () {
-    describe("initialize_site", function () {
+    describe("initialize_data", function () {
         beforeEach(function () {
             spyOn(models, "initialize_wards");
             spyOn(models.persons, "reset");
@@ -11,7 +11,7 @@ describe("main", function () {
             spyOn(Backbone.history, "start");
         });
         it("should initialize correctly", function () {
-            main.initialize_site({
+            main.initialize_data({
                 is_company_admin: false,
                 is_dep_lead: true,
                 is_editor: true,
@@ -20,6 +20,7 @@ describe("main", function () {
                 different_days: "different_days",
                 persons: "persons",
                 plannings: "plannings",
+                plannings_month: "202205",
                 holidays: "holidays",
                 data_month: 3,
                 data_year: 2022,
@@ -34,7 +35,8 @@ describe("main", function () {
             expect(models.initialize_wards).toHaveBeenCalledWith(
                 "wards", "different_days");
             expect(models.persons.reset).toHaveBeenCalledWith("persons");
-            expect(models.set_plannings).toHaveBeenCalledWith("plannings");
+            expect(models.set_plannings).toHaveBeenCalledWith(
+                "plannings", "202205");
             expect(utils.set_holidays).toHaveBeenCalledWith("holidays");
             expect(models.start_day_chain).toHaveBeenCalledWith(2022, 3);
             expect(models.schedule_next_update).toHaveBeenCalledWith({
@@ -44,4 +46,12 @@ describe("main", function () {
             expect(Backbone.history.start).toHaveBeenCalled();
         });
     });
+    describe("initialize_site", function () {
+        it("should load the master data", function () {
+            spyOn($, "ajax").and.returnValue($.Deferred().promise());
+            main.initialize_site({ master_data_url: "/master_data/202204/abc" });
+            expect($.ajax.calls.mostRecent().args[0].url).toEqual(
+                "/master_data/202204/abc");
+        });
+    });
 });
@@ -1017,5 +1017,250 @@ describe("models", function () {
                     data.last_change);
             });
         });
+        describe("changes from the response and the stream", function () {
+            const change = {
+                person: 'A', ward: 'A', action: 'add', pk: 14,
+                continued: false, day: "20150805"
+            };
+            const response = {
+                cls: [change],
+                last_change: { pk: 14, time: 0 },
+            };
+            let stream;
+            beforeEach(function () {
+                jasmine.clock().install();
+                window.EventSource = function (url) {
+                    stream = this;
+                    this.readyState = 1;
+                };
+                window.EventSource.OPEN = 1;
+                window.EventSource.CLOSED = 2;
+                spyOn($, "ajax").and.callFake(function (options) {
+                    options.success(response, "success", { status: 200 });
+                });
+                models.start_change_stream('/changes/stream');
+            });
+            afterEach(function () {
+                jasmine.clock().uninstall();
+                delete window.EventSource;
+                models.reset_data();
+            });
+            function deliver(data) {
+                stream.onmessage({ data: JSON.stringify(data) });
+            }
+            it("should apply a change only once", function () {
+                models.save_change(
+                    models.days.get('20150805'), models.wards.get('A'),
+                    false, [{ id: 'A', action: 'add' }]);
+                deliver(response);
+                test_staffing('20150805', ['A']);
+                expect(models.days.get('20150805')
+                    .ward_staffings.A.added_today).toEqual(['A']);
+            });
+            it("should not replay older changes", function () {
+                deliver({
+                    cls: [
+                        change,
+                        _.extend({}, change, { action: 'remove', pk: 15 }),
+                    ],
+                    last_change: { pk: 15, time: 0 },
+                });
+                test_staffing('20150805', []);
+                deliver(response);
+                test_staffing('20150805', []);
+            });
+        });
+        describe("save_change_batch", function () {
+            let requests;
+            beforeEach(function () {
+                jasmine.clock().install();
+                requests = [];
+                spyOn($, "ajax").and.callFake(function (options) {
+                    requests.push(options);
+                });
+            });
+            afterEach(function () {
+                jasmine.clock().uninstall();
+                models.reset_data();
+            });
+            function change(day_id, person) {
+                return {
+                    day: models.days.get(day_id), ward: models.wards.get('A'),
+                    continued: false,
+                    persons: [{ id: person, action: 'add' }],
+                };
+            }
+            function sent_days(request) {
+                return _.pluck(JSON.parse(request.data).changes, 'day');
+            }
+            function fail(request, status) {
+                request.error({ status: status }, "error", "");
+            }
+            function succeed(request) {
+                request.success(
+                    { cls: [], last_change: { pk: 1, time: 0 } },
+                    "success", { status: 200 });
+            }
+            it("should send the queued changes in one request", function () {
+                models.save_change_batch([change('20150803', 'A')]);
+                models.save_change_batch([change('20150804', 'A')]);
+                models.save_change_batch([
+                    change('20150805', 'A'), change('20150806', 'B')]);
+                expect(requests.length).toBe(1);
+                expect(requests[0].url).toBe('/changes/batch');
+                succeed(requests[0]);
+                expect(requests.length).toBe(2);
+                expect(requests[1].url).toBe('/changes/batch');
+                expect(sent_days(requests[1])).toEqual(
+                    ['20150804', '20150805', '20150806']);
+                succeed(requests[1]);
+                expect(requests.length).toBe(2);
+            });
+            it("should send a failed batch again before newer changes",
+                function () {
+                    models.save_change_batch([change('20150803', 'A')]);
+                    fail(requests[0], 0);
+                    models.save_change_batch([change('20150804', 'A')]);
+                    expect(requests.length).toBe(1);
+                    jasmine.clock().tick(5000);
+                    expect(requests.length).toBe(2);
+                    expect(sent_days(requests[1])).toEqual(
+                        ['20150803', '20150804']);
+                    fail(requests[1], 500);
+                    jasmine.clock().tick(5000);
+                    expect(requests.length).toBe(3);
+                    expect(sent_days(requests[2])).toEqual(
+                        ['20150803', '20150804']);
+                    succeed(requests[2]);
+                    jasmine.clock().tick(5000);
+                    expect(requests.length).toBe(3);
+                    expect(models.errors.length).toBe(0);
+                });
+            it("should report a rejected batch and not send it again",
+                function () {
+                    models.save_change_batch([change('20150803', 'A')]);
+                    models.save_change_batch([change('20150804', 'A')]);
+                    fail(requests[0], 400);
+                    expect(models.errors.length).toBe(1);
+                    expect(requests.length).toBe(2);
+                    expect(sent_days(requests[1])).toEqual(['20150804']);
+                    succeed(requests[1]);
+                    jasmine.clock().tick(5000);
+                    expect(requests.length).toBe(2);
+                    models.errors.reset();
+                });
+        });
+    });
+    describe("compact plan data", function () {
+        // Made by sp_app.encoding.compact_functions and compact_plannings
+        const persons_data = [
+            { id: 1, shortname: 'A', functions: '47', departments: [1] },
+            { id: 2, shortname: 'B', functions: '3', departments: [1] },
+            { id: 3, shortname: 'C', functions: '80', departments: [1] },
+            { id: 4, shortname: 'D', functions: '0', departments: [1] },
+        ];
+        const march = {
+            base: '20160301', person: [1, 2], ward: [1, 2],
+            start: [0, -5], end: [30, 1]
+        };
+        const april = {
+            base: '20160401', person: [2, 1], ward: [1, 3],
+            start: [0, 9], end: [4, 9]
+        };
+        const may = {
+            base: '20160501', person: [], ward: [], start: [], end: []
+        };
+        beforeEach(function () {
+            models.days.reset();
+            models.initialize_wards(_.map(wards_init, function (ward) {
+                return _.extend({}, ward, { id: parseInt(ward.id) });
+            }), different_days);
+            models.persons.reset(models.decode_functions(
+                _.map(persons_data, _.clone), wards_init));
+        });
+        afterEach(function () {
+            models.reset_data();
+        });
+        function test_staffing(day_id, ward, shortnames) {
+            expect(models.days.get(day_id).ward_staffings[ward]
+                .pluck('shortname')).toEqual(shortnames);
+        }
+        it("should decode the functions", function () {
+            expect(models.persons.get('A').get('functions'))
+                .toEqual(['A', 'B', 'N', 'O']);
+            expect(models.persons.get('B').get('functions'))
+                .toEqual(['A', 'B']);
+            // only a high bit
+            expect(models.persons.get('C').get('functions')).toEqual(['S']);
+            expect(models.persons.get('D').get('functions')).toEqual([]);
+        });
+        it("should keep functions that are not compact", function () {
+            const persons = [{ shortname: 'A', functions: ['A', 'S'] }];
+            expect(models.decode_functions(persons, wards_init)[0].functions)
+                .toEqual(['A', 'S']);
+        });
+        it("should decode the plannings", function () {
+            expect(models.decode_plannings(march)).toEqual([
+                { person: 1, ward: 1, start: '20160301', end: '20160331' },
+                { person: 2, ward: 2, start: '20160225', end: '20160302' },
+            ]);
+            expect(models.decode_plannings(may)).toEqual([]);
+        });
+        it("should keep plannings that are not compact", function () {
+            const plannings = [
+                { person: 1, ward: 1, start: '20160301', end: '20160331' }];
+            expect(models.decode_plannings(plannings)).toBe(plannings);
+        });
+        it("should add the plannings of the next month", function () {
+            models.set_plannings(march, '201603');
+            models.start_day_chain(2016, 2);
+            models.days.get_day(new Date(2016, 3, 2));
+            test_staffing('20160302', 'B', ['B']);
+            test_staffing('20160303', 'B', []);
+            test_staffing('20160402', 'A', []);
+            models.add_plannings({ month: '201604', plannings: april });
+            test_staffing('20160331', 'A', ['A']);
+            test_staffing('20160401', 'A', ['B']);
+            test_staffing('20160402', 'A', ['B']);
+            // The days after the last one continue the plannings
+            models.days.get_day(new Date(2016, 3, 10));
+            test_staffing('20160405', 'A', ['B']);
+            test_staffing('20160406', 'A', []);
+            test_staffing('20160409', 'N', []);
+            test_staffing('20160410', 'N', ['A']);
+            models.add_plannings({ month: '201605', plannings: may });
+            test_staffing('20160410', 'N', ['A']);
+        });
+        it("should load the months in order", function (done) {
+            const requests = {};
+            spyOn($, "ajax").and.callFake(function (options) {
+                requests[options.url] = $.Deferred();
+                return requests[options.url].promise();
+            });
+            models.set_plannings(march, '201603');
+            models.start_day_chain(2016, 2);
+            models.days.get_day(new Date(2016, 3, 30));
+            let loaded = false;
+            models.load_plannings('201605').then(function () {
+                loaded = true;
+            });
+            expect(_.keys(requests)).toEqual(
+                ['/plannings/201604', '/plannings/201605']);
+            requests['/plannings/201605'].resolve(
+                { month: '201605', plannings: may });
+            // jQuery calls the callbacks of 'then' asynchronously
+            setTimeout(function () {
+                expect(loaded).toBe(false);
+                requests['/plannings/201604'].resolve(
+                    { month: '201604', plannings: april });
+                // The months are loaded only once
+                models.load_plannings('201605').then(function () {
+                    expect(loaded).toBe(true);
+                    expect($.ajax).toHaveBeenCalledTimes(2);
+                    test_staffing('20160410', 'N', ['A']);
+                    done();
+                });
+            });
+        });
     });
 });
@@ -7,27 +7,13 @@ describe("utils", function () {
             expect(utils.is_free(new Date(2015, 7, 9))).toBe(true);  // Sunday
             expect(utils.is_free(new Date(2015, 7, 10))).toBe(false);  // Monday
         });
-        it("should identify special holidays", function () {
-            utils.set_holidays([
-                {
-                    name: 'Tag der deutschen Einheit',
-                    mode: 'abs',
-                    day: 3,
-                    month: 10
-                },  // absolute
-                {
-                    name: 'Reformationstag',
-                    mode: 'abs',
-                    day: 31,
-                    month: 10,
-                    year: 2017
-                },  // absolute, only once
-                {
-                    name: 'Himmelfahrt',
-                    mode: 'rel',
-                    day: 39
-                },  // relative
-            ]);
+        it("should identify the holidays", function () {
+            // The dates are calculated on the server (sp_app.holidays)
+            utils.set_holidays({
+                '20171003': 'Tag der deutschen Einheit',
+                '20170525': 'Himmelfahrt',
+                '20171031': 'Reformationstag',
+            });
             expect(utils.is_free(new Date(2017, 9, 3)))
                 .toEqual('Tag der deutschen Einheit');
             expect(utils.is_free(new Date(2017, 9, 4)))
@@ -38,6 +24,9 @@ describe("utils", function () {
                 .toEqual('Reformationstag');
             expect(utils.is_free(new Date(2018, 9, 31)))
                 .toBe(false);
+            // Weekends are free without being holidays
+            expect(utils.is_free(new Date(2017, 9, 7))).toBe(true);
+            utils.set_holidays({});
         });
     });
     describe("function get_next_month", function () {
@@ -1,6 +1,7 @@
 import pytest
 import logging
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from sp_app.models import (
     Company,
     Department,
@@ -19,6 +20,12 @@ def disable_logging():
     logging.disable(logging.CRITICAL)
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Cached data must not leak from one test into the next."""
+    cache.clear()
+
+
 # `db` is a pytest fixture that ensures that the Django database is set up
 @pytest.fixture
 def company(db):
@@ -11,6 +11,8 @@ from sp_app.models import (
     Person,
     Employee,
     DifferentDay,
+    Planning,
+    ChangeLogging,
     StatusEntry,
     FAR_FUTURE,
 )
@@ -51,6 +53,108 @@ class TestChangeApproval(ViewsWithPermissionTestCase):
         self.assertEqual(ward.approved, date(2017, 4, 14))
 
 
+class TestChangeBatch(ViewsWithPermissionTestCase):
+    def post_batch(self, changes):
+        return self.client.post(
+            reverse("change-batch"),
+            json.dumps({"changes": changes, "last_pk": 0}),
+            "text/json",
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+
+    def test_change_batch(self):
+        changes = [
+            {
+                "day": day,
+                "ward_id": self.ward_a.id,
+                "continued": False,
+                "persons": [{"id": self.person_a.id, "action": "add"}],
+            }
+            for day in ("20220502", "20220503", "20220504")
+        ]
+        changes.append(
+            {
+                "day": "20220502",
+                "ward_id": self.ward_b.id,
+                "continued": "20220504",
+                "persons": [{"id": self.person_b.id, "action": "add"}],
+            }
+        )
+        response = self.post_batch(changes)
+        assert response.status_code == 200
+        cls = json.loads(response.content)["cls"]
+        assert [(cl["day"], cl["ward"], cl["person"]) for cl in cls] == [
+            ("20220502", "A", "A"),
+            ("20220503", "A", "A"),
+            ("20220504", "A", "A"),
+            ("20220502", "B", "B"),
+        ]
+        assert Planning.objects.filter(ward=self.ward_a).count() == 3
+        assert Planning.objects.get(ward=self.ward_b).end == date(2022, 5, 4)
+
+    def test_atomic(self):
+        changes = [
+            {
+                "day": "20220502",
+                "ward_id": ward_id,
+                "continued": False,
+                "persons": [{"id": self.person_a.id, "action": "add"}],
+            }
+            for ward_id in (self.ward_a.id, 0)
+        ]
+        response = self.post_batch(changes)
+        assert response.status_code == 404
+        assert not Planning.objects.exists()
+        assert not ChangeLogging.objects.exists()
+
+
+class TestPlanningsChunk(LoggedInTestCase):
+    def setUp(self):
+        super().setUp()
+        for start, end in (
+            (date(2022, 4, 20), date(2022, 5, 3)),
+            (date(2022, 5, 10), FAR_FUTURE),
+            (date(2022, 6, 1), date(2022, 6, 1)),
+        ):
+            Planning.objects.create(
+                person=self.person_a, ward=self.ward_a, start=start, end=end
+            )
+
+    def get_chunk(self, month):
+        response = self.client.get(reverse("plannings", args=[month]))
+        assert response.status_code == 302
+        assert "no-cache" in response["Cache-Control"]
+        response = self.client.get(response["Location"])
+        assert response.status_code == 200
+        assert "immutable" in response["Cache-Control"]
+        return response
+
+    def test_plannings_start_in_month(self):
+        response = self.get_chunk("202205")
+        data = json.loads(response.content)
+        assert data["month"] == "202205"
+        assert [(p["start"], p["end"]) for p in data["plannings"]] == [
+            ("20220510", "20991231")
+        ]
+
+    def test_version_changes_with_content(self):
+        may_url = self.get_chunk("202205").request["PATH_INFO"]
+        url = self.get_chunk("202206").request["PATH_INFO"]
+        assert url == self.get_chunk("202206").request["PATH_INFO"]
+        Planning.objects.create(
+            person=self.person_b,
+            ward=self.ward_a,
+            start=date(2022, 6, 2),
+            end=date(2022, 6, 2),
+        )
+        response = self.client.get(url)
+        assert response.status_code == 302
+        new_url = self.get_chunk("202206").request["PATH_INFO"]
+        assert new_url != url
+        # other months keep their version
+        assert self.get_chunk("202205").request["PATH_INFO"] == may_url
+
+
 FORM_DATA = {
     Person: {
         "name": "Müller",
@@ -233,6 +337,53 @@ class TestPersonEditViews(LoggedInTestCase):
         assert person.company == self.company
 
 
+class TestSetupNotModified(LoggedInTestCase):
+    employee_level = "is_dep_lead"
+
+    def test_setup_persons(self):
+        url = reverse("setup_persons")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        # another pane has another ETag
+        response = self.client.get(
+            reverse("setup_wards"), HTTP_IF_NONE_MATCH=etag
+        )
+        assert response.status_code == 200
+
+        self.person_a.name = "Person A2"
+        self.person_a.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert b"Person A2" in response.content
+
+    def test_new_login_changes_setup(self):
+        """The setup page contains the CSRF token of the login"""
+        self.client.get("/setup/")
+        etag = self.client.get("/setup/")["ETag"]
+        response = self.client.get("/setup/", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        self.client.logout()
+        self.client.post(
+            "/login/", {"username": "user", "password": "password"}
+        )
+        response = self.client.get("/setup/", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+    def test_plan_change_keeps_setup(self):
+        url = reverse("setup_wards")
+        etag = self.client.get(url)["ETag"]
+        Planning.objects.create(
+            company=self.company,
+            person=self.person_a,
+            ward=self.ward_a,
+            start=date(2022, 5, 1),
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+
 class TestWardEditViews(LoggedInTestCase):
     employee_level = "is_dep_lead"
 
@@ -0,0 +1,141 @@
+import json
+from datetime import date
+
+import pytest
+from django.test import override_settings
+
+from sp_app.encoding import (
+    Raw,
+    RawList,
+    compact_functions,
+    compact_plannings,
+    encode,
+    get_dumps,
+    json_response,
+)
+from sp_app.logic import get_plan_data, get_plannings_chunk
+from sp_app.models import Planning
+from sp_app.tests.utils_for_tests import PopulatedTestCase
+
+
+@pytest.fixture(params=["", "sp_app.encoding._json_dumps"])
+def dumps(request):
+    """Test with the default encoder and with the fallback"""
+    get_dumps.cache_clear()
+    with override_settings(JSON_DUMPS=request.param):
+        yield get_dumps()
+    get_dumps.cache_clear()
+
+
+def test_encode(dumps):
+    data = {
+        "cls": RawList(['{"pk": 1}', '{"pk": 2}']),
+        "raw": Raw('{"a": [1, 2]}'),
+        "last_change": {"pk": 2, "time": 5},
+        "departments": {1: "Innere"},
+        "more": False,
+    }
+    assert json.loads(encode(data)) == {
+        "cls": [{"pk": 1}, {"pk": 2}],
+        "raw": {"a": [1, 2]},
+        "last_change": {"pk": 2, "time": 5},
+        "departments": {"1": "Innere"},
+        "more": False,
+    }
+
+
+def test_encode_empty(dumps):
+    assert encode({"cls": RawList()}) == b'{"cls":[]}'
+    assert json.loads(encode([1, "a"])) == [1, "a"]
+
+
+def test_json_response(dumps):
+    response = json_response({"a": Raw("[1]")}, status=201)
+    assert response.status_code == 201
+    assert response["Content-Type"] == "application/json"
+    assert json.loads(response.content) == {"a": [1]}
+
+
+class TestPlanningJson(PopulatedTestCase):
+    def test_stored_json(self):
+        planning = Planning.objects.create(
+            person=self.person_a, ward=self.ward_a, start=date(2022, 5, 1)
+        )
+        assert planning.get_json() == planning.json
+        assert json.loads(planning.get_json()) == planning.toJson()
+
+    def test_person_leaves(self):
+        Planning.objects.create(
+            person=self.person_a, ward=self.ward_a, start=date(2022, 5, 1)
+        )
+        self.person_a.end_date = date(2022, 5, 31)
+        self.person_a.save()
+        planning = Planning.objects.get(person=self.person_a)
+        assert json.loads(planning.get_json())["end"] == "20220531"
+
+    def test_end_is_limited(self):
+        self.person_a.end_date = date(2022, 5, 31)
+        self.person_a.save()
+        planning = Planning.objects.create(
+            person=self.person_a, ward=self.ward_a, start=date(2022, 5, 1)
+        )
+        assert planning.get_json() == planning.json
+        assert json.loads(planning.json)["end"] == "20220531"
+
+
+def test_compact_functions():
+    wards = [{"shortname": shortname} for shortname in "ABCDE"]
+    persons = [
+        {"functions": ["A", "C", "E"]},
+        {"functions": ["B", "X"]},
+        {"functions": []},
+    ]
+    compact_functions(persons, wards)
+    assert [p["functions"] for p in persons] == ["15", "2", "0"]
+
+
+class TestCompactPlanData(PopulatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.plannings = [
+            Planning.objects.create(
+                person=self.person_a,
+                ward=self.ward_a,
+                start=date(2022, 3, 30),
+                end=date(2022, 4, 2),
+            ),
+            Planning.objects.create(
+                person=self.person_b, ward=self.ward_b, start=date(2022, 4, 5)
+            ),
+        ]
+
+    def test_compact_plannings(self):
+        data = compact_plannings(self.plannings, date(2022, 4, 1))
+        assert data == {
+            "base": "20220401",
+            "person": [self.person_a.id, self.person_b.id],
+            "ward": [self.ward_a.id, self.ward_b.id],
+            "start": [-2, 4],
+            "end": [1, (date(2099, 12, 31) - date(2022, 4, 1)).days],
+        }
+
+    def test_plan_data(self):
+        with override_settings(COMPACT_PLAN_DATA=True):
+            plan_data = get_plan_data(
+                department_ids=[self.department.id],
+                company_id=self.company.id,
+                month="202205",
+            )
+        plannings = json.loads(plan_data["data"])["plannings"]
+        assert plannings["base"] == "20220401"
+        assert sorted(plannings["start"]) == [-2, 4]
+
+    def test_plannings_chunk(self):
+        with override_settings(COMPACT_PLAN_DATA=True):
+            chunk, _ = get_plannings_chunk(
+                self.company.id, [self.department.id], "202204"
+            )
+        plannings = json.loads(chunk)["plannings"]
+        assert plannings["base"] == "20220401"
+        assert plannings["person"] == [self.person_b.id]
+        assert plannings["start"] == [4]
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from sp_app.events import change_stream
+from sp_app.logic import apply_changes, get_cached_last_change_pk
+from sp_app.tests.utils_for_tests import LoggedInTestCase
+
+
+# Closing the connection would end the transaction of the test
+@patch("sp_app.events.close_old_connections", lambda: None)
+class TestChangeStream(LoggedInTestCase):
+    """Test the stream of changes"""
+
+    def apply_change(self, day, action="add"):
+        return apply_changes(
+            self.user,
+            self.company.id,
+            day,
+            self.ward_a.id,
+            False,
+            [{"id": self.person_a.id, "action": action}],
+        )
+
+    def get_stream(self, headers=(), query_string=b"", cookie=True):
+        """Return the messages sent by the stream until the first event"""
+        if cookie:
+            session_key = self.client.cookies[settings.SESSION_COOKIE_NAME]
+            cookie_header = (
+                f"{settings.SESSION_COOKIE_NAME}={session_key.value}"
+            )
+            headers = list(headers) + [(b"cookie", cookie_header.encode())]
+        scope = {
+            "type": "http",
+            "path": settings.CHANGE_STREAM_URL,
+            "headers": list(headers),
+            "query_string": query_string,
+        }
+        messages = []
+
+        async def run():
+            event_sent = asyncio.Event()
+
+            async def receive():
+                await event_sent.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                messages.append(message)
+                if message.get("body", b"").startswith(b"id:"):
+                    event_sent.set()
+
+            with patch("sp_app.events.MAX_DURATION", 0.3), patch(
+                "sp_app.events.CHECK_INTERVAL", 0.1
+            ):
+                await change_stream(scope, receive, send)
+
+        async_to_sync(run)()
+        return messages
+
+    def get_events(self, messages):
+        events = []
+        for message in messages[1:]:
+            body = message.get("body", b"").decode()
+            if body.startswith("id:"):
+                id_line, data_line = body.strip().split("\n")
+                events.append((int(id_line[4:]), json.loads(data_line[6:])))
+        return events
+
+    def test_forbidden(self):
+        messages = self.get_stream(cookie=False)
+        assert messages[0]["status"] == 403
+
+    def test_changes_since_cursor(self):
+        first_pk = self.apply_change("20160120")[0]["pk"]
+        last_pk = self.apply_change("20160121")[0]["pk"]
+        messages = self.get_stream(
+            query_string=f"last_change={first_pk}".encode()
+        )
+        assert messages[0]["status"] == 200
+        assert messages[0]["headers"][0] == (
+            b"content-type",
+            b"text/event-stream",
+        )
+        events = self.get_events(messages)
+        assert len(events) == 1
+        event_id, data = events[0]
+        assert event_id == last_pk
+        assert data["last_change"]["pk"] == last_pk
+        assert [cl["pk"] for cl in data["cls"]] == [last_pk]
+
+    def test_resume_with_last_event_id(self):
+        first_pk = self.apply_change("20160120")[0]["pk"]
+        second_pk = self.apply_change("20160121")[0]["pk"]
+        last_pk = self.apply_change("20160122")[0]["pk"]
+        messages = self.get_stream(
+            headers=[(b"last-event-id", str(second_pk).encode())],
+            query_string=f"last_change={first_pk}".encode(),
+        )
+        events = self.get_events(messages)
+        assert [cl["pk"] for cl in events[0][1]["cls"]] == [last_pk]
+
+    def test_no_changes(self):
+        last_pk = self.apply_change("20160120")[0]["pk"]
+        messages = self.get_stream(
+            query_string=f"last_change={last_pk}".encode()
+        )
+        assert messages[0]["status"] == 200
+        assert self.get_events(messages) == []
+        assert messages[-1] == {"type": "http.response.body", "body": b""}
+
+    def test_cache_lookup_off_the_sync_thread(self):
+        threads = set()
+
+        def lookup(company_id):
+            threads.add(threading.current_thread())
+            return get_cached_last_change_pk(company_id)
+
+        with patch("sp_app.events.get_cached_last_change_pk", lookup):
+            self.get_stream()
+        assert threads
+        # The synchronous calls of the test run in the current thread
+        assert threading.current_thread() not in threads
@@ -0,0 +1,89 @@
+from datetime import date
+
+import pytest
+
+from sp_app.holidays import easter, get_company_holidays, get_region_holidays
+from sp_app.models import CalculatedHoliday, Region
+from sp_app.tests.utils_for_tests import PopulatedTestCase
+
+
+@pytest.mark.parametrize(
+    "easter_sunday",
+    [
+        date(1961, 4, 2),
+        date(2008, 3, 23),
+        date(2016, 3, 27),
+        date(2019, 4, 21),
+        date(2024, 3, 31),
+        date(2029, 4, 1),
+        date(2038, 4, 25),
+        date(2285, 3, 22),
+    ],
+)
+def test_easter(easter_sunday):
+    assert easter(easter_sunday.year) == easter_sunday
+
+
+class TestHolidays(PopulatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.region = Region.objects.create(name="Testregion", shortname="T")
+        self.region.calc_holidays.add(
+            CalculatedHoliday.objects.create(
+                name="Weihnachten", mode="abs", day=25, month=12
+            ),
+            CalculatedHoliday.objects.create(
+                name="Karfreitag", mode="rel", day=-2
+            ),
+            CalculatedHoliday.objects.create(
+                name="Jubiläum", mode="abs", day=31, month=10, year=2017
+            ),
+        )
+        CalculatedHoliday.objects.create(
+            name="Dreikönig", mode="abs", day=6, month=1
+        )
+        self.company.region = self.region
+        self.company.save()
+
+    def test_region_holidays(self):
+        assert get_region_holidays(self.region.id, 2017) == {
+            date(2017, 4, 14): "Karfreitag",
+            date(2017, 10, 31): "Jubiläum",
+            date(2017, 12, 25): "Weihnachten",
+        }
+        assert date(2018, 10, 31) not in get_region_holidays(
+            self.region.id, 2018
+        )
+
+    def test_cached(self):
+        get_region_holidays(self.region.id, 2017)
+        with self.assertNumQueries(0):
+            get_region_holidays(self.region.id, 2017)
+
+    def test_invalidated(self):
+        assert date(2017, 1, 6) not in get_region_holidays(
+            self.region.id, 2017
+        )
+        self.region.calc_holidays.add(
+            CalculatedHoliday.objects.get(name="Dreikönig")
+        )
+        assert date(2017, 1, 6) in get_region_holidays(self.region.id, 2017)
+
+    def test_company_holidays(self):
+        holidays = get_company_holidays(
+            self.company.id, date(2017, 12, 1), date(2018, 4, 30)
+        )
+        assert holidays == {
+            date(2017, 12, 25): "Weihnachten",
+            date(2018, 3, 30): "Karfreitag",
+        }
+
+    def test_company_without_region(self):
+        self.company.region = None
+        self.company.save()
+        assert (
+            get_company_holidays(
+                self.company.id, date(2017, 1, 1), date(2017, 12, 31)
+            )
+            == {}
+        )
@@ -0,0 +1,73 @@
+from datetime import date
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from sp_app.hospital_data import generate_hospital
+from sp_app.models import ChangeLogging, Company, Planning
+
+
+def snapshot(company):
+    return (
+        sorted(
+            company.persons.values_list(
+                "shortname", "name", "start_date", "end_date"
+            )
+        ),
+        sorted(
+            Planning.objects.filter(
+                company=company, superseded_by=None
+            ).values_list(
+                "person__shortname", "ward__shortname", "start", "end"
+            )
+        ),
+    )
+
+
+@pytest.mark.django_db
+def test_generate_hospital():
+    company = generate_hospital(
+        "Klinik", "kl", date(2022, 1, 1), years=1, departments=1, persons=12
+    )
+    assert company.departments.count() == 1
+    assert company.persons.count() == 12
+    assert company.region.calc_holidays.count() >= 9
+    nightshift = company.wards.get(shortname="Inn-N")
+    assert nightshift.callshift
+    assert set(nightshift.after_this.values_list("shortname", flat=True)) == {
+        "Inn-Frei",
+        "Inn-U",
+    }
+    # One nightshift per day
+    nights = Planning.objects.filter(ward=nightshift, superseded_by=None)
+    assert 300 < sum((pl.end - pl.start).days + 1 for pl in nights) <= 365
+    assert ChangeLogging.objects.filter(company=company, added=False).exists()
+    assert company.employees.filter(user__username="kl-edit").exists()
+
+
+@pytest.mark.django_db
+def test_deterministic():
+    snapshots = []
+    for _ in range(2):
+        company = generate_hospital(
+            "Klinik", "kl", date(2022, 1, 1), years=1, departments=1, persons=8
+        )
+        snapshots.append(snapshot(company))
+        company.delete()
+        company.region.delete()
+        User.objects.filter(username__startswith="kl-").delete()
+    assert snapshots[0] == snapshots[1]
+
+
+@pytest.mark.django_db
+def test_command():
+    out = StringIO()
+    args = ["--departments=1", "--persons=6", "--years=1", "--start=202201"]
+    call_command("generate_hospital", *args, "--seed=3", stdout=out)
+    assert out.getvalue().startswith("Klinikum gen3-1: 6 persons")
+    assert Company.objects.get(shortname="gen3-1").planning_set.exists()
+    with pytest.raises(CommandError):
+        call_command("generate_hospital", *args, "--seed=3", stdout=out)
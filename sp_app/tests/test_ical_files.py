@@ -0,0 +1,139 @@
+import io
+import tempfile
+from datetime import date
+from pathlib import Path
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from sp_app.ical_files import write_feed_files
+from sp_app.logic import apply_changes, set_approved
+from sp_app.models import FeedId, Planning, Ward
+from sp_app.tests.utils_for_tests import PopulatedTestCase
+
+
+class TestFeedFiles(PopulatedTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.root = Path(tmp_dir.name)
+        settings = override_settings(ICAL_FEED_ROOT=str(self.root))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.nightshift = Ward.objects.create(
+            name="Nightshift",
+            shortname="N",
+            min=0,
+            max=5,
+            company=self.company,
+            in_ical_feed=True,
+        )
+        FeedId.objects.create(uid="abc", person=self.person_a)
+
+    def test_write_feed_files(self):
+        FeedId.objects.create(uid="old", person=self.person_b, active=False)
+        FeedId.objects.create(uid="b1", person=self.person_b)
+        FeedId.objects.create(uid="b2", person=self.person_b)
+        (self.root / "old").write_bytes(b"outdated")
+        assert write_feed_files() == {"abc"}
+        assert b"BEGIN:VCALENDAR" in (self.root / "abc").read_bytes()
+        # The first use of b2 has to reach DienstFeed
+        assert not (self.root / "b2").exists()
+        assert not (self.root / "old").exists()
+
+    def test_written_after_changes(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            apply_changes(
+                self.user,
+                self.company.id,
+                date.today().strftime("%Y%m%d"),
+                self.nightshift.id,
+                False,
+                [{"id": self.person_a.id, "action": "add"}],
+            )
+            # Not before the commit
+            assert not (self.root / "abc").exists()
+        for callback in callbacks:
+            callback()
+        assert b"Nightshift" in (self.root / "abc").read_bytes()
+
+    def test_limited_number_written_after_changes(self):
+        FeedId.objects.create(uid="b1", person=self.person_b)
+        (self.root / "b1").write_bytes(b"outdated")
+        with patch("sp_app.ical_files.FEED_FILES_PER_REQUEST", 1):
+            with self.captureOnCommitCallbacks(execute=True):
+                apply_changes(
+                    self.user,
+                    self.company.id,
+                    date.today().strftime("%Y%m%d"),
+                    self.nightshift.id,
+                    False,
+                    [
+                        {"id": self.person_a.id, "action": "add"},
+                        {"id": self.person_b.id, "action": "add"},
+                    ],
+                )
+        assert b"Nightshift" in (self.root / "abc").read_bytes()
+        # DienstFeed delivers the other feeds until the next full run
+        assert not (self.root / "b1").exists()
+
+    def test_command(self):
+        Planning.objects.create(
+            person=self.person_a, ward=self.nightshift, start=date.today()
+        )
+        (self.root / "deleted00000").write_bytes(b"outdated")
+        # Other files in the directory are kept
+        (self.root / ".htaccess").write_bytes(b"")
+        (self.root / "index.html").write_bytes(b"")
+        out = io.StringIO()
+        call_command("write_ical_files", stdout=out)
+        assert out.getvalue() == "1 feeds written\n"
+        assert sorted(path.name for path in self.root.iterdir()) == [
+            ".htaccess",
+            "abc",
+            "index.html",
+        ]
+        assert b"Nightshift" in (self.root / "abc").read_bytes()
+
+    def test_removed_with_second_feed_id(self):
+        write_feed_files()
+        FeedId.objects.create(uid="new", person=self.person_a)
+        assert not (self.root / "abc").exists()
+
+    def test_removed_when_inactivated(self):
+        write_feed_files()
+        feed_id = FeedId.objects.get(uid="abc")
+        feed_id.active = False
+        feed_id.save()
+        assert not (self.root / "abc").exists()
+
+    def test_removed_when_deleted(self):
+        write_feed_files()
+        FeedId.objects.get(uid="abc").delete()
+        assert not (self.root / "abc").exists()
+
+    def test_older_feeds_inactivated(self):
+        new = FeedId.objects.create(uid="new", person=self.person_a)
+        (self.root / "abc").write_bytes(b"outdated")
+        self.person_a.inactivate_older_feeds(new.uid)
+        assert not FeedId.objects.get(uid="abc").active
+        assert not (self.root / "abc").exists()
+
+    def test_written_after_approval_in_feed_period(self):
+        self.nightshift.departments.add(self.department)
+        FeedId.objects.create(uid="b1", person=self.person_b)
+        Planning.objects.create(
+            person=self.person_a, ward=self.nightshift, start=date.today()
+        )
+        Planning.objects.create(
+            person=self.person_b,
+            ward=self.nightshift,
+            start=date(2016, 4, 1),
+            end=date(2016, 4, 1),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            set_approved(["N"], False, [self.department.id])
+        assert (self.root / "abc").exists()
+        assert not (self.root / "b1").exists()
@@ -1,9 +1,12 @@
 from datetime import date
+from unittest.mock import patch
+
 from django.core import mail
 from django.urls import reverse
 from icalendar import Calendar
 
-from sp_app.models import Ward, Planning, FeedId
+from sp_app.caching import get_master_data_version
+from sp_app.models import Ward, Planning, FeedId, WardsFeed
 from sp_app.tests.utils_for_tests import PopulatedTestCase, LoggedInTestCase
 from sp_app.logic import set_approved
 from sp_app.ical_views import DienstFeed
@@ -14,6 +17,12 @@ class TestDienstFeed(PopulatedTestCase):
 
     def setUp(self):
         super().setUp()
+        this_month = patch(
+            "sp_app.ical_views.get_first_of_month",
+            return_value=date(2022, 5, 1),
+        )
+        this_month.start()
+        self.addCleanup(this_month.stop)
         FeedId.objects.create(uid="abc", person=self.person_a)
         self.nightshift = Ward.objects.create(
             name="Nightshift",
@@ -50,6 +59,104 @@ class TestDienstFeed(PopulatedTestCase):
             assert str(ev.decoded("dtstart")) == day
             assert str(ev.decoded("dtend")) == day
 
+    def test_feed_not_modified(self):
+        self.plan_shift(self.person_a, date(2022, 5, 13))
+        url = reverse("icalfeed", args=["abc"])
+        response = self.client.get(url)
+        etag = response["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+        self.plan_shift(self.person_a, date(2022, 5, 14))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+
+    def test_feed_cached(self):
+        self.plan_shift(self.person_a, date(2022, 5, 13))
+        url = reverse("icalfeed", args=["abc"])
+        content = self.client.get(url).content
+        with self.assertNumQueries(1):
+            # Only the person
+            assert self.client.get(url).content == content
+
+    def test_older_feeds_inactivated_on_first_use(self):
+        FeedId.objects.create(uid="new", person=self.person_a)
+        old_url = reverse("icalfeed", args=["abc"])
+        new_url = reverse("icalfeed", args=["new"])
+        assert self.client.get(old_url).status_code == 200
+        self.client.get(new_url)
+        assert not FeedId.objects.get(uid="abc").active
+        assert self.client.get(old_url).status_code == 404
+        with self.assertNumQueries(1):
+            # No writes
+            self.client.get(new_url)
+
+    def test_feed_invalidation(self):
+        self.plan_shift(self.person_a, date(2022, 5, 13))
+        url = reverse("icalfeed", args=["abc"])
+        etag = self.client.get(url)["ETag"]
+        # Other persons do not change the feed
+        self.plan_shift(self.person_b, date(2022, 5, 14))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        # The feed is not shown any more
+        self.nightshift.in_ical_feed = False
+        self.nightshift.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert b"VEVENT" not in response.content
+
+    def test_rename_invalidates(self):
+        self.plan_shift(self.person_a, date(2022, 5, 13))
+        url = reverse("icalfeed", args=["abc"])
+        self.client.get(url)
+        self.nightshift.name = "Night duty"
+        self.nightshift.save()
+        assert b"Night duty" in self.client.get(url).content
+
+    def test_approval_invalidates(self):
+        self.plan_shift(self.person_a, date(2022, 6, 15))
+        self.nightshift.departments.add(self.department)
+        url = reverse("icalfeed", args=["abc"])
+        assert b"VEVENT" in self.client.get(url).content
+        set_approved(["N"], "20220601", [self.department.id])
+        assert b"VEVENT" not in self.client.get(url).content
+
+    def test_feed_window(self):
+        for day in (
+            date(2022, 1, 31),
+            date(2022, 2, 1),
+            date(2023, 5, 31),
+            date(2023, 6, 1),
+        ):
+            self.plan_shift(self.person_a, day)
+        plannings = DienstFeed().items(self.person_a)
+        assert [p.start for p in plannings] == [
+            date(2023, 5, 31),
+            date(2022, 2, 1),
+        ]
+
+    def test_feed_coalesced(self):
+        for day in (
+            date(2022, 5, 13),
+            date(2022, 5, 14),
+            date(2022, 5, 16),
+        ):
+            self.plan_shift(self.person_a, day)
+        Planning.objects.create(
+            person=self.person_a,
+            ward=self.nightshift,
+            start=date(2022, 5, 15),
+            end=date(2022, 5, 20),
+        )
+        self.plan_shift(self.person_a, date(2022, 5, 22))
+        plannings = DienstFeed().items(self.person_a)
+        assert [(p.start, p.end) for p in plannings] == [
+            (date(2022, 5, 22), date(2022, 5, 22)),
+            (date(2022, 5, 13), date(2022, 5, 20)),
+        ]
+
     def test_feed_items(self):
         for person, day in (
             (self.person_a, date(2022, 5, 13)),
@@ -64,6 +171,91 @@ class TestDienstFeed(PopulatedTestCase):
         assert plannings[0].start == date(2022, 5, 13)
 
 
+class TestWardsFeed(TestDienstFeed):
+    """Test the ical feed of wards"""
+
+    def setUp(self):
+        super().setUp()
+        self.callshifts = WardsFeed.objects.create(
+            name="Dienste", company=self.company
+        )
+        self.callshifts.wards.add(self.nightshift)
+        self.url = reverse("wards-icalfeed", args=[self.callshifts.uid])
+
+    def get_events(self):
+        response = self.client.get(self.url)
+        cal = Calendar.from_ical(response.content)
+        return [
+            (str(ev.get("summary")), ev.decoded("dtstart"))
+            for ev in cal.walk()
+            if ev.name == "VEVENT"
+        ]
+
+    def test_wards_feed(self):
+        self.plan_shift(self.person_a, date(2022, 5, 13))
+        self.plan_shift(self.person_b, date(2022, 5, 14))
+        self.plan_shift(self.person_a, date(2022, 5, 14))
+        Planning.objects.create(
+            person=self.person_a, ward=self.ward_a, start=date(2022, 5, 1)
+        )
+        with self.assertNumQueries(3):
+            # The site, the feed and the plannings
+            events = self.get_events()
+        # Newest first, the shifts of Person A are merged
+        assert events == [
+            ("Nightshift: Person B", date(2022, 5, 14)),
+            ("Nightshift: Person A", date(2022, 5, 13)),
+        ]
+
+    def test_department_wards(self):
+        feed = WardsFeed.objects.create(
+            name="Abteilung", company=self.company, department=self.department
+        )
+        feed.wards.add(self.nightshift)
+        assert set(feed.get_wards()) == {
+            self.ward_a,
+            self.ward_b,
+            self.nightshift,
+        }
+        assert feed.get_wards().count() == 3
+
+    def test_cached_until_change(self):
+        self.plan_shift(self.person_a, date(2022, 5, 13))
+        assert len(self.get_events()) == 1
+        with self.assertNumQueries(1):
+            assert len(self.get_events()) == 1
+        self.plan_shift(self.person_b, date(2022, 5, 16))
+        assert len(self.get_events()) == 2
+
+    def test_approval(self):
+        self.plan_shift(self.person_a, date(2022, 6, 15))
+        self.nightshift.departments.add(self.department)
+        assert len(self.get_events()) == 1
+        set_approved(["N"], "20220601", [self.department.id])
+        assert self.get_events() == []
+
+    def test_changed_wards(self):
+        self.plan_shift(self.person_a, date(2022, 5, 13))
+        Planning.objects.create(
+            person=self.person_b, ward=self.ward_a, start=date(2022, 5, 1)
+        )
+        self.ward_a.in_ical_feed = True
+        self.ward_a.save()
+        assert len(self.get_events()) == 1
+        master_data_version = get_master_data_version(self.company.id)
+        self.callshifts.wards.add(self.ward_a)
+        assert len(self.get_events()) == 2
+        self.ward_a.feeds.clear()
+        assert len(self.get_events()) == 1
+        # The plan data of the company stay valid
+        assert get_master_data_version(self.company.id) == master_data_version
+
+    def test_inactive(self):
+        self.callshifts.active = False
+        self.callshifts.save()
+        assert self.client.get(self.url).status_code == 404
+
+
 class TestMailFeed(LoggedInTestCase):
     """Test the mailing of the ical feed"""
 
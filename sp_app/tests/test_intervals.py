@@ -0,0 +1,242 @@
+import json
+import random
+from datetime import date, timedelta
+
+from sp_app.intervals import (
+    FAR_FUTURE,
+    ONE_DAY,
+    Change,
+    Interval,
+    coalesce,
+    is_effective,
+    weave,
+)
+from sp_app.models import ChangeLogging, Planning, process_change
+from sp_app.tests.utils_for_tests import PopulatedTestCase
+
+day_10 = date(2016, 3, 10)
+day_12 = date(2016, 3, 12)
+day_14 = date(2016, 3, 14)
+
+
+def bounds(intervals):
+    return [(interval.start, interval.end) for interval in intervals]
+
+
+def test_add_to_empty_timeline():
+    weaving = weave([], Change(day_10, True, True, None))
+    assert bounds(weaving.inserts) == [(day_10, FAR_FUTURE)]
+    assert weaving.updates == weaving.deletes == weaving.superseded == []
+    assert weaving.timeline == weaving.inserts
+
+
+def test_add_is_limited_by_last_day():
+    weaving = weave([], Change(day_10, True, True, None), last_day=day_14)
+    assert bounds(weaving.inserts) == [(day_10, day_14)]
+
+
+def test_add_contained():
+    timeline = [Interval(day_10, FAR_FUTURE, "a")]
+    weaving = weave(timeline, Change(day_12, True, False, None))
+    assert not is_effective(weaving)
+    assert weaving.timeline == timeline
+
+
+def test_add_until_supersedes():
+    timeline = [Interval(day_12, day_12, "a"), Interval(day_14, day_14, "b")]
+    weaving = weave(timeline, Change(day_10, True, True, day_14))
+    assert bounds(weaving.inserts) == [(day_10, day_14)]
+    assert weaving.superseded == ["a", "b"]
+    assert weaving.until == day_14
+
+
+def test_add_until_is_shortened():
+    timeline = [Interval(day_12, FAR_FUTURE, "a")]
+    weaving = weave(timeline, Change(day_10, True, True, day_14))
+    assert weaving.until == day_12 - ONE_DAY
+    assert bounds(weaving.inserts) == [(day_10, day_12 - ONE_DAY)]
+    assert weaving.superseded == []
+
+
+def test_remove_one_day_splits():
+    timeline = [Interval(day_10, FAR_FUTURE, "a")]
+    weaving = weave(timeline, Change(day_12, False, False, None))
+    assert bounds(weaving.inserts) == [(day_12 + ONE_DAY, FAR_FUTURE)]
+    assert weaving.updates == [Interval(day_10, day_12 - ONE_DAY, "a")]
+    assert bounds(weaving.timeline) == [
+        (day_10, day_12 - ONE_DAY),
+        (day_12 + ONE_DAY, FAR_FUTURE),
+    ]
+
+
+def test_remove_continued_deletes():
+    timeline = [Interval(day_10, day_12, "a"), Interval(day_14, day_14, "b")]
+    weaving = weave(timeline, Change(day_10, False, True, None))
+    assert weaving.deletes == ["a"]
+    assert bounds(weaving.timeline) == [(day_14, day_14)]
+
+
+def test_coalesce():
+    intervals = [
+        Interval(day_14, day_14, "c"),
+        Interval(day_10, day_12, "a"),
+        Interval(day_12 + ONE_DAY, day_12 + ONE_DAY, "b"),
+        Interval(date(2016, 3, 20), FAR_FUTURE, "d"),
+        Interval(date(2016, 3, 21), date(2016, 3, 22), "e"),
+    ]
+    assert coalesce(intervals) == [
+        Interval(day_10, day_14, "a"),
+        Interval(date(2016, 3, 20), FAR_FUTURE, "d"),
+    ]
+
+
+def legacy_process_change(cl):
+    """process_change as it was before the interval engine"""
+    plannings = Planning.objects.filter(
+        person_id=cl.person_id, ward_id=cl.ward_id
+    )
+    pl_data = dict(person_id=cl.person_id, ward_id=cl.ward_id)
+    if cl.added:
+        if cl.continued:
+            end = cl.until or FAR_FUTURE
+            plannings = list(
+                plannings.filter(
+                    end__gte=cl.day,
+                    start__lte=end,
+                ).order_by("start")
+            )
+            if len(plannings):
+                if cl.until:
+                    last_planning = plannings[-1]
+                    if cl.until < last_planning.end:
+                        end = cl.until = last_planning.start - ONE_DAY
+                        cl.save()
+                        plannings.pop()
+                else:
+                    end = plannings[0].start - ONE_DAY
+                if cl.day > end:
+                    return {}
+            pl = Planning.objects.create(start=cl.day, end=end, **pl_data)
+            if cl.until and len(plannings) > 0:
+                Planning.objects.filter(
+                    id__in=[_pl.id for _pl in plannings]
+                ).update(superseded_by=pl)
+        else:
+            plannings = plannings.filter(start__lte=cl.day, end__gte=cl.day)
+            if len(plannings) == 0:
+                Planning.objects.create(start=cl.day, end=cl.day, **pl_data)
+            else:
+                return {}
+    else:
+        plannings = plannings.filter(
+            start__lte=cl.until or cl.day, end__gte=cl.day
+        ).order_by("start")
+        if len(plannings) == 0:
+            return {}
+        if cl.continued:
+            if cl.until:
+                for pl in plannings:
+                    if pl.start < cl.day:
+                        if pl.end > cl.until:
+                            Planning.objects.create(
+                                start=cl.until + ONE_DAY, end=pl.end, **pl_data
+                            )
+                        pl.end = cl.day - ONE_DAY
+                        pl.save()
+                    elif pl.end > cl.until:
+                        pl.start = cl.until + ONE_DAY
+                        pl.save()
+                    else:
+                        pl.delete()
+            else:
+                for pl in plannings:
+                    if pl.start == cl.day:
+                        pl.delete()
+                    else:
+                        pl.end = cl.day - ONE_DAY
+                        pl.save()
+        else:
+            for pl in plannings:
+                if pl.start == pl.end:
+                    pl.delete()
+                elif pl.start == cl.day:
+                    pl.start = cl.day + ONE_DAY
+                    pl.save()
+                else:
+                    if not pl.end == cl.day:
+                        Planning.objects.create(
+                            start=cl.day + ONE_DAY, end=pl.end, **pl_data
+                        )
+                    pl.end = cl.day - ONE_DAY
+                    pl.save()
+
+    return json.loads(cl.json)
+
+
+class TestWeaveLikeBefore(PopulatedTestCase):
+    """Random sequences of changes give the same Plannings
+    as the former implementation of process_change
+    """
+
+    first_day = date(2016, 3, 1)
+
+    def random_change(self, rnd):
+        day = self.first_day + timedelta(rnd.randrange(20))
+        continued = rnd.random() < 0.6
+        until = None
+        if continued and rnd.random() < 0.5:
+            until = day + timedelta(rnd.randrange(10))
+        return dict(
+            day=day, added=rnd.random() < 0.6, continued=continued, until=until
+        )
+
+    def timeline(self, person):
+        return sorted(
+            (pl.start, pl.end, pl.superseded_by_id is not None)
+            for pl in Planning.objects.filter(person=person)
+        )
+
+    def test_random_changes(self):
+        rnd = random.Random(20160310)
+        for run in range(80):
+            Planning.objects.all().delete()
+            end_date = rnd.choice(
+                [FAR_FUTURE, self.first_day + timedelta(rnd.randrange(25))]
+            )
+            for person in (self.person_a, self.person_b):
+                person.end_date = end_date
+                person.save()
+            changes = [
+                self.random_change(rnd) for _ in range(rnd.randrange(1, 7))
+            ]
+            for change in changes:
+                results = []
+                for person, process in (
+                    (self.person_a, legacy_process_change),
+                    (self.person_b, process_change),
+                ):
+                    cl = ChangeLogging.objects.create(
+                        user=self.user,
+                        person=person,
+                        ward=self.ward_a,
+                        company=self.company,
+                        **change,
+                    )
+                    result = process(cl)
+                    cl.refresh_from_db()
+                    results.append(
+                        (
+                            cl.until,
+                            {
+                                key: value
+                                for key, value in result.items()
+                                if key not in ("pk", "person")
+                            },
+                        )
+                    )
+                self.assertEqual(results[0], results[1], (run, changes))
+            self.assertEqual(
+                self.timeline(self.person_a),
+                self.timeline(self.person_b),
+                (run, changes),
+            )
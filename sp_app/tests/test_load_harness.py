@@ -0,0 +1,87 @@
+from datetime import date
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import LiveServerTestCase, RequestFactory, override_settings
+
+from sp_app.hospital_data import generate_hospital
+from sp_app.load_harness import (
+    Harness,
+    next_update_delay,
+    percentile,
+)
+from sp_app.middleware import query_count_middleware
+from sp_app.models import FeedId, Person
+
+
+def test_next_update_delay():
+    assert next_update_delay(None) == 120
+    assert next_update_delay({"pk": 1, "time": 3}) == 10
+    assert next_update_delay({"pk": 1, "time": 50}) == 50
+    assert next_update_delay({"pk": 1, "time": 5000}) == 120
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 90) == 7
+
+
+def test_query_count_middleware(db):
+    def view(request):
+        list(Person.objects.all())
+        list(FeedId.objects.all())
+        return HttpResponse()
+
+    response = query_count_middleware(view)(RequestFactory().get("/"))
+    assert response["X-Query-Count"] == "2"
+
+
+@override_settings(
+    MIDDLEWARE=("sp_app.middleware.query_count_middleware",)
+    + tuple(settings.MIDDLEWARE)
+)
+class TestHarness(LiveServerTestCase):
+    def test_run(self):
+        company = generate_hospital(
+            "Klinik",
+            "kl",
+            date(2022, 1, 1),
+            years=1,
+            departments=1,
+            persons=6,
+            password="secret",
+        )
+        person = company.persons.order_by("id").first()
+        harness = Harness(
+            self.live_server_url,
+            "secret",
+            "202206",
+            [(ward.id, [person.id]) for ward in company.wards.all()],
+            (date(2022, 6, 1), date(2022, 6, 30)),
+            time_scale=0.005,
+            edit_interval=60,
+            feed_interval=60,
+        )
+        report = harness.run(
+            ["kl-read", "kl-read"],
+            ["kl-edit"],
+            [FeedId.new(person).uid],
+            duration=2,
+        )
+        endpoints = {line.split()[0] for line in report[1:]}
+        assert endpoints == {
+            "changes",
+            "feed",
+            "login",
+            "master_data",
+            "plan",
+            "updates",
+        }
+        assert set(harness.stats.statuses["updates"]) <= {200, 304}
+        assert set(harness.stats.statuses["changes"]) <= {200, 304}
+        assert harness.stats.statuses["plan"][200] == sum(
+            harness.stats.statuses["plan"].values()
+        )
+        assert harness.stats.queries["plan"]
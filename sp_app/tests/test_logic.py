@@ -5,18 +5,21 @@ from datetime import date
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from http import HTTPStatus
-from unittest import TestCase, mock
+from unittest import TestCase, mock, skipUnless
 from unittest.mock import Mock
 
 from sp_app import logic
+from sp_app.caching import get_data_version
 from sp_app.logic import (
     get_for_company,
-    get_holidays_for_company,
     apply_changes,
     set_approved,
     get_last_change_response,
     get_cached_last_change_pk,
+    get_change_buffer,
     set_cached_last_change_pk,
     send_activation_mail,
 )
@@ -25,9 +28,8 @@ from sp_app.models import (
     Department,
     Person,
     Ward,
-    CalculatedHoliday,
-    Region,
     ChangeLogging,
+    Planning,
     FAR_FUTURE,
 )
 from sp_app.tests.utils_for_tests import PopulatedTestCase
@@ -55,28 +57,6 @@ class TestGetForCompany(TestCase):
         self.assertEqual(smith.name, "Anna Smith")
 
 
-class TestGetHolidaysForCompany(PopulatedTestCase):
-    def test_get_holidays_for_company(self):
-        weihnachten = CalculatedHoliday.objects.create(
-            name="Weihnachten", mode="abs", day=25, month=12
-        )
-        ostern = CalculatedHoliday.objects.create(
-            name="Ostern", mode="rel", day=0
-        )
-        dreikoenig = CalculatedHoliday.objects.create(
-            name="Dreikönig", mode="abs", day=6, month=1
-        )
-        testregion = Region.objects.create(name="Testregion", shortname="Test")
-        testregion.calc_holidays.add(weihnachten, ostern)
-        self.company.region = testregion
-        self.company.save()
-
-        holidays = [h.id for h in get_holidays_for_company(self.company.id)]
-        self.assertIn(weihnachten.id, holidays)
-        self.assertIn(ostern.id, holidays)
-        self.assertNotIn(dreikoenig.id, holidays)
-
-
 class TestApplyChanges(PopulatedTestCase):
     def test_apply_1_change(self):
         day = "20160328"
@@ -168,6 +148,109 @@ class TestApplyChanges(PopulatedTestCase):
         )
 
 
+class TestApplyChangesBatched(PopulatedTestCase):
+    def apply_to_team(self, size, action, day="20160328", continued=True):
+        persons = [
+            Person.objects.create(
+                name=f"Person {action} {size} {i}",
+                shortname=f"{action[0]}{size}{i}",
+                company=self.company,
+            )
+            for i in range(size)
+        ]
+        if action == "remove":
+            apply_changes(
+                self.user,
+                company_id=self.company.id,
+                day="20160301",
+                ward_id=self.ward_a.id,
+                continued=True,
+                persons=[{"id": p.id, "action": "add"} for p in persons],
+            )
+        with CaptureQueriesContext(connection) as queries:
+            cls = apply_changes(
+                self.user,
+                company_id=self.company.id,
+                day=day,
+                ward_id=self.ward_a.id,
+                continued=continued,
+                persons=[{"id": p.id, "action": action} for p in persons],
+            )
+        return persons, cls, len(queries)
+
+    def test_fixed_number_of_queries(self):
+        for action in ("add", "remove"):
+            _, _, small_team = self.apply_to_team(2, action)
+            _, _, large_team = self.apply_to_team(8, action)
+            self.assertEqual(small_team, large_team, action)
+
+    def test_changeloggings(self):
+        persons, cls, _ = self.apply_to_team(3, "add")
+        self.assertEqual(len(cls), 3)
+        for person, cl_dict in zip(persons, cls):
+            cl = ChangeLogging.objects.get(pk=cl_dict["pk"])
+            self.assertEqual(cl.person, person)
+            self.assertEqual(json.loads(cl.json), cl_dict)
+            self.assertEqual(
+                cl.description,
+                f"Mr. User: {person.name} ist ab 28.03.2016 für Ward A eingeteilt",
+            )
+
+    def test_changeloggings_without_returned_ids(self):
+        # like MySQL
+        with mock.patch.object(
+            type(connection.features),
+            "can_return_rows_from_bulk_insert",
+            False,
+        ):
+            persons, cls, _ = self.apply_to_team(3, "add")
+        for person, cl_dict in zip(persons, cls):
+            cl = ChangeLogging.objects.get(pk=cl_dict["pk"])
+            self.assertEqual(cl.person, person)
+            self.assertEqual(json.loads(cl.json), cl_dict)
+
+    def test_invalidated_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apply_to_team(2, "add")
+            version = get_data_version(self.company.id)
+        self.assertNotEqual(get_data_version(self.company.id), version)
+
+    def test_remove(self):
+        persons, cls, _ = self.apply_to_team(
+            2, "remove", day="20160310", continued=False
+        )
+        self.assertEqual(len(cls), 2)
+        for person in persons:
+            self.assertEqual(
+                [
+                    (pl.start, pl.end)
+                    for pl in Planning.objects.filter(person=person).order_by(
+                        "start"
+                    )
+                ],
+                [
+                    (date(2016, 3, 1), date(2016, 3, 9)),
+                    (date(2016, 3, 11), FAR_FUTURE),
+                ],
+            )
+
+    def test_rolled_back(self):
+        persons = [{"id": self.person_a.id, "action": "add"}]
+        with mock.patch(
+            "sp_app.logic.save_planning_changes", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                apply_changes(
+                    self.user,
+                    company_id=self.company.id,
+                    day="20160328",
+                    ward_id=self.ward_a.id,
+                    continued=True,
+                    persons=persons,
+                )
+        self.assertFalse(ChangeLogging.objects.exists())
+
+
 class TestSetApproved(PopulatedTestCase):
     def do_test(self, ward_id, approval):
         ward = get_for_company(
@@ -253,6 +336,178 @@ class TestGetLastChanges(PopulatedTestCase):
         self.assertEqual(content["last_change"]["pk"], c3.pk)
 
 
+class TestChangePages(PopulatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pks = [
+            apply_changes(
+                self.user,
+                company_id=self.company.id,
+                day=f"201710{day}",
+                ward_id=self.ward_a.id,
+                continued=False,
+                persons=[{"id": self.person_a.id, "action": "add"}],
+            )[0]["pk"]
+            for day in range(10, 16)
+        ]
+        cache.clear()
+
+    def get_page(self, last_change_pk):
+        response = get_last_change_response(self.company.id, last_change_pk)
+        return json.loads(response.content)
+
+    def test_pages(self):
+        with mock.patch("sp_app.logic.CHANGE_PAGE_SIZE", 2):
+            content = self.get_page(self.pks[0])
+            self.assertEqual(
+                [cl["pk"] for cl in content["cls"]], self.pks[1:3]
+            )
+            self.assertEqual(content["last_change"]["pk"], self.pks[2])
+            self.assertTrue(content["more"])
+            # The last change of the company is not known yet
+            self.assertIsNone(get_cached_last_change_pk(self.company.id))
+
+            content = self.get_page(self.pks[4])
+            self.assertEqual([cl["pk"] for cl in content["cls"]], self.pks[5:])
+            self.assertFalse(content["more"])
+            self.assertEqual(
+                get_cached_last_change_pk(self.company.id), self.pks[5]
+            )
+
+    def test_cursor_of_other_company(self):
+        other_company = Company.objects.create(name="Other", shortname="O")
+        other_person = Person.objects.create(
+            name="Other", shortname="O", company=other_company
+        )
+        other_ward = Ward.objects.create(
+            name="Other", shortname="O", min=0, max=1, company=other_company
+        )
+        other_pk = apply_changes(
+            self.user,
+            company_id=other_company.id,
+            day="20171020",
+            ward_id=other_ward.id,
+            continued=False,
+            persons=[{"id": other_person.id, "action": "add"}],
+        )[0]["pk"]
+        cache.clear()
+        content = self.get_page(other_pk)
+        # The client gets the last change of its own company
+        self.assertEqual([cl["pk"] for cl in content["cls"]], self.pks[-1:])
+        self.assertEqual(content["last_change"]["pk"], self.pks[-1])
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN of SQLite")
+    def test_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_page(self.pks[0])
+        sql = queries.captured_queries[0]["sql"]
+        plan = " ".join(
+            str(row)
+            for row in connection.cursor().execute(f"EXPLAIN QUERY PLAN {sql}")
+        )
+        self.assertIn("changelogging_company_pk", plan)
+
+
+class TestApprovalVisibility(PopulatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pks = [
+            apply_changes(
+                self.user,
+                company_id=self.company.id,
+                day=day,
+                ward_id=self.ward_a.id,
+                continued=False,
+                persons=[{"id": self.person_a.id, "action": "add"}],
+            )[0]["pk"]
+            for day in ("20171009", "20171010", "20171011")
+        ]
+        set_approved(["A"], "20171010", [self.department.id])
+
+    def get_pks(self, is_editor):
+        response = get_last_change_response(
+            self.company.id, self.pks[0] - 1, is_editor=is_editor
+        )
+        content = json.loads(response.content)
+        self.assertEqual(content["last_change"]["pk"], self.pks[-1])
+        return [cl["pk"] for cl in content["cls"]]
+
+    def test_changes(self):
+        self.assertEqual(self.get_pks(is_editor=True), self.pks)
+        self.assertEqual(self.get_pks(is_editor=False), self.pks[:2])
+
+    def test_plannings(self):
+        plannings = Planning.objects.filter(ward=self.ward_a)
+        self.assertEqual(len(plannings.visible(is_editor=True)), 3)
+        self.assertEqual(
+            [p.start for p in plannings.visible(is_editor=False)],
+            [date(2017, 10, 9), date(2017, 10, 10)],
+        )
+
+    def test_no_approval_date(self):
+        Ward.objects.filter(id=self.ward_a.id).update(approved=None)
+        self.assertEqual(self.get_pks(is_editor=False), self.pks)
+
+
+class TestChangeBuffer(PopulatedTestCase):
+    def apply_change(self, day):
+        return apply_changes(
+            self.user,
+            company_id=self.company.id,
+            day=day,
+            ward_id=self.ward_a.id,
+            continued=False,
+            persons=[{"id": self.person_a.id, "action": "add"}],
+        )[0]["pk"]
+
+    def test_filled_by_apply_changes(self):
+        pks = [self.apply_change(day) for day in ("20171027", "20171028")]
+        self.assertEqual(
+            [pk for pk, _, _ in get_change_buffer(self.company.id)], pks
+        )
+        with self.assertNumQueries(0):
+            response = get_last_change_response(
+                self.company.id, pks[0], is_editor=True
+            )
+        content = json.loads(response.content)
+        self.assertEqual([cl["pk"] for cl in content["cls"]], pks[1:])
+        self.assertEqual(content["last_change"]["pk"], pks[1])
+        # Readers need the approval of the wards
+        with self.assertNumQueries(1):
+            get_last_change_response(self.company.id, pks[0])
+
+    def test_bounded(self):
+        with mock.patch("sp_app.logic.CHANGE_BUFFER_SIZE", 2):
+            pks = [
+                self.apply_change(day)
+                for day in ("20171027", "20171028", "20171029")
+            ]
+            self.assertEqual(
+                [pk for pk, _, _ in get_change_buffer(self.company.id)],
+                pks[1:],
+            )
+            # The cursor has fallen off the buffer
+            with self.assertNumQueries(1):
+                response = get_last_change_response(
+                    self.company.id, pks[0], is_editor=True
+                )
+        content = json.loads(response.content)
+        self.assertEqual([cl["pk"] for cl in content["cls"]], pks[1:])
+
+    def test_filled_from_database(self):
+        pks = [self.apply_change(day) for day in ("20171027", "20171028")]
+        cache.delete(f"change_buffer-{self.company.id}")
+        get_last_change_response(self.company.id, pks[0])
+        self.assertEqual(
+            [pk for pk, _, _ in get_change_buffer(self.company.id)], pks
+        )
+
+    def test_cleared_on_delete(self):
+        self.apply_change("20171027")
+        ChangeLogging.objects.filter(company=self.company).first().delete()
+        self.assertIsNone(get_change_buffer(self.company.id))
+
+
 class TestAssertContainsDict(PopulatedTestCase):
     def test_assertContainsDict(self):
         self.assertContainsDict({"a": 1, "b": 2}, {"a": 1})
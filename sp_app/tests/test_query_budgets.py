@@ -0,0 +1,384 @@
+"""Every view of sp_app.views and sp_app.ajax declares its query budget
+with utils.query_budget. The views are called with data of two sizes,
+their number of queries must stay in the budget and must not grow
+with the data, unless the budget has queries per row.
+"""
+
+import json
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from sp_app import ajax, ical_files, views
+from sp_app.logic import apply_changes, get_master_data, get_plannings_chunk
+from sp_app.models import (
+    ChangeLogging,
+    Company,
+    Department,
+    DifferentDay,
+    Employee,
+    FeedId,
+    Person,
+    Planning,
+    Ward,
+)
+
+SIZES = (2, 8)
+
+
+def routed_views(patterns=None):
+    """Return the views of sp_app.views and sp_app.ajax in the urls"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    found = {}
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            found.update(routed_views(pattern.url_patterns))
+        elif isinstance(pattern, URLPattern):
+            view = pattern.callback
+            if view.__module__ in (views.__name__, ajax.__name__):
+                found[str(pattern.pattern)] = view
+    return found
+
+
+class Hospital:
+    """A company with n rows of each kind and a logged in admin"""
+
+    def __init__(self, client, n):
+        self.client = client
+        self.n = n
+        self.company = Company.objects.create(name="Company", shortname="C")
+        self.departments = [
+            Department.objects.create(
+                name=f"Department {i}", shortname=f"D{i}", company=self.company
+            )
+            for i in range(n)
+        ]
+        self.wards = []
+        for i in range(n):
+            ward = Ward.objects.create(
+                name=f"Ward {i}",
+                shortname=f"W{i}",
+                min=1,
+                max=2,
+                company=self.company,
+            )
+            ward.departments.add(self.departments[0], self.departments[i])
+            if self.wards:
+                ward.after_this.add(self.wards[-1])
+                ward.not_with_this.add(self.wards[-1])
+            self.wards.append(ward)
+        self.persons = []
+        for i in range(n):
+            person = Person.objects.create(
+                name=f"Person {i}",
+                shortname=f"P{i}",
+                company=self.company,
+                email=f"p{i}@example.com",
+                end_date=date(2030, 1, 1) if i % 2 else date(2099, 12, 31),
+            )
+            person.departments.add(self.departments[0], self.departments[i])
+            person.functions.add(*self.wards)
+            FeedId.new(person)
+            self.persons.append(person)
+        self.employees = []
+        for i in range(n):
+            user = User.objects.create_user(f"user{i}", password="password")
+            employee = Employee.objects.create(user=user, company=self.company)
+            employee.departments.add(self.departments[0], self.departments[i])
+            employee.set_level("is_company_admin" if i == 0 else "is_editor")
+            self.employees.append(employee)
+        self.user = self.employees[0].user
+        for i in range(n):
+            DifferentDay.objects.create(
+                ward=self.wards[i], day=date(2022, 6, i + 1), added=True
+            )
+            for person in self.persons:
+                apply_changes(
+                    self.user,
+                    self.company.id,
+                    f"202206{i + 1:02}",
+                    self.wards[i].id,
+                    False,
+                    [{"id": person.id, "action": "add"}],
+                )
+        client.login(username="user0", password="password")
+        self.session = client.session
+        self.last_pk = ChangeLogging.objects.order_by("pk").last().pk
+
+        self.counts = []
+
+    def request(self, method, url, *args, **kwargs):
+        """Make the request and record its number of queries"""
+        # Including the work after the commit, like writing feed files
+        with CaptureQueriesContext(connection) as context:
+            with TestCase.captureOnCommitCallbacks(execute=True):
+                response = getattr(self.client, method)(url, *args, **kwargs)
+        assert response.status_code < 400, (url, response)
+        self.counts.append(len(context.captured_queries))
+
+    def get(self, url):
+        self.request("get", url)
+
+    def post(self, url, data=None):
+        self.request("post", url, data or {})
+
+    def post_json(self, url, data):
+        self.request(
+            "post", url, json.dumps(data), content_type="application/json"
+        )
+
+    def change(self, day=1):
+        return {
+            "day": f"202206{day:02}",
+            "ward_id": self.wards[0].id,
+            "continued": False,
+            "persons": [{"id": self.persons[0].id, "action": "remove"}],
+        }
+
+    def versions(self):
+        department_ids = self.session["department_ids"]
+        _, plannings = get_plannings_chunk(
+            self.company.id, department_ids, "202206", is_editor=True
+        )
+        _, master_data = get_master_data(
+            self.company.id, department_ids, date(2022, 6, 1)
+        )
+        return plannings, master_data
+
+
+# The requests to each view
+SCENARIOS = {
+    "": lambda h: [h.get("/")],
+    "setup/": lambda h: [h.get("/setup/")],
+    "plan/(?P<month>[0-9]+)?/?$": lambda h: [h.get("/plan/202206")],
+    r"^dienste(/(?P<month>[0-9]+))?/?$": lambda h: [h.get("/dienste/202206")],
+    r"^tag(/(?P<day>[0-9]+))?/?$": lambda h: [h.get("/tag/20220601")],
+    "zuordnung": lambda h: [h.get("/zuordnung")],
+    "change_function": lambda h: [
+        h.post_json(
+            "/change_function",
+            {"person": h.persons[0].id, "ward": h.wards[0].id, "add": False},
+        )
+    ],
+    "changes": lambda h: [
+        h.post_json("/changes", dict(h.change(), last_pk=h.last_pk))
+    ],
+    "changes/batch": lambda h: [
+        h.post_json(
+            "/changes/batch",
+            {"changes": [h.change(1), h.change(2)], "last_pk": h.last_pk},
+        )
+    ],
+    r"^changehistory/(?P<date>[0-9]+)/(?P<ward_id>[0-9]+)$": lambda h: [
+        h.get(f"/changehistory/20220601/{h.wards[0].id}")
+    ],
+    "set_approved": lambda h: [
+        h.post_json(
+            "/set_approved",
+            {"wards": [w.shortname for w in h.wards], "date": "20220615"},
+        )
+    ],
+    r"^updates/([0-9]+)/?$": lambda h: [
+        h.get(f"/updates/{h.last_pk - h.n}"),
+        h.get("/updates/0"),
+    ],
+    r"^plannings/(?P<month>[0-9]{6})/?$": lambda h: [
+        h.get("/plannings/202206")
+    ],
+    r"^plannings/(?P<month>[0-9]{6})/(?P<version>[0-9a-f]+)$": lambda h: [
+        h.get(f"/plannings/202206/{h.versions()[0]}"),
+        h.get("/plannings/202206/0"),
+    ],
+    r"^master_data/(?P<month>[0-9]{6})/(?P<version>[0-9a-f]+)$": lambda h: [
+        h.get(f"/master_data/202206/{h.versions()[1]}"),
+        h.get("/master_data/202206/0"),
+    ],
+    "different_day/<str:action>/<int:ward>/<str:day_id>": lambda h: [
+        h.post(f"/different_day/add_additional/{h.wards[0].id}/20220720"),
+        h.post(f"/different_day/remove_additional/{h.wards[0].id}/20220601"),
+    ],
+    "setup/departments": lambda h: [h.get("/setup/departments")],
+    "setup/employees": lambda h: [h.get("/setup/employees")],
+    "setup/persons": lambda h: [h.get("/setup/persons")],
+    "setup/wards": lambda h: [h.get("/setup/wards")],
+    "setup/zuordnung": lambda h: [h.get("/setup/zuordnung")],
+    "edit/department": lambda h: [
+        h.get("/edit/department"),
+        h.post("/edit/department", {"name": "New", "shortname": "N"}),
+    ],
+    "edit/department/<int:department_id>": lambda h: [
+        h.get(f"/edit/department/{h.departments[1].id}"),
+    ],
+    "edit/employee": lambda h: [h.get("/edit/employee")],
+    "edit/employee/<int:employee_id>": lambda h: [
+        h.get(f"/edit/employee/{h.employees[1].id}")
+    ],
+    "delete/employee/<int:employee_id>": lambda h: [
+        h.get(f"/delete/employee/{h.employees[1].id}")
+    ],
+    "edit/mapping/<int:person_id>/<int:ward_id>/<int:possible>": lambda h: [
+        h.post(f"/edit/mapping/{h.persons[0].id}/{h.wards[0].id}/0"),
+        h.post(f"/edit/mapping/{h.persons[0].id}/{h.wards[0].id}/1"),
+    ],
+    "person/add/": lambda h: [h.get("/person/add/")],
+    "person/<int:pk>/": lambda h: [h.get(f"/person/{h.persons[1].id}/")],
+    "funktion/add/": lambda h: [h.get("/funktion/add/")],
+    "funktion/<int:pk>/": lambda h: [h.get(f"/funktion/{h.wards[1].id}/")],
+    "ical_feeds": lambda h: [h.get("/ical_feeds")],
+    "send_ical_feed/<int:pk>": lambda h: [
+        h.get(f"/send_ical_feed/{h.persons[1].id}")
+    ],
+    "signup": lambda h: [h.get("/signup")],
+    "send_activation_mail/<int:user>": lambda h: [
+        h.get(f"/send_activation_mail/{h.employees[1].user_id}")
+    ],
+    "activate/<int:uid>/<token>": lambda h: [
+        h.get(f"/activate/{h.employees[1].user_id}/invalid")
+    ],
+    # Helpers for the playwright tests, not available in production
+    "delete_playwright_tests": lambda h: [h.get("/delete_playwright_tests")],
+    "_make_test_data": lambda h: [h.get("/_make_test_data")],
+    "_delete_test_data": lambda h: [h.get("/_delete_test_data")],
+}
+UNMEASURED = {
+    # It raises an error on purpose
+    "_error_for_testing",
+    # Only with DEBUG, the view is measured as send_activation_mail
+    "test/activation_mail_sent/<int:user>",
+}
+
+
+def test_every_view_has_a_budget():
+    for route, view in routed_views().items():
+        assert hasattr(view, "query_budget"), f"{route} has no query budget"
+        assert route in SCENARIOS or route in UNMEASURED, route
+
+
+def count_queries(client, route, n):
+    """Return the most queries of the requests of the scenario"""
+    hospital = Hospital(client, n)
+    cache.clear()
+    Site.objects.clear_cache()
+    SCENARIOS[route](hospital)
+    return max(hospital.counts)
+
+
+@pytest.mark.django_db
+@override_settings(EMAIL_AVAILABLE=True)
+@pytest.mark.parametrize("route", sorted(SCENARIOS))
+def test_query_budget(client, route):
+    view = routed_views()[route]
+    queries, per_row = view.query_budget
+    counts = {}
+    for n in SIZES:
+        counts[n] = count_queries(client, route, n)
+        client.logout()
+        for model in (Company, User):
+            model.objects.all().delete()
+    assert_in_budget(route, counts, queries, per_row)
+
+
+def assert_in_budget(route, counts, queries, per_row):
+    small, large = SIZES
+    for n in SIZES:
+        assert counts[n] <= queries + per_row * n, (route, counts)
+    assert counts[large] - counts[small] <= per_row * (large - small), (
+        route,
+        counts,
+    )
+
+
+def in_feed_today(h):
+    """A change of all persons in a ward of the feeds today"""
+    return {
+        "day": date.today().strftime("%Y%m%d"),
+        "ward_id": h.wards[0].id,
+        "continued": False,
+        "persons": [
+            {"id": person.id, "action": "add"} for person in h.persons
+        ],
+    }
+
+
+def approve_plannings_in_feeds(h):
+    for person in h.persons:
+        Planning.objects.create(
+            person=person, ward=h.wards[0], start=date.today()
+        )
+    h.post_json(
+        "/set_approved", {"wards": [h.wards[0].shortname], "date": False}
+    )
+
+
+# The requests, that change the plannings of all persons
+PLANNING_SCENARIOS = {
+    "changes": lambda h: [
+        h.post_json("/changes", dict(in_feed_today(h), last_pk=h.last_pk))
+    ],
+    "changes/batch": lambda h: [
+        h.post_json(
+            "/changes/batch",
+            {"changes": [in_feed_today(h)], "last_pk": h.last_pk},
+        )
+    ],
+    "set_approved": approve_plannings_in_feeds,
+}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("route", sorted(PLANNING_SCENARIOS))
+def test_query_budget_with_feed_files(client, route, tmp_path):
+    """The feed files are written for a limited number of persons,
+    the files of the others are removed. Writing them costs a query
+    for the feed ids, one per written file and one for the removed files.
+    """
+    view = routed_views()[route]
+    queries, per_row = view.query_budget
+    counts = {}
+    for n in SIZES:
+        with override_settings(ICAL_FEED_ROOT=str(tmp_path / str(n))), patch(
+            "sp_app.ical_files.FEED_FILES_PER_REQUEST", SIZES[0]
+        ):
+            hospital = Hospital(client, n)
+            Ward.objects.update(in_ical_feed=True)
+            cache.clear()
+            PLANNING_SCENARIOS[route](hospital)
+            counts[n] = max(hospital.counts)
+            files = list((tmp_path / str(n)).iterdir())
+            assert len(files) == min(n, ical_files.FEED_FILES_PER_REQUEST)
+        client.logout()
+        for model in (Company, User):
+            model.objects.all().delete()
+    assert_in_budget(route, counts, queries + 2 + SIZES[0], per_row)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("route", ["changes", "changes/batch"])
+def test_query_budget_without_returned_ids(client, route):
+    """Like on MySQL, the ids of bulk inserted rows are not returned
+    and are selected by create_changeloggings
+    """
+    view = routed_views()[route]
+    queries, per_row = view.query_budget
+    counts = {}
+    with patch.object(
+        type(connection.features), "can_return_rows_from_bulk_insert", False
+    ):
+        for n in SIZES:
+            hospital = Hospital(client, n)
+            cache.clear()
+            PLANNING_SCENARIOS[route](hospital)
+            counts[n] = max(hospital.counts)
+            client.logout()
+            for model in (Company, User):
+                model.objects.all().delete()
+    assert_in_budget(route, counts, queries, per_row)
@@ -0,0 +1,106 @@
+"""The hot queries must use the composite indexes of the models.
+
+The queries are captured while the code runs and their plans are taken
+with EXPLAIN QUERY PLAN. This only works with SQLite.
+"""
+
+from datetime import date
+from unittest import skipUnless
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from sp_app import logic
+from sp_app.ajax import _get_change_history
+from sp_app.ical_views import get_feed_plannings
+from sp_app.models import ChangeLogging, DifferentDay, process_change
+from sp_app.tests.utils_for_tests import PopulatedTestCase
+
+
+def query_plans(func, table):
+    """Call func and return the plans of its queries,
+    that select from this table
+    """
+    with CaptureQueriesContext(connection) as context:
+        func()
+    plans = []
+    with connection.cursor() as cursor:
+        for query in context.captured_queries:
+            sql = query["sql"]
+            if not sql.startswith("SELECT") or f'FROM "{table}"' not in sql:
+                continue
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            plans.append("\n".join(row[-1] for row in cursor.fetchall()))
+    assert plans, f"No query on {table}"
+    return plans
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN of SQLite")
+class TestQueryPlans(PopulatedTestCase):
+    def assert_index(self, func, table, index):
+        for plan in query_plans(func, table):
+            assert f"SCAN {table}" not in plan, plan
+            assert f"USING INDEX {index}" in plan, plan
+
+    def test_plannings_of_departments(self):
+        self.assert_index(
+            lambda: list(
+                logic.get_plannings(
+                    [self.department.id],
+                    True,
+                    end__gte=date(2022, 5, 1),
+                    start__lte=date(2022, 5, 31),
+                )
+            ),
+            "sp_app_planning",
+            "planning_current_ward_end",
+        )
+
+    def test_timeline_of_person_and_ward(self):
+        cl = ChangeLogging(
+            company=self.company,
+            user=self.user,
+            person=self.person_a,
+            ward=self.ward_a,
+            day=date(2022, 5, 1),
+            added=True,
+            continued=False,
+        )
+        cl.json = "{}"
+        self.assert_index(
+            lambda: process_change(cl),
+            "sp_app_planning",
+            "planning_person_ward_end",
+        )
+
+    def test_ical_feed_of_person(self):
+        self.assert_index(
+            lambda: get_feed_plannings(person=self.person_a),
+            "sp_app_planning",
+            "planning_person_start",
+        )
+
+    def test_ical_feed_of_wards(self):
+        self.assert_index(
+            lambda: get_feed_plannings(ward__in=[self.ward_a, self.ward_b]),
+            "sp_app_planning",
+            "planning_ward_start",
+        )
+
+    def test_change_history(self):
+        self.assert_index(
+            lambda: _get_change_history(
+                self.company.id, "20220501", self.ward_a.id
+            ),
+            "sp_app_changelogging",
+            "changelogging_ward_day",
+        )
+
+    def test_different_day(self):
+        self.assert_index(
+            lambda: DifferentDay.objects.filter(
+                ward=self.ward_a, day=date(2022, 5, 1)
+            ).first(),
+            "sp_app_differentday",
+            "differentday_ward_day",
+        )
@@ -21,6 +21,7 @@ from sp_app.models import (
     Planning,
 )
 from sp_app import logic, ajax
+from sp_app.caching import get_data_version, get_ical_version
 from sp_app.logic import get_plan_data
 from sp_app.tests.utils_for_tests import (
     PopulatedTestCase,
@@ -125,7 +126,7 @@ class TestPlanData(PopulatedTestCase):
         self.assertEqual(plannings[0]["ward"], self.ward_a.id)
 
     def test_persons_and_wards(self):
-        """Persons and Wards are included in the data
+        """Persons and Wards are included in the master data
         but not from other Companies, former persons or inactive wards
         """
         other_comp = Company.objects.create(
@@ -141,6 +142,7 @@ class TestPlanData(PopulatedTestCase):
             company=self.company,
             end_date=date(2021, 12, 31),
         )
+        former.departments.add(self.department)
         other_ward = Ward.objects.create(
             name="OtherComp",
             shortname="Oth",
@@ -167,6 +169,11 @@ class TestPlanData(PopulatedTestCase):
             month="202205",
         )
         data = json.loads(plan_data["data"])
+        master_data, version = logic.get_master_data(
+            self.company.id, [self.department.id], date(2022, 4, 1)
+        )
+        assert data["master_data_url"] == f"/master_data/202204/{version}"
+        data = json.loads(master_data)
         person_ids = [p["id"] for p in data["persons"]]
         assert self.person_a.id in person_ids
         assert self.person_b.id in person_ids
@@ -182,6 +189,181 @@ class TestPlanData(PopulatedTestCase):
         assert inactive_ward in plan_data["inactive_wards"]
 
 
+class TestDepartmentPersons(PopulatedTestCase):
+    """Only the persons of the departments and those who are planned
+    for their wards are in the master data
+    """
+
+    def setUp(self):
+        super().setUp()
+        other_department = Department.objects.create(
+            name="Other Department", company=self.company
+        )
+        self.foreign = Person.objects.create(
+            name="Foreign", shortname="F", company=self.company
+        )
+        self.foreign.departments.add(other_department)
+
+    def get_person_ids(self):
+        master_data, _ = logic.get_master_data(
+            self.company.id, [self.department.id], date(2022, 4, 1)
+        )
+        return [p["id"] for p in json.loads(master_data)["persons"]]
+
+    def test_foreign_persons(self):
+        assert self.get_person_ids() == [self.person_a.id, self.person_b.id]
+        # Before the period
+        Planning.objects.create(
+            person=self.foreign,
+            ward=self.ward_a,
+            start=date(2022, 3, 1),
+            end=date(2022, 3, 31),
+        )
+        logic.bump_master_data_version(self.company.id)
+        assert self.foreign.id not in self.get_person_ids()
+
+    def test_planned_foreign_person(self):
+        assert self.foreign.id not in self.get_person_ids()
+        logic.apply_changes(
+            self.user,
+            self.company.id,
+            "20220405",
+            self.ward_a.id,
+            False,
+            [{"id": self.foreign.id, "action": "add"}],
+        )
+        assert self.foreign.id in self.get_person_ids()
+
+    def test_former_persons_are_lazy(self):
+        plan_data = get_plan_data(
+            department_ids=[self.department.id],
+            company_id=self.company.id,
+            month="202205",
+        )
+        with self.assertNumQueries(1):
+            assert list(plan_data["former_persons"]) == []
+
+
+class TestPlanDataCache(PopulatedTestCase):
+    """Test the caching of get_plan_data"""
+
+    def get_plannings(self, **kwargs):
+        plan_data = get_plan_data(
+            department_ids=[self.department.id],
+            company_id=self.company.id,
+            month="201604",
+            **kwargs,
+        )
+        return json.loads(plan_data["data"])["plannings"]
+
+    def test_cached_until_change(self):
+        Planning.objects.create(
+            person=self.person_a,
+            ward=self.ward_a,
+            start=date(2016, 4, 1),
+            end=date(2016, 4, 10),
+        )
+        assert len(self.get_plannings()) == 1
+        with self.assertNumQueries(0):
+            assert len(self.get_plannings()) == 1
+        Planning.objects.create(
+            person=self.person_b,
+            ward=self.ward_a,
+            start=date(2016, 4, 1),
+            end=date(2016, 4, 10),
+        )
+        assert len(self.get_plannings()) == 2
+
+    def test_invalidated_again_after_commit(self):
+        """Concurrent requests may cache the old data before the commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Planning.objects.create(
+                person=self.person_a,
+                ward=self.ward_a,
+                start=date(2016, 4, 1),
+                end=date(2016, 4, 10),
+            )
+            version = get_data_version(self.company.id)
+            ical_version = get_ical_version(self.person_a.id)
+        assert get_data_version(self.company.id) != version
+        assert get_ical_version(self.person_a.id) != ical_version
+
+    def test_approval_invalidates(self):
+        Planning.objects.create(
+            person=self.person_a,
+            ward=self.ward_a,
+            start=date(2016, 4, 15),
+            end=date(2016, 4, 20),
+        )
+        assert len(self.get_plannings()) == 1
+        logic.set_approved(["A"], "20160410", [self.department.id])
+        assert len(self.get_plannings()) == 0
+        assert len(self.get_plannings(is_editor=True)) == 1
+
+    def test_last_change_is_current(self):
+        apply_data = dict(
+            user=self.user,
+            company_id=self.company.id,
+            ward_id=self.ward_a.id,
+            continued=False,
+            persons=[{"id": self.person_a.id, "action": "add"}],
+        )
+        logic.apply_changes(day="20160405", **apply_data)
+        plan_data = get_plan_data(
+            department_ids=[self.department.id],
+            company_id=self.company.id,
+            month="201604",
+        )
+        data = json.loads(plan_data["data"])
+        last_cl = ChangeLogging.objects.get()
+        assert data["last_change_pk"] == last_cl.pk
+        assert data["last_change_time"] >= 0
+
+
+class TestMasterData(ViewsTestCase):
+    """Test ajax.master_data"""
+
+    def get_url(self):
+        _, version = logic.get_master_data(
+            self.company.id, [self.department.id], date(2022, 4, 1)
+        )
+        return reverse("master-data", args=["202204", version])
+
+    def test_master_data(self):
+        url = self.get_url()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        assert "immutable" in response["Cache-Control"]
+        data = json.loads(response.content)
+        assert [p["id"] for p in data["persons"]] == [
+            self.person_a.id,
+            self.person_b.id,
+        ]
+        assert data["departments"] == {str(self.department.id): "Department 1"}
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_new_version(self):
+        url = self.get_url()
+        self.person_a.name = "Person A2"
+        self.person_a.save()
+        new_url = self.get_url()
+        assert new_url != url
+        response = self.client.get(url)
+        self.assertRedirects(response, new_url)
+
+    def test_plannings_keep_version(self):
+        url = self.get_url()
+        Planning.objects.create(
+            person=self.person_a,
+            ward=self.ward_a,
+            start=date(2022, 5, 1),
+            end=date(2022, 5, 1),
+        )
+        with self.assertNumQueries(0):
+            assert self.get_url() == url
+
+
 class TestPlan(ViewsTestCase):
     """Test views.plan"""
 
@@ -197,6 +379,29 @@ class TestPlan(ViewsTestCase):
         response = self.client.get("/zuordnung")
         self.assertEqual(response.status_code, HTTPStatus.OK)
 
+    def test_not_modified(self):
+        response = self.client.get("/plan/201604")
+        etag = response["ETag"]
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+        response = self.client.get("/plan/201604", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        # another month has another ETag
+        response = self.client.get("/plan/201605", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_modified_after_change(self):
+        response = self.client.get("/plan/201604")
+        etag = response["ETag"]
+        Planning.objects.create(
+            company=self.company,
+            person=self.person_a,
+            ward=self.ward_a,
+            start=date(2016, 4, 1),
+        )
+        response = self.client.get("/plan/201604", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
 
 # Tests for sp_app.ajax
 
@@ -559,6 +764,21 @@ class TestGetChangeHistory:
         )
         assert response.status_code == HTTPStatus.NOT_MODIFIED
 
+    def test_etag(self, client, company, logged_in, some_changes):
+        # The first request fills the cache with the last change
+        client.get("/updates/0", HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        response = client.get(
+            "/updates/0", HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+        )
+        assert response.status_code == HTTPStatus.OK
+        etag = response["ETag"]
+        response = client.get(
+            "/updates/0",
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
 
 class TestDifferentDays(ViewsTestCase):
     """Set different planning for a day and ward"""
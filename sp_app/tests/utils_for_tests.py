@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
 from django.test import TestCase
 from sp_app.models import Company, Employee, Person, Ward, Department
 
@@ -7,6 +8,7 @@ class PopulatedTestCase(TestCase):
     """TestCase with some prepared objects."""
 
     def setUp(self):
+        cache.clear()
         self.company = Company.objects.create(name="Company", shortname="Comp")
         self.department = Department.objects.create(
             name="Department 1", shortname="Dep1", company=self.company
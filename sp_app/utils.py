@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import re
 from datetime import timedelta, datetime, date
 from zoneinfo import ZoneInfo
@@ -27,6 +28,14 @@ def last_day_of_month(date):
     )
 
 
+def add_months(date, months):
+    """Returns the first of the month 'months' months after
+    the month of 'date' (before, if 'months' is negative)
+    """
+    year, month = divmod(date.year * 12 + date.month - 1 + months, 12)
+    return date.replace(year=year, month=month + 1, day=1)
+
+
 def post_with_company(request):
     if request.POST:
         post = request.POST.copy()
@@ -46,3 +55,34 @@ def is_mobile(request):
     MOBILE_AGENT_RE = re.compile(r".*(iphone|mobile|android)", re.IGNORECASE)
     user_agent = request.META.get("HTTP_USER_AGENT", "")
     return bool(MOBILE_AGENT_RE.match(user_agent))
+
+
+def session_etag(request, *parts):
+    """Return an ETag for a response that depends on the session
+    and on 'parts'.
+    """
+    session = request.session
+    key = (
+        request.user.pk,
+        session.get("company_id"),
+        session.get("department_ids"),
+        session.get("is_editor"),
+        session.get("is_dep_lead"),
+        session.get("is_company_admin"),
+    ) + parts
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def query_budget(queries, per_row=0):
+    """Declare the maximum number of SQL queries of a view:
+    'queries' plus 'per_row' for each row of the data
+
+    The budgets are checked by tests/test_query_budgets.py
+    with data of several sizes.
+    """
+
+    def decorator(view):
+        view.query_budget = (queries, per_row)
+        return view
+
+    return decorator
@@ -6,8 +6,16 @@ from django.contrib.auth.tokens import default_token_generator
 from django.http import HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
 from sp_app import forms, logic, utils
+from .caching import (
+    get_data_last_modified,
+    get_data_version,
+    get_master_data_last_modified,
+    get_master_data_version,
+)
 from .models import (
     Person,
     Ward,
@@ -21,13 +29,33 @@ from .models import (
 )
 
 
+@utils.query_budget(3)
 def home(request):
     if request.user.is_authenticated:
         return redirect("plan")
     return render(request, "sp_app/index.jinja", context={"next": "/plan"})
 
 
+def plan_etag(request, month="", day=""):
+    return utils.session_etag(
+        request,
+        "plan",
+        # month and day can be empty, so the current month is included
+        utils.get_first_of_month(month or (day or "")[:6]),
+        day,
+        get_data_version(request.session.get("company_id")),
+        settings.VERSION,
+    )
+
+
+def plan_last_modified(request, month="", day=""):
+    return get_data_last_modified(request.session.get("company_id"))
+
+
+@utils.query_budget(16)
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=plan_etag, last_modified_func=plan_last_modified)
 def plan(request, month="", day=""):
     """Delivers all the data to built the month-, day- and on-call-view
     on the client side.
@@ -55,8 +83,29 @@ def plan(request, month="", day=""):
     )
 
 
+def setup_etag(request, *args, **kwargs):
+    """ETag for the setup page and its panes
+
+    The setup page contains the CSRF token, which changes on every login.
+    """
+    return utils.session_etag(
+        request,
+        request.path,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        get_master_data_version(request.session.get("company_id")),
+        settings.VERSION,
+    )
+
+
+def setup_last_modified(request, *args, **kwargs):
+    return get_master_data_last_modified(request.session.get("company_id"))
+
+
+@utils.query_budget(11)
 @login_required
 @permission_required("sp_app.is_dep_lead")
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=setup_etag, last_modified_func=setup_last_modified)
 def setup(request):
     """Show settings of the company
 
@@ -90,6 +139,7 @@ def setup(request):
     )
 
 
+@utils.query_budget(6)
 @login_required
 @permission_required("sp_app.is_dep_lead")
 def ical_feeds(request):
@@ -105,6 +155,7 @@ def ical_feeds(request):
     )
 
 
+@utils.query_budget(6)
 def send_activation_mail(request, user):
     if isinstance(user, int):
         user = get_object_or_404(User, pk=user)
@@ -114,6 +165,7 @@ def send_activation_mail(request, user):
     return redirect("signup-success")
 
 
+@utils.query_budget(2)
 def signup(request):
     userform = forms.UserSignupForm(request.POST or None)
     companyform = forms.CompanyForm(request.POST or None)
@@ -153,6 +205,7 @@ def signup(request):
     )
 
 
+@utils.query_budget(2)
 def activate(request, uid, token):
     try:
         user = User.objects.get(pk=uid)
@@ -165,6 +218,7 @@ def activate(request, uid, token):
     return render(request, "sp_app/signup/activation_invalid.html", {})
 
 
+@utils.query_budget(3)
 def delete_playwright_tests(request):
     if settings.SERVER_TYPE == "production":
         return HttpResponse("Not allowed on production server.")
@@ -175,6 +229,7 @@ def delete_playwright_tests(request):
     )
 
 
+@utils.query_budget(0)
 def error_for_testing(request):
     assert False
 
@@ -182,6 +237,7 @@ def error_for_testing(request):
 _TEST_COMPANY_NAME = "_pw_test_company2"
 
 
+@utils.query_budget(69)
 def make_test_data(request):
     if settings.SERVER_TYPE == "production":
         return HttpResponse("No Testdata in production")
@@ -224,6 +280,7 @@ def make_test_data(request):
     return HttpResponse("Testdata created")
 
 
+@utils.query_budget(7)
 def delete_test_data(request):
     "Delete data from the playwright tests"
     if settings.SERVER_TYPE == "production":
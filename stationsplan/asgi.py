@@ -0,0 +1,29 @@
+"""
+ASGI config for stationsplan project.
+
+Serves the stream of changes (see sp_app/events.py) next to
+the Django application.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
+"""
+
+import os
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "stationsplan.settings")
+
+django_application = get_asgi_application()
+
+# Import after the setup of Django
+from sp_app.events import change_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == settings.CHANGE_STREAM_URL:
+        await change_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
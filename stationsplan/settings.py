@@ -162,6 +162,36 @@ try:
 except KeyError:
     DOMAIN = "https://stationsplan.de"
 
+# The stream of changes is only available, if the server runs
+# stationsplan/asgi.py. Otherwise the clients poll for changes.
+CHANGE_STREAM = config["server"].getboolean("change_stream", fallback=False)
+CHANGE_STREAM_URL = "/events/"
+
+# Send the plannings and functions of persons in a compact form,
+# see sp_app/encoding.py
+COMPACT_PLAN_DATA = config["server"].getboolean(
+    "compact_plan_data", fallback=False
+)
+
+# The iCal feeds contain the plannings of these months
+# before and after the current month
+ICAL_FEED_MONTHS_BACK = config["server"].getint(
+    "ical_feed_months_back", fallback=3
+)
+ICAL_FEED_MONTHS_AHEAD = config["server"].getint(
+    "ical_feed_months_ahead", fallback=12
+)
+
+# If set, the iCal feeds are written to files in this directory,
+# see sp_app/ical_files.py
+ICAL_FEED_ROOT = config["server"].get("ical_feed_root", fallback="")
+
+# Report the number of SQL queries of each request in the header
+# X-Query-Count, see sp_app/middleware.py. Only for load tests.
+QUERY_COUNT_HEADER = config["server"].getboolean(
+    "query_count_header", fallback=False
+)
+
 SERVER_EMAIL = config["server"]["mail"]
 ADMINS = [("Admin Stationsplan", SERVER_EMAIL)]
 
@@ -188,6 +218,9 @@ MIDDLEWARE = (
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.security.SecurityMiddleware",
 )
+if QUERY_COUNT_HEADER:
+    # first, to count the queries of the other middleware too
+    MIDDLEWARE = ("sp_app.middleware.query_count_middleware",) + MIDDLEWARE
 
 ROOT_URLCONF = "stationsplan.urls"
 
@@ -37,6 +37,7 @@ urlpatterns = [
     #
     path("change_function", sp_ajax.change_function, name="change_function"),
     path("changes", sp_ajax.changes, name="changes"),
+    path("changes/batch", sp_ajax.change_batch, name="change-batch"),
     re_path(
         r"^changehistory/(?P<date>[0-9]+)/(?P<ward_id>[0-9]+)$",
         sp_ajax.get_change_history,
@@ -44,6 +45,21 @@ urlpatterns = [
     ),
     path("set_approved", sp_ajax.change_approved, name="set_approved"),
     re_path(r"^updates/([0-9]+)/?$", sp_ajax.updates, name="updates"),
+    re_path(
+        r"^plannings/(?P<month>[0-9]{6})/?$",
+        sp_ajax.plannings,
+        name="plannings",
+    ),
+    re_path(
+        r"^plannings/(?P<month>[0-9]{6})/(?P<version>[0-9a-f]+)$",
+        sp_ajax.plannings_chunk,
+        name="plannings-chunk",
+    ),
+    re_path(
+        r"^master_data/(?P<month>[0-9]{6})/(?P<version>[0-9a-f]+)$",
+        sp_ajax.master_data,
+        name="master-data",
+    ),
     path(
         "different_day/<str:action>/<int:ward>/<str:day_id>",
         sp_ajax.differentday,
@@ -86,6 +102,11 @@ urlpatterns = [
     # iCal -------------------------------------------------------------
     #
     path("feed/<str:feed_id>", ical_views.DienstFeed(), name="icalfeed"),
+    path(
+        "feed/wards/<str:feed_id>",
+        ical_views.WardsDienstFeed(),
+        name="wards-icalfeed",
+    ),
     #
     #
     # Administrators -----------------------------------------------------